@@ -6,6 +6,7 @@ from datetime import datetime
 import os
 from dotenv import load_dotenv
 
+from data.db.mongo import STORAGE_BACKEND
 from actions.api.models.models import UserInDB, Role, TokenData
 from actions.api.services.auth_service import AuthService
 
@@ -89,4 +90,12 @@ def same_user_or_admin(user_id: str):
                 detail="No tienes permisos para acceder a este recurso"
             )
         return current_user
-    return checker
\ No newline at end of file
+    return checker
+
+async def require_mongo():
+    """Para rutas que usan colecciones propias de MongoDB (GridFS, agregaciones, trabajos)"""
+    if STORAGE_BACKEND != "mongo":
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"No disponible con STORAGE_BACKEND={STORAGE_BACKEND}"
+        )
@@ -0,0 +1,68 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from actions.api.dependencies import get_current_admin
+from actions.api.log_pipeline import log_pipeline
+from actions.api.loop_monitor import PROFILE_MAX_SECONDS, PerfilEnCursoError, loop_monitor, profiler
+from actions.api.models.models import UserInDB
+from actions.api.services.ingest_spool import ingest_spool
+from actions.api.services.liveness_service import liveness_tracker
+from actions.api.services.result_cache import result_cache
+from actions.api.services.serializers import RawJSONResponse
+from data.db.query_monitor import query_monitor
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.get("/consultas-lentas")
+async def slow_queries(
+    limite: int = Query(20, ge=1, le=500),
+    current_user: UserInDB = Depends(get_current_admin)
+):
+    """Formas de consulta más costosas, su plan de ejecución e índices sugeridos"""
+    return RawJSONResponse(content=query_monitor.report(limite))
+
+@router.get("/spool")
+async def ingest_spool_status(current_user: UserInDB = Depends(get_current_admin)):
+    """Estado del spool local de ingesta: atraso, bytes, fsyncs y reproducción"""
+    if ingest_spool is None:
+        return {"activo": False}
+    return {"activo": True, **ingest_spool.report()}
+
+@router.get("/cache-resultados")
+async def result_cache_status(current_user: UserInDB = Depends(get_current_admin)):
+    """Aciertos, consultas compartidas, invalidaciones y memoria de la caché de resultados"""
+    return result_cache.report()
+
+@router.get("/sensores")
+async def sensor_liveness(current_user: UserInDB = Depends(get_current_admin)):
+    """Plantas seguidas, plazos programados en la rueda y sensores sin señal"""
+    return liveness_tracker.report()
+
+@router.get("/bucle")
+async def event_loop_lag(current_user: UserInDB = Depends(get_current_admin)):
+    """Lag del bucle de eventos y pilas de los últimos bloqueos detectados"""
+    return RawJSONResponse(content=loop_monitor.report())
+
+@router.get("/perfil", response_class=PlainTextResponse)
+async def sampling_profile(
+    segundos: float = Query(10, gt=0, le=PROFILE_MAX_SECONDS),
+    intervalo_ms: float = Query(5, ge=1, le=1000),
+    hilos: Literal["bucle", "todos"] = "bucle",
+    current_user: UserInDB = Depends(get_current_admin)
+):
+    """Perfilado por muestreo de este worker; pilas plegadas para flamegraph.pl o speedscope"""
+    try:
+        collapsed = await profiler.profile(segundos, intervalo_ms / 1000, all_threads=hilos == "todos")
+    except PerfilEnCursoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    return PlainTextResponse(collapsed)
+
+@router.get("/registro")
+async def log_pipeline_status(current_user: UserInDB = Depends(get_current_admin)):
+    """Registros encolados, descartados por cola llena, muestreados y limitados"""
+    return log_pipeline.report()
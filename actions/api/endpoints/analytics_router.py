@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from actions.api.dependencies import get_current_active_user
+from actions.api.services.analytics_service import analytics_service, AnalisisDemasiadoGrandeError
+from actions.api.services.serializers import RawJSONResponse
+from actions.api.models.models import AnaliticaRequest, Role, UserInDB
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+@router.post("/")
+async def analyze_readings(
+    request: AnaliticaRequest,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Medias, correlaciones y regresión lineal entre métricas"""
+    # Solo investigadores y administradores ejecutan análisis
+    if current_user.role not in [Role.INVES.value, Role.ADMIN.value]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos para ejecutar análisis"
+        )
+    if request.hasta <= request.desde:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Rango de fechas inválido"
+        )
+
+    try:
+        result = await analytics_service.analyze(
+            request.plantas, request.desde, request.hasta, request.metricas, request.objetivo
+        )
+    except AnalisisDemasiadoGrandeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    return RawJSONResponse(content=result)
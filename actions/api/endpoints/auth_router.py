@@ -5,13 +5,18 @@ from typing import Annotated
 
 from actions.api.services.auth_service import AuthService
 from actions.api.services.user_service import UserService
+from actions.api.services.rate_limiter import admission_control, auth_admission
 from actions.api.models.models import Token, UserCreate, UserOut
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 auth_service = AuthService()
 user_service = UserService()
 
-@router.post("/token", response_model=Token)
+@router.post(
+    "/token",
+    response_model=Token,
+    dependencies=[Depends(admission_control(auth_admission, by_ip=True))]
+)
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ):
@@ -47,18 +52,12 @@ async def login_for_access_token(
 
 @router.post("/register", response_model=UserOut)
 async def register_user(user: UserCreate):
-    existing_user = await user_service.get_full_user(user.username)
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El nombre de usuario ya está registrado"
-        )
-    
+    # El índice único de `username` resuelve la comprobación en la misma inserción
     created_user = await user_service.create_user(user)
     if not created_user:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error al crear el usuario"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El nombre de usuario ya está registrado"
         )
     
     return created_user
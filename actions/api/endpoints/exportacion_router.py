@@ -0,0 +1,112 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from actions.api.dependencies import get_current_active_user, require_mongo
+from actions.api.services.exportacion_service import (
+    EXPORT_CHUNK_BYTES, RangoNoSatisfacibleError, export_service, parse_range
+)
+from actions.api.models.models import ExportacionOut, ExportacionRequest, Role, UserInDB
+
+# Trabajos y archivos en MongoDB/GridFS
+router = APIRouter(prefix="/exports", tags=["exports"], dependencies=[Depends(require_mongo)])
+
+def _export_out(job: dict) -> ExportacionOut:
+    return ExportacionOut(**{k: v for k, v in job.items() if k != "_id"}, id=str(job["_id"]))
+
+async def _get_own_job(export_id: str, current_user: UserInDB) -> dict:
+    job = await export_service.get_job(export_id)
+    # Solo el autor o un administrador ven la exportación
+    if not job or (job["usuario_id"] != current_user.id and current_user.role != Role.ADMIN.value):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Exportación no encontrada"
+        )
+    return job
+
+@router.post("/", status_code=status.HTTP_202_ACCEPTED, response_model=ExportacionOut)
+async def create_export(
+    request: ExportacionRequest,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Encola la exportación; el archivo se genera en segundo plano"""
+    if request.hasta <= request.desde:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Rango de fechas inválido"
+        )
+    job = await export_service.submit(request.plantas, request.desde, request.hasta, request.formato, current_user.id)
+    out = _export_out(job)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=out.model_dump(mode="json"),
+        headers={"Location": f"/exports/{out.id}"}
+    )
+
+@router.get("/{export_id}", response_model=ExportacionOut)
+async def get_export(
+    export_id: str,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    return _export_out(await _get_own_job(export_id, current_user))
+
+@router.get("/{export_id}/archivo")
+async def download_export(
+    export_id: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Descarga del archivo con soporte de `Range` para reanudar"""
+    job = await _get_own_job(export_id, current_user)
+    if job["estado"] == "expirada":
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="La exportación ha caducado"
+        )
+    if job["estado"] != "completada":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="La exportación aún no está lista"
+        )
+
+    size = job["tamano"]
+    etag = f'"{job["archivo_id"]}"'
+    try:
+        # Con If-Range distinto se ignora el rango y se envía el archivo completo
+        span = parse_range(range, size) if if_range in (None, etag) else None
+    except RangoNoSatisfacibleError as e:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail=str(e),
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+    start, end = span or (0, size - 1)
+    grid_out = await export_service.open_file(job["archivo_id"])
+    grid_out.seek(start)
+
+    async def body():
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(EXPORT_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Length": str(end - start + 1),
+        "Content-Disposition": f'attachment; filename="{job["nombre"]}"'
+    }
+    if span:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        body(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT if span else status.HTTP_200_OK,
+        media_type=job["content_type"],
+        headers=headers
+    )
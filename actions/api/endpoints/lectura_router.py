@@ -1,28 +1,99 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+import orjson
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from datetime import datetime
+from typing import List, Literal, Optional, Union
 
 # from actions.api.services.auth_service import AuthService
-from actions.api.services.lectura_service import ReadingService
-from actions.api.models.models import LecturaOut, LecturaCreate, UserOut
+from actions.api.dependencies import get_current_active_user, require_mongo
+from actions.api.services.carga_service import (
+    BulkUploadService, CargaDemasiadoGrandeError, CargaEnCursoError, iter_gunzip
+)
+from actions.api.services.ingest_spool import SpoolLlenoError
+from actions.api.services.lectura_service import ReadingService, LecturaDuplicadaError, PlantaEnBorradoError
+from actions.api.services.rate_limiter import admission_control, readings_admission
+from actions.api.services.resample_service import ResampleService, naive_utc
+from actions.api.services.result_cache import result_cache
+from actions.api.services.serializers import ORJSON_OPTIONS, RawJSONResponse, fast_json_response, reading_serializer
+from actions.api.models.models import (
+    LecturaOut, LecturaCreate, LecturaBatchOut, LecturaDuplicadaOut, CargaOut, UserInDB, UserOut
+)
 
-router = APIRouter(prefix="/readings", tags=["readings"])
+router = APIRouter(
+    prefix="/readings",
+    tags=["readings"],
+    dependencies=[Depends(admission_control(readings_admission))]
+)
 # auth_service = AuthService()
 reading_service = ReadingService()
+resample_service = ResampleService()
+upload_service = BulkUploadService()
+
+async def _cached(key: tuple, plant_id: str, hasta: Optional[datetime], compute) -> bytes:
+    """Respuesta compartida entre peticiones idénticas; los ids inválidos no llegan a MongoDB"""
+    if not ObjectId.is_valid(plant_id):
+        return await compute()
+    return await result_cache.get_or_compute(key, plant_id, hasta, compute)
+
+# MongoDB no disponible y el spool local agotado: el gateway debe reintentar
+SPOOL_RETRY_AFTER = "30"
+
+def _spool_full() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Almacenamiento no disponible, intente más tarde",
+        headers={"Retry-After": SPOOL_RETRY_AFTER}
+    )
 
 @router.get("/plant/{plant_id}", response_model=List[LecturaOut])
 async def get_plant_readings(
     plant_id: str,
+    desde: Optional[datetime] = Query(None, description="Inicio del rango (incluido)"),
+    hasta: Optional[datetime] = Query(None, description="Fin del rango (excluido)"),
     # current_user: UserOut = Depends(auth_service.get_current_user)
 ):
-    readings = await reading_service.get_readings_by_plant(plant_id)
-    if not readings:
+    desde = naive_utc(desde) if desde else None
+    hasta = naive_utc(hasta) if hasta else None
+
+    async def history() -> bytes:
+        readings = await reading_service.get_readings_by_plant(plant_id, desde, hasta)
+        return fast_json_response(readings, reading_serializer).body
+
+    body = await _cached(("historial", plant_id, desde, hasta, "json"), plant_id, hasta, history)
+    if body == b"[]":
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No se encontraron lecturas para esta planta"
         )
-    return readings
+    return RawJSONResponse(content=body)
+
+@router.get("/plant/{plant_id}/resample")
+async def resample_plant_readings(
+    plant_id: str,
+    desde: datetime,
+    hasta: datetime,
+    paso: float = Query(60.0, gt=0, description="Tamaño de la celda en segundos"),
+    metodo: Literal["mean", "last", "linear"] = "mean",
+    max_hueco: Optional[float] = Query(None, ge=0, description="Hueco máximo a rellenar, en segundos")
+):
+    """Serie remuestreada en una rejilla regular con máscara de cobertura"""
+    desde, hasta = naive_utc(desde), naive_utc(hasta)
 
-@router.post("/", response_model=LecturaOut)
+    async def resample() -> bytes:
+        result = await resample_service.resample(plant_id, desde, hasta, paso, metodo, max_hueco)
+        return orjson.dumps(result, option=ORJSON_OPTIONS)
+
+    key = ("remuestreo", plant_id, desde, hasta, paso, metodo, max_hueco, "json")
+    try:
+        body = await _cached(key, plant_id, hasta, resample)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    return RawJSONResponse(content=body)
+
+@router.post("/", response_model=Union[LecturaOut, LecturaDuplicadaOut])
 async def create_reading(
     reading: LecturaCreate,
     # current_user: UserOut = Depends(auth_service.get_current_user)
@@ -35,10 +106,76 @@ async def create_reading(
     #         detail="No tienes permisos para crear lecturas"
     #     )
     
-    created_reading = await reading_service.create_reading(reading)
+    try:
+        created_reading = await reading_service.create_reading(reading)
+    except LecturaDuplicadaError as e:
+        # Reintento de un gateway: se confirma sin volver a insertar
+        return LecturaDuplicadaOut(dispositivo_id=e.dispositivo_id, secuencia=e.secuencia)
+    except PlantaEnBorradoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail=str(e)
+        )
+    except SpoolLlenoError:
+        raise _spool_full()
     if not created_reading:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al crear la lectura"
         )
-    return created_reading
\ No newline at end of file
+    return created_reading
+
+@router.post("/batch", response_model=LecturaBatchOut)
+async def create_readings_batch(readings: List[LecturaCreate]):
+    try:
+        return await reading_service.create_readings_batch(readings)
+    except SpoolLlenoError:
+        raise _spool_full()
+
+
+def _upload_out(upload: dict) -> CargaOut:
+    return CargaOut(**{k: v for k, v in upload.items() if k != "_id"}, id=upload["_id"])
+
+@router.post("/carga", response_model=CargaOut, dependencies=[Depends(require_mongo)])
+async def upload_history(
+    request: Request,
+    formato: Literal["csv", "ndjson"] = "ndjson",
+    planta_id: Optional[str] = Query(None, description="Planta para las filas que no la indiquen"),
+    carga_id: Optional[str] = Query(None, pattern=r"^[A-Za-z0-9_-]{1,64}$", description="Repetir el id reanuda la carga"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Carga histórica en streaming desde CSV o NDJSON conservando las fechas originales"""
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("identity", "gzip"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Encoding no soportado: {encoding}"
+        )
+    chunks = iter_gunzip(request.stream()) if encoding == "gzip" else request.stream()
+    try:
+        upload = await upload_service.upload(chunks, formato, planta_id, carga_id)
+    except CargaEnCursoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    except CargaDemasiadoGrandeError as e:
+        # Lo confirmado hasta aquí queda guardado; repetir el id reanuda la carga
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    return _upload_out(upload)
+
+@router.get("/carga/{carga_id}", response_model=CargaOut, dependencies=[Depends(require_mongo)])
+async def get_upload_progress(
+    carga_id: str,
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    upload = await upload_service.get_upload(carga_id)
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Carga no encontrada"
+        )
+    return _upload_out(upload)
@@ -1,19 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
 from typing import List
 
+from data.db.mongo import STORAGE_BACKEND
+from actions.api.dependencies import require_mongo
 from actions.api.services.auth_service import AuthService
+from actions.api.services.borrado_service import deletion_service
+from actions.api.services.liveness_service import liveness_tracker
 from actions.api.services.planta_service import PlantService
-from actions.api.models.models import PlantaOut, PlantaCreate, PlantaUpdate, UserOut
+from actions.api.services.resumen_service import SummaryService
+from actions.api.services.serializers import RawJSONResponse, fast_json_response, plant_serializer
+from actions.api.models.models import PlantaOut, PlantaCreate, PlantaUpdate, PlantaResumenOut, TrabajoBorradoOut, UserOut
 
 router = APIRouter(prefix="/plants", tags=["plants"])
 auth_service = AuthService()
 plant_service = PlantService()
+summary_service = SummaryService()
 
 @router.get("/", response_model=List[PlantaOut])
 async def list_plants(
     current_user: UserOut = Depends(auth_service.get_current_user)
 ):
-    return await plant_service.list_plants()
+    plants = await plant_service.list_plants()
+    return fast_json_response(plants, plant_serializer)
 
 @router.post("/", response_model=PlantaOut)
 async def create_plant(
@@ -35,6 +44,21 @@ async def create_plant(
         )
     return created_plant
 
+@router.get("/resumen", response_model=List[PlantaResumenOut], dependencies=[Depends(require_mongo)])
+async def fleet_overview(
+    current_user: UserOut = Depends(auth_service.get_current_user)
+):
+    """Todas las plantas con su última lectura y min/max/promedio de 24 h"""
+    overview = await summary_service.fleet_overview()
+    return RawJSONResponse(content=overview)
+
+@router.get("/sin-senal")
+async def silent_plants(
+    current_user: UserOut = Depends(auth_service.get_current_user)
+):
+    """Plantas cuyas sondas llevan más de N intervalos esperados sin enviar lecturas"""
+    return liveness_tracker.silent()
+
 @router.get("/{plant_id}", response_model=PlantaOut)
 async def get_plant(
     plant_id: str,
@@ -46,7 +70,7 @@ async def get_plant(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Planta no encontrada"
         )
-    return plant
+    return fast_json_response(plant, plant_serializer)
 
 @router.put("/{plant_id}", response_model=PlantaOut)
 async def update_plant(
@@ -81,9 +105,38 @@ async def delete_plant(
             detail="Solo los administradores pueden eliminar plantas"
         )
     
-    if not await plant_service.delete_plant(plant_id):
+    if STORAGE_BACKEND != "mongo":
+        if not await plant_service.delete_plant_and_readings(plant_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Planta no encontrada"
+            )
+        return {"message": "Planta eliminada"}
+
+    # Las lecturas se borran en segundo plano; la planta queda marcada mientras tanto
+    job = await deletion_service.request_plant_deletion(plant_id)
+    if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Planta no encontrada"
         )
-    return {"message": "Planta eliminada correctamente"}
\ No newline at end of file
+    job_id = str(job["_id"])
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"message": "Borrado de la planta en curso", "trabajo_id": job_id, "estado": job["estado"]},
+        headers={"Location": f"/plants/borrados/{job_id}"}
+    )
+
+@router.get("/borrados/{job_id}", response_model=TrabajoBorradoOut, dependencies=[Depends(require_mongo)])
+async def get_deletion_job(
+    job_id: str,
+    current_user: UserOut = Depends(auth_service.get_current_user)
+):
+    """Estado de un trabajo de borrado en cascada"""
+    job = await deletion_service.get_job(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo de borrado no encontrado"
+        )
+    return TrabajoBorradoOut(**{k: v for k, v in job.items() if k != "_id"}, id=str(job["_id"]))
\ No newline at end of file
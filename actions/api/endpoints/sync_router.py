@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from typing import List, Optional
+
+import orjson
+
+from actions.api.dependencies import get_current_active_user, require_mongo
+from actions.api.services.sync_service import SyncService, TokenInvalidoError
+from actions.api.services.serializers import ORJSON_OPTIONS, RawJSONResponse, compress_body
+from actions.api.models.models import UserInDB
+
+router = APIRouter(prefix="/sync", tags=["sync"], dependencies=[Depends(require_mongo)])
+sync_service = SyncService()
+
+@router.get("/")
+async def sync_changes(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="Token de continuación; vacío para sincronizar desde el inicio"),
+    limite: int = Query(1000, ge=1, le=5000),
+    plantas: Optional[List[str]] = Query(None),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Lecturas y cambios de plantas desde el token dado, comprimidos"""
+    try:
+        changes = await sync_service.changes_since(cursor, limite, plantas)
+    except TokenInvalidoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    body, encoding = compress_body(
+        orjson.dumps(changes, option=ORJSON_OPTIONS),
+        request.headers.get("accept-encoding")
+    )
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return RawJSONResponse(content=body, headers=headers)
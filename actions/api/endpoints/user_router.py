@@ -3,6 +3,7 @@ from typing import List
 
 from actions.api.services.auth_service import AuthService
 from actions.api.services.user_service import UserService
+from actions.api.services.serializers import fast_json_response, user_serializer
 from actions.api.models.models import UserOut, UserUpdate
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -13,7 +14,8 @@ user_service = UserService()
 async def list_users(
     #current_user: UserOut = Depends(auth_service.get_current_user)
 ):
-    return await user_service.list_users()
+    users = await user_service.list_users()
+    return fast_json_response(users, user_serializer)
 
 @router.get("/{user_id}", response_model=UserOut)
 async def get_user(
@@ -26,7 +28,7 @@ async def get_user(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
         )
-    return user
+    return fast_json_response(user, user_serializer)
 
 @router.put("/{user_id}", response_model=UserOut)
 async def update_user_data(
@@ -1,70 +1,135 @@
 # actions/api/routes/websocket_routes.py
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from actions.api.services.auth_service import AuthService
 from actions.api.services.socket_manager import socket_manager
+from actions.api.services.subscriptions import METRICS
+from actions.api.log_pipeline import bind_log_context, log_context
 from jose import JWTError, jwt
 import json
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
+auth_service = AuthService()
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 
 from fastapi import WebSocket, WebSocketDisconnect, status
 import json
 
+MAX_PLANTS_PER_SUBSCRIPTION = int(os.getenv("WS_MAX_PLANTS_PER_SUBSCRIPTION", "500"))
+
+async def handle_subscription_message(websocket: WebSocket, connection, message: dict):
+    """Procesa los mensajes subscribe/unsubscribe de un cliente"""
+    key = str(message.get("id", "default"))
+
+    if message["type"] == "unsubscribe":
+        removed = socket_manager.unsubscribe(connection, key)
+        await websocket.send_json({"type": "unsubscribed", "id": key, "ok": removed})
+        return
+
+    plants = message.get("plantas")
+    metrics = message.get("metricas")
+    rate = message.get("max_por_segundo")
+    error = None
+    if not isinstance(plants, list) or not plants or not all(isinstance(p, str) for p in plants):
+        error = "Se requiere una lista de plantas"
+    elif len(plants) > MAX_PLANTS_PER_SUBSCRIPTION:
+        error = f"Máximo {MAX_PLANTS_PER_SUBSCRIPTION} plantas por suscripción"
+    elif metrics is not None and (not isinstance(metrics, list) or not set(metrics) <= METRICS):
+        error = f"Métricas válidas: {sorted(METRICS)}"
+    elif rate is not None and (not isinstance(rate, (int, float)) or rate < 0):
+        error = "max_por_segundo debe ser un número positivo"
+
+    if error:
+        await websocket.send_json({"type": "error", "id": key, "message": error})
+        return
+
+    socket_manager.subscribe(connection, key, plants, metrics, rate)
+    await websocket.send_json({"type": "subscribed", "id": key})
+
 @router.websocket("/ws/solicitudes/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    print(f"[SOCKET] Intentando conectar con user_id: {user_id}")
+    log_token = bind_log_context(usuario=user_id)
+    logger.info("Conexión WebSocket solicitada")
 
     await websocket.accept()  # 👈 MUY IMPORTANTE
+    connection = None
 
     try:
         # Espera primer mensaje de autenticación
         msg = await websocket.receive_text()
-        print("[SOCKET] Mensaje recibido:", msg)
+        # El mensaje lleva el token: solo se registra su tamaño
+        logger.debug("Mensaje de autenticación recibido", extra={"bytes": len(msg)})
 
         data = json.loads(msg)
 
         # Validación del tipo de mensaje
         if data.get("type") != "auth":
-            print("[SOCKET] Tipo inválido:", data.get("type"))
+            logger.warning("Tipo de mensaje inválido", extra={"tipo": data.get("type")})
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
         # Validación del token
         token = data.get("token")
         if not token:
-            print("[SOCKET] Token no proporcionado")
+            logger.warning("Token no proporcionado")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+        # El canal personal solo es del titular del token (por id o nombre de usuario)
+        user = await auth_service.get_current_user(token)
+        if user is None or user.disabled or user_id not in (user.id, user.username):
+            logger.warning("Token inválido o de otro usuario")
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
         # Validación de grupos (si no hay, asigna por defecto)
         groups = data.get("groups", ["solicitudes"])
 
-        print(f"[SOCKET] Token recibido, grupos: {groups}")
-
         # Lógica para guardar conexión
-        await socket_manager.connect(websocket, user_id, groups)
+        connection = await socket_manager.connect(websocket, user_id, groups)
+        bind_log_context(conexion=connection.id)
 
         # Opcional: responder al cliente que autenticó bien
-        await websocket.send_json({"type": "auth_ok", "message": "Conexión autenticada correctamente"})
+        await websocket.send_json({
+            "type": "auth_ok",
+            "message": "Conexión autenticada correctamente",
+            "epoca": socket_manager.outbox.epoch,
+            "secuencias": socket_manager.sequences(connection)
+        })
+
+        # Reconexión: el cliente envía su época y la última secuencia vista de cada canal
+        last_seqs = data.get("ultimos")
+        if isinstance(last_seqs, dict):
+            await socket_manager.resume(connection, last_seqs, data.get("epoca"))
 
         # Bucle para recibir otros mensajes (si tu app los usa)
         while True:
             msg = await websocket.receive_text()
-            print(f"[SOCKET] Mensaje recibido de {user_id}: {msg}")
+            # Cualquier mensaje (incluido el "pong") mantiene viva la conexión
+            connection.touch()
+            try:
+                message = json.loads(msg)
+            except ValueError:
+                message = None
+            if isinstance(message, dict) and message.get("type") == "pong":
+                continue
+            if isinstance(message, dict) and message.get("type") in ("subscribe", "unsubscribe"):
+                await handle_subscription_message(websocket, connection, message)
+                continue
+            logger.debug("Mensaje no reconocido", extra={"bytes": len(msg)})
 
     except WebSocketDisconnect:
-        print(f"[SOCKET] Cliente desconectado: {user_id}")
-        await socket_manager.disconnect(user_id)
+        logger.info("Cliente desconectado")
 
-    except Exception as e:
-        print(f"[SOCKET] Error inesperado: {e}")
+    except Exception:
+        logger.exception("Error inesperado en la conexión WebSocket")
         await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
 
-import logging
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-logger.info("Esto sí se debería ver en cualquier entorno")
\ No newline at end of file
+    finally:
+        if connection is not None:
+            socket_manager.disconnect(connection)
+        log_context.reset(log_token)
@@ -0,0 +1,217 @@
+"""Registro estructurado que no bloquea el bucle de eventos.
+
+Los registros no se escriben en el hilo que los emite: `BoundedQueueHandler`
+les añade el contexto (petición, conexión, traza), congela el mensaje y los
+deja en una cola acotada; un hilo de fondo (`QueueListener`) los convierte
+en una línea JSON y los escribe en stdout. Si la cola se llena el registro
+se descarta y se cuenta, nunca se espera.
+
+Antes de encolar se aplica la política del logger (o de su ancestro más
+cercano) configurada en LOG_POLICIES como `logger=muestreo/por_segundo`
+separados por comas, p. ej.
+`actions.api.endpoints.websocket_routes=0.1/50`: el muestreo solo afecta a
+DEBUG e INFO y el límite por segundo a todos los niveles, para que una
+ráfaga de errores repetidos tampoco inunde la salida.
+"""
+import atexit
+import contextvars
+import copy
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueListener
+from typing import Dict, Optional, Tuple
+
+import orjson
+
+from actions.api.tracing import current_trace
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_POLICIES = os.getenv("LOG_POLICIES", "")
+
+# Por defecto los logs por conexión y por mensaje de WebSocket se limitan
+DEFAULT_POLICIES = {
+    "actions.api.endpoints.websocket_routes": (1.0, 200.0),
+    "actions.api.services.socket_manager": (1.0, 200.0),
+}
+
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Campos de contexto (peticion, conexion, usuario...) de la tarea actual
+log_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("log_context", default=None)
+
+# Atributos propios de LogRecord: el resto llega por `extra=` y se publica
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "contexto"}
+
+
+def bind_log_context(**fields) -> contextvars.Token:
+    """Añade campos al contexto de registro de la tarea actual; devuelve el token para `reset`"""
+    return log_context.set({**(log_context.get() or {}), **fields})
+
+
+def parse_policies(value: str) -> Dict[str, Tuple[float, Optional[float]]]:
+    policies = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rule = item.partition("=")
+        sample, _, per_second = rule.partition("/")
+        policies[name.strip()] = (float(sample or 1), float(per_second) if per_second else None)
+    return policies
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        # Con menos de un registro por segundo la capacidad debe admitir al menos uno
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro con el contexto y los campos de `extra=`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "fecha": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+            **(getattr(record, "contexto", None) or {}),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_text:
+            entry["excepcion"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class BoundedQueueHandler(logging.Handler):
+    """Encola sin bloquear; aplica muestreo y límite por logger y cuenta lo descartado"""
+
+    def __init__(self, log_queue: queue.Queue, policies: Dict[str, Tuple[float, Optional[float]]]):
+        super().__init__()
+        self.queue = log_queue
+        self.policies = policies
+        self._resolved: Dict[str, Optional[Tuple[float, Optional[_TokenBucket]]]] = {}
+        self._bucket_lock = threading.Lock()
+        self.stats = {"encolados": 0, "descartados": 0, "muestreados": 0, "limitados": 0}
+
+    def _policy(self, name: str):
+        policy = self._resolved.get(name, False)
+        if policy is not False:
+            return policy
+        policy, prefix = None, name
+        while prefix:
+            if prefix in self.policies:
+                sample, per_second = self.policies[prefix]
+                policy = (sample, _TokenBucket(per_second) if per_second else None)
+                break
+            prefix = prefix.rpartition(".")[0]
+        self._resolved[name] = policy
+        return policy
+
+    def _admit(self, record: logging.LogRecord) -> bool:
+        policy = self._policy(record.name)
+        if policy is None:
+            return True
+        sample, bucket = policy
+        if sample < 1 and record.levelno < logging.WARNING and random.random() >= sample:
+            self.stats["muestreados"] += 1
+            return False
+        if bucket is not None:
+            with self._bucket_lock:
+                allowed = bucket.take()
+            if not allowed:
+                self.stats["limitados"] += 1
+                return False
+        return True
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Copia: otros handlers (p. ej. los de pytest) comparten el registro original
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        context = dict(log_context.get() or {})
+        trace = current_trace.get()
+        if trace is not None:
+            context.setdefault("traza", trace.trace_id)
+        record.contexto = context
+        return record
+
+    def emit(self, record: logging.LogRecord):
+        if not self._admit(record):
+            return
+        try:
+            self.queue.put_nowait(self.prepare(record))
+            self.stats["encolados"] += 1
+        except queue.Full:
+            self.stats["descartados"] += 1
+        except Exception:
+            self.handleError(record)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Con la cola llena put_nowait fallaría: el hilo la está vaciando
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    def __init__(self, queue_size: int = LOG_QUEUE_SIZE, policies: Optional[dict] = None):
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.handler = BoundedQueueHandler(self.queue, {**DEFAULT_POLICIES, **(policies or {})})
+        self.listener: Optional[QueueListener] = None
+
+    def install(self, level: str = LOG_LEVEL, stream=None):
+        """Sustituye los handlers del logger raíz por la cola; es idempotente"""
+        if self.listener is not None:
+            return
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        self.listener = _Listener(self.queue, output, respect_handler_level=True)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(level)
+        # Los logs de uvicorn (incluido el de acceso) también pasan por la cola
+        for name in UVICORN_LOGGERS:
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers.clear()
+            uvicorn_logger.propagate = True
+        self.listener.start()
+        # Lo que quede en la cola se escribe al salir
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.listener is not None:
+            logging.getLogger().removeHandler(self.handler)
+            self.listener.stop()
+            self.listener = None
+
+    def report(self) -> dict:
+        return {"en_cola": self.queue.qsize(), "capacidad": self.queue.maxsize, **self.handler.stats}
+
+
+log_pipeline = LogPipeline(policies=parse_policies(LOG_POLICIES))
@@ -0,0 +1,230 @@
+"""Vigilancia del bucle de eventos y perfilador por muestreo bajo demanda.
+
+`LoopLagMonitor` mide sin parar el retraso con que el bucle atiende un
+temporizador (lag de planificación). Un hilo vigilante comprueba el último
+latido: si el bucle lleva más de LOOP_LAG_THRESHOLD_MS sin volver, lo que
+se está ejecutando en él es lo que bloquea, así que toma su pila con
+`sys._current_frames()` en ese momento (bcrypt, `print`, construcción de
+listas enormes...) y la registra. Cuando el bucle se libera el sondeo anota
+cuánto duró el bloqueo. La pila completa de un mismo punto de bloqueo se
+escribe en el log como mucho una vez cada LOOP_STALL_LOG_INTERVAL_SECONDS
+(un bcrypt por login no inunda el log); las repeticiones se cuentan y
+siguen en el historial. Está desactivado salvo con LOOP_MONITOR=1.
+
+`SamplingProfiler` toma muestras de las pilas durante N segundos desde un
+hilo aparte, sin reiniciar el proceso, y devuelve pilas plegadas
+(`marco;marco;marco cuenta`) que aceptan flamegraph.pl y speedscope.
+Al muestrear desde el propio proceso, cada muestra espera a que el hilo
+observado suelte el GIL (en E/S o cada `sys.getswitchinterval()`): los
+tramos de CPU de pocos milisegundos quedan infrarrepresentados, los
+bloqueos largos no.
+"""
+import asyncio
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from typing import Deque, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "0") == "1"
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "50"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+LOOP_LAG_HISTORY = int(os.getenv("LOOP_LAG_HISTORY", "50"))
+LOOP_STALL_LOG_INTERVAL_SECONDS = float(os.getenv("LOOP_STALL_LOG_INTERVAL_SECONDS", "300"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+STACK_DEPTH = 40
+
+# Prefijos que se recortan de las rutas para que los marcos sean legibles
+_PATH_PREFIXES = sorted(
+    {os.getcwd(), sysconfig.get_paths()["purelib"], sysconfig.get_paths()["stdlib"]},
+    key=len, reverse=True
+)
+
+
+def _short_path(filename: str) -> str:
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix):].lstrip(os.sep)
+    return filename
+
+
+def format_stack(frame) -> List[str]:
+    """Pila desde la raíz hasta el marco en ejecución, una línea por marco"""
+    return [
+        f"{_short_path(entry.filename)}:{entry.lineno} {entry.name}"
+        for entry in traceback.extract_stack(frame, limit=STACK_DEPTH)
+    ]
+
+
+def _collapsed_frames(frame) -> List[str]:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+class LoopLagMonitor:
+    def __init__(self, interval_ms: float = LOOP_LAG_INTERVAL_MS,
+                 threshold_ms: float = LOOP_LAG_THRESHOLD_MS, history: int = LOOP_LAG_HISTORY,
+                 log_interval: float = LOOP_STALL_LOG_INTERVAL_SECONDS):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.log_interval = log_interval
+        # pila -> instante en que se escribió completa por última vez
+        self._logged: "OrderedDict[Tuple[str, ...], float]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._beat = 0.0
+        self._captured_beat = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lags: Deque[float] = deque(maxlen=1200)
+        self._open_stall: Optional[dict] = None
+        self.stalls: Deque[dict] = deque(maxlen=history)
+        self.stats = {"muestras": 0, "lentas": 0, "bloqueos_capturados": 0, "bloqueos_repetidos": 0, "lag_max_ms": 0.0}
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, loop.time() - expected))
+
+    def _record(self, lag: float):
+        lag_ms = lag * 1000
+        self._lags.append(lag_ms)
+        self.stats["muestras"] += 1
+        self.stats["lag_max_ms"] = max(self.stats["lag_max_ms"], lag_ms)
+        if lag >= self.threshold:
+            self.stats["lentas"] += 1
+        stall, self._open_stall = self._open_stall, None
+        if stall is not None:
+            stall["lag_ms"] = round(lag_ms, 1)
+            self._log_stall(stall, lag_ms)
+
+    def _log_stall(self, stall: dict, lag_ms: float):
+        key = tuple(stall["pila"])
+        now = time.monotonic()
+        last = self._logged.get(key)
+        if last is not None and now - last < self.log_interval:
+            self.stats["bloqueos_repetidos"] += 1
+            logger.debug("Bucle de eventos bloqueado %.0f ms en %s (pila ya registrada)", lag_ms, key[-1])
+            return
+        self._logged[key] = now
+        self._logged.move_to_end(key)
+        if len(self._logged) > self.stalls.maxlen:
+            self._logged.popitem(last=False)
+        logger.warning(
+            "Bucle de eventos bloqueado %.0f ms en la tarea %s:\n%s",
+            lag_ms, stall["tarea"], "\n".join(stall["pila"])
+        )
+
+    def _capture(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        stall = {
+            "fecha": datetime.utcnow().isoformat(),
+            "tarea": task.get_name() if task is not None else None,
+            "lag_ms": None,
+            "pila": format_stack(frame)
+        }
+        self.stalls.append(stall)
+        self._open_stall = stall
+        self.stats["bloqueos_capturados"] += 1
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            # Una sola captura por bloqueo: la del latido que no volvió
+            if beat != self._captured_beat and time.monotonic() - beat > self.interval + self.threshold:
+                self._captured_beat = beat
+                self._capture()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="vigilante-bucle", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.to_thread(self._watchdog.join)
+        self._task = self._watchdog = None
+
+    def report(self) -> dict:
+        lags = sorted(self._lags)
+        return {
+            "intervalo_ms": self.interval * 1000,
+            "umbral_ms": self.threshold * 1000,
+            "lag_p50_ms": round(lags[len(lags) // 2], 1) if lags else None,
+            "lag_p99_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 1) if lags else None,
+            **self.stats,
+            "bloqueos": list(self.stalls)
+        }
+
+
+class PerfilEnCursoError(Exception):
+    """Ya hay un perfilado ejecutándose en este proceso"""
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._busy = threading.Lock()
+
+    @staticmethod
+    def _sample(seconds: float, interval: float, threads: Optional[Set[int]]) -> Counter:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or (threads is not None and thread_id not in threads):
+                    continue
+                frames = _collapsed_frames(frame)
+                if threads is None:
+                    frames.insert(0, f"hilo {names.get(thread_id, thread_id)}")
+                counts[";".join(frames)] += 1
+            time.sleep(interval)
+        return counts
+
+    async def profile(self, seconds: float, interval: float = 0.005, all_threads: bool = False) -> str:
+        """Pilas plegadas de `seconds` de muestreo (del hilo del bucle o de todos)"""
+        if not self._busy.acquire(blocking=False):
+            raise PerfilEnCursoError("Ya hay un perfilado en curso")
+        try:
+            threads = None if all_threads else {threading.get_ident()}
+            counts = await asyncio.to_thread(self._sample, seconds, interval, threads)
+        finally:
+            self._busy.release()
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+loop_monitor = LoopLagMonitor()
+profiler = SamplingProfiler()
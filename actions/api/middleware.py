@@ -0,0 +1,39 @@
+import uuid
+
+from actions.api.log_pipeline import bind_log_context, log_context
+from data.db.query_monitor import current_request_scope
+
+
+class RequestContextMiddleware:
+    """Publica el ámbito ASGI de la petición para el registro de consultas lentas.
+
+    El enrutador completa `scope["route"]` después de este punto, así que el
+    monitor lee la plantilla de la ruta al terminar cada comando. También fija
+    el identificador de la petición (el `X-Request-ID` recibido o uno nuevo)
+    en el contexto de registro y lo devuelve en la respuesta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        token = current_request_scope.set(scope)
+        log_token = bind_log_context(peticion=request_id)
+        try:
+            await self.app(scope, receive, send_with_id if scope["type"] == "http" else send)
+        finally:
+            log_context.reset(log_token)
+            current_request_scope.reset(token)
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from bson import ObjectId
 from enum import Enum
 
@@ -24,6 +24,7 @@ class UserInDB(UserBase):
     id: str
     role: Role
     hashed_password: str
+    disabled: bool = False
     
     class Config:
         from_attributes = True
@@ -58,6 +59,41 @@ class TokenData(BaseModel):
     username: Optional[str] = None
     role: Optional[Role] = None
 
+""" MODELOS PARA LA PLANTA """
+class PlantaBase(BaseModel):
+    nombre: str
+    especie: Optional[str] = None
+    ubicacion: Optional[str] = None
+    descripcion: Optional[str] = None
+    # Segundos esperados entre lecturas (detección de sensores sin señal)
+    intervalo_lecturas: Optional[float] = Field(default=None, gt=0)
+
+class PlantaCreate(PlantaBase):
+    pass
+
+class PlantaUpdate(BaseModel):
+    nombre: Optional[str] = None
+    especie: Optional[str] = None
+    ubicacion: Optional[str] = None
+    descripcion: Optional[str] = None
+    intervalo_lecturas: Optional[float] = Field(default=None, gt=0)
+
+class PlantaOut(PlantaBase):
+    id: str
+    creado_en: Optional[datetime] = None
+    ultima_lectura: Optional[datetime] = None
+    pendiente_borrado: bool = False
+
+class TrabajoBorradoOut(BaseModel):
+    id: str
+    tipo: str
+    objetivo_id: str
+    estado: str
+    borradas: int = 0
+    error: Optional[str] = None
+    creado_en: datetime
+    actualizado_en: datetime
+
 """ MODELOS PARA LA LECTURA """
 class LecturaBase(BaseModel):
     humedad: float
@@ -70,8 +106,16 @@ class LecturaBase(BaseModel):
     fecha: datetime = Field(default_factory=datetime.utcnow)
     notas: Optional[str] = None
 
+# Campos numéricos de una lectura (en el orden del modelo)
+LECTURA_METRICS = tuple(
+    name for name in LecturaBase.model_fields if name not in ("fecha", "notas")
+)
+
 class LecturaCreate(LecturaBase):
         planta_id: Optional[str] = None  # ← Agregado
+        # Idempotencia: los gateways envían su ID y un número de secuencia monótono
+        dispositivo_id: Optional[str] = None
+        secuencia: Optional[int] = Field(default=None, ge=0)
 
 class LecturaInDB(LecturaBase):
     id: str
@@ -91,4 +135,102 @@ class LecturaUpdate(BaseModel):
 
 class LecturaList(BaseModel):
     lecturas: List[LecturaOut]
-    count: int
\ No newline at end of file
+    count: int
+
+class LecturaDuplicadaOut(BaseModel):
+    # Confirmación de un reintento ya almacenado: no se devuelve la lectura original
+    duplicada: bool = True
+    dispositivo_id: str
+    secuencia: int
+
+class LecturaBatchOut(BaseModel):
+    insertadas: int
+    duplicadas: int
+    rechazadas: int = 0
+
+""" MODELOS PARA CARGA HISTÓRICA """
+class LecturaHistorica(LecturaCreate):
+    # En la carga histórica la fecha es la del registrador y la planta es obligatoria
+    fecha: datetime
+    planta_id: str
+
+    @validator("fecha")
+    def fecha_utc(cls, value):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+class CargaOut(BaseModel):
+    id: str
+    formato: str
+    planta_id: Optional[str] = None
+    estado: str
+    filas_leidas: int = 0
+    filas_confirmadas: int = 0
+    insertadas: int = 0
+    duplicadas: int = 0
+    rechazadas: int = 0
+    errores: List[Dict[str, Any]] = []
+    creado_en: datetime
+    actualizado_en: datetime
+
+""" MODELOS PARA EXPORTACIONES """
+class ExportacionRequest(BaseModel):
+    plantas: List[str] = Field(..., min_length=1)
+    desde: datetime
+    hasta: datetime
+    formato: Literal["csv", "ndjson", "columnar"] = "csv"
+
+class ExportacionOut(BaseModel):
+    id: str
+    plantas: List[str]
+    desde: datetime
+    hasta: datetime
+    formato: str
+    estado: str
+    filas: int = 0
+    progreso: float = 0.0
+    tamano: Optional[int] = None
+    expira_en: Optional[datetime] = None
+    error: Optional[str] = None
+    creado_en: datetime
+    actualizado_en: datetime
+
+""" MODELOS PARA ANALÍTICA """
+class AnaliticaRequest(BaseModel):
+    plantas: List[str] = Field(..., min_length=1)
+    desde: datetime
+    hasta: datetime
+    metricas: List[str] = Field(default_factory=lambda: list(LECTURA_METRICS), min_length=2)
+    objetivo: Optional[str] = None
+
+    @validator("metricas")
+    def validar_metricas(cls, value):
+        invalid = set(value) - set(LECTURA_METRICS)
+        if invalid:
+            raise ValueError(f"Métricas desconocidas: {sorted(invalid)}")
+        return list(dict.fromkeys(value))
+
+    @validator("objetivo")
+    def validar_objetivo(cls, value, values):
+        if value is not None and value not in values.get("metricas", []):
+            raise ValueError("El objetivo debe estar entre las métricas")
+        return value
+
+""" MODELOS PARA EL RESUMEN DE LA FLOTA """
+class MetricaResumen(BaseModel):
+    min: float
+    max: float
+    promedio: float
+
+class VentanaResumen(BaseModel):
+    lecturas: int
+    metricas: Dict[str, MetricaResumen]
+
+class PlantaResumenOut(BaseModel):
+    id: str
+    nombre: Optional[str] = None
+    especie: Optional[str] = None
+    ubicacion: Optional[str] = None
+    ultima_lectura: Optional[Dict[str, Any]] = None
+    ventana_24h: VentanaResumen
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from actions.api.services.ingest_watermark import ingest_watermarks
+from actions.api.services.lectura_service import ReadingService
+from actions.api.services.resample_service import naive_utc
+
+MAX_ANALYTICS_JOBS = int(os.getenv("MAX_ANALYTICS_JOBS", "2"))
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "2"))
+ANALYTICS_MAX_ROWS = int(os.getenv("ANALYTICS_MAX_ROWS", "5000000"))
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "128"))
+# Las marcas de ingesta solo ven las escrituras de este proceso: lo que escriban
+# otros procesos (varios workers, cargas externas) aparece como mucho tras este plazo
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+
+
+class AnalisisDemasiadoGrandeError(ValueError):
+    pass
+
+
+def compute_statistics(matrix: np.ndarray, metrics: Sequence[str], target: Optional[str]) -> dict:
+    """Estadísticos vectorizados sobre las filas completas (se ejecuta en otro proceso)"""
+    complete = matrix[~np.isnan(matrix).any(axis=1)]
+    n = len(complete)
+    result = {"n": n, "metricas": list(metrics)}
+    if n < 2:
+        result.update({"media": None, "desviacion": None, "correlacion": None, "regresion": None})
+        return result
+
+    mean = complete.mean(axis=0)
+    std = complete.std(axis=0, ddof=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = np.corrcoef(complete, rowvar=False)
+    result.update({
+        "media": dict(zip(metrics, mean.tolist())),
+        "desviacion": dict(zip(metrics, std.tolist())),
+        "correlacion": [[None if np.isnan(v) else v for v in row] for row in np.atleast_2d(correlation).tolist()],
+        "regresion": None
+    })
+
+    if target is not None:
+        target_index = list(metrics).index(target)
+        predictors = [i for i in range(len(metrics)) if i != target_index]
+        y = complete[:, target_index]
+        X = np.column_stack([np.ones(n), complete[:, predictors]])
+        coefficients, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+        residual = y - X @ coefficients
+        total = ((y - y.mean()) ** 2).sum()
+        result["regresion"] = {
+            "objetivo": target,
+            "intercepto": float(coefficients[0]),
+            "coeficientes": {metrics[i]: float(c) for i, c in zip(predictors, coefficients[1:])},
+            "r2": float(1 - (residual ** 2).sum() / total) if total else None
+        }
+    return result
+
+
+class AnalyticsService:
+    """Estadísticas entre métricas calculadas fuera del event loop.
+
+    Las columnas se cargan en arrays NumPy y el cálculo corre en un
+    `ProcessPoolExecutor` con un número máximo de trabajos simultáneos. Los
+    resultados se cachean por (plantas, rango, métricas, objetivo) y se
+    invalidan con la marca de ingesta de cada planta o, como tarde, a los
+    `cache_ttl` segundos (la marca es del proceso y no ve otros workers).
+    """
+
+    def __init__(
+        self,
+        max_jobs: int = MAX_ANALYTICS_JOBS,
+        cache_ttl: float = ANALYTICS_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.reading_service = ReadingService()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs = asyncio.Semaphore(max_jobs)
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        # clave -> (marcas, caducidad, resultado)
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=ANALYTICS_WORKERS)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _load_matrix(self, plant_ids: List[str], start: datetime, end: datetime, metrics: Sequence[str]) -> np.ndarray:
+        blocks, rows = [], 0
+        for plant_id in plant_ids:
+            async for _, values in self.reading_service.iter_reading_columns(plant_id, start, end, metrics):
+                rows += len(values)
+                if rows > ANALYTICS_MAX_ROWS:
+                    raise AnalisisDemasiadoGrandeError(
+                        f"El análisis supera {ANALYTICS_MAX_ROWS} lecturas; reduzca el rango o las plantas"
+                    )
+                blocks.append(values)
+        if not blocks:
+            return np.empty((0, len(metrics)))
+        return np.concatenate(blocks)
+
+    async def analyze(
+        self,
+        plant_ids: List[str],
+        start: datetime,
+        end: datetime,
+        metrics: Sequence[str],
+        target: Optional[str] = None
+    ) -> dict:
+        plant_ids = sorted(set(plant_ids))
+        start, end = naive_utc(start), naive_utc(end)
+        key = (tuple(plant_ids), start, end, tuple(metrics), target)
+        marks = ingest_watermarks.snapshot(plant_ids)
+
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == marks and self.clock() < cached[1]:
+            self._cache.move_to_end(key)
+            return cached[2]
+
+        async with self._jobs:
+            matrix = await self._load_matrix(plant_ids, start, end, metrics)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._get_executor(), compute_statistics, matrix, list(metrics), target
+            )
+
+        self._cache[key] = (marks, self.clock() + self.cache_ttl, result)
+        self._cache.move_to_end(key)
+        if len(self._cache) > ANALYTICS_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+
+analytics_service = AnalyticsService()
@@ -4,18 +4,21 @@ from passlib.context import CryptContext
 import os
 from dotenv import load_dotenv
 from typing import Optional
-from data.db.mongo import db
+from data.db.repositories import user_repository
+from data.db.query_monitor import monitored_service
 from actions.api.models.models import UserInDB, TokenData
+from actions.api.tracing import span
 
 load_dotenv()
 
+@monitored_service
 class AuthService:
     def __init__(self):
         self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
         self.SECRET_KEY = os.getenv("SECRET_KEY")
         self.ALGORITHM = "HS256"
         self.ACCESS_TOKEN_EXPIRE_MINUTES = 30
-        self.users_collection = db["users"]
+        self.users = user_repository
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         return self.pwd_context.verify(plain_password, hashed_password)
@@ -24,7 +27,7 @@ class AuthService:
         return self.pwd_context.hash(password)
 
     async def authenticate_user(self, username: str, password: str) -> Optional[UserInDB]:
-        user = await self.users_collection.find_one({"username": username})
+        user = await self.users.find_by_username(username)
         if not user or not self.verify_password(password, user["hashed_password"]):
             return None
         return UserInDB(**user, id=str(user["_id"]))
@@ -40,7 +43,8 @@ class AuthService:
 
     async def get_current_user(self, token: str) -> Optional[UserInDB]:
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            with span("auth.jwt"):
+                payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             username: str = payload.get("sub")
             if username is None:
                 return None
@@ -48,7 +52,8 @@ class AuthService:
         except JWTError:
             return None
         
-        user = await self.users_collection.find_one({"username": token_data.username})
+        user = await self.users.find_by_username(token_data.username)
         if not user:
             return None
-        return UserInDB(**user, id=str(user["_id"]))
\ No newline at end of file
+        with span("auth.validacion"):
+            return UserInDB(**user, id=str(user["_id"]))
\ No newline at end of file
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from data.db.mongo import db
+from data.db.query_monitor import monitored_service
+from actions.api.services.column_cache import column_cache
+from actions.api.services.ingest_watermark import ingest_watermarks
+from actions.api.services.liveness_service import liveness_tracker
+from actions.api.services.planta_service import PlantService
+from actions.api.services.sync_service import TOMBSTONES_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+BORRADO_DELETES_PER_SECOND = float(os.getenv("BORRADO_DELETES_PER_SECOND", "5000"))
+BORRADO_BATCH_SIZE = int(os.getenv("BORRADO_BATCH_SIZE", "1000"))
+ACTIVE_STATES = ("pendiente", "en_curso")
+
+
+class DeletionPacer:
+    """Reparte los borrados para no superar `rate` documentos por segundo"""
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=asyncio.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self._next = clock()
+
+    async def spend(self, deleted: int):
+        if self.rate <= 0 or deleted <= 0:
+            return
+        now = self.clock()
+        self._next = max(self._next, now) + deleted / self.rate
+        delay = self._next - now
+        if delay > 0:
+            await self.sleep(delay)
+
+
+@monitored_service
+class DeletionService:
+    """Borrado en cascada en segundo plano.
+
+    DELETE marca la planta con `pendiente_borrado` y crea un trabajo en
+    `trabajos_borrado`; el trabajo elimina sus lecturas por lotes en el orden
+    del índice (planta_id, _id), guarda el último `_id` procesado y respeta un
+    presupuesto de borrados por segundo. Después elimina la planta, repasa
+    las lecturas que llegaron entretanto y solo entonces el resumen, para que
+    ninguna lectura tardía lo vuelva a crear. Los trabajos activos se
+    reanudan al arrancar. Al marcar la planta se registra su baja en
+    TOMBSTONES_COLLECTION para que /sync/ la comunique a los clientes.
+
+    `blocked` guarda las plantas en borrado o ya borradas por este proceso: la
+    ingesta rechaza sus lecturas. Con varios procesos, lo que acepte otro
+    mientras tanto lo elimina el repaso final.
+    """
+
+    def __init__(self, rate: float = BORRADO_DELETES_PER_SECOND, batch_size: int = BORRADO_BATCH_SIZE):
+        self.jobs_collection = db["trabajos_borrado"]
+        self.readings_collection = db["lecturas"]
+        self.plants_collection = db["plantas"]
+        self.summary_collection = db["resumen_plantas"]
+        self.tombstones_collection = db[TOMBSTONES_COLLECTION]
+        self.plant_service = PlantService()
+        self.rate = rate
+        self.batch_size = batch_size
+        self._tasks: Dict[ObjectId, asyncio.Task] = {}
+        self.blocked: Set[str] = set()
+
+    async def request_plant_deletion(self, plant_id: str) -> Optional[dict]:
+        """Marca la planta y encola su trabajo; devuelve el trabajo (existente o nuevo)"""
+        if not ObjectId.is_valid(plant_id):
+            return None
+        active = await self.jobs_collection.find_one({"tipo": "planta", "objetivo_id": plant_id, "activo": True})
+        if active:
+            self.blocked.add(plant_id)
+            return active
+
+        now = datetime.utcnow()
+        result = await self.plants_collection.update_one(
+            {"_id": ObjectId(plant_id)},
+            {"$set": {"pendiente_borrado": True, "actualizado_en": now}}
+        )
+        if result.matched_count == 0:
+            return None
+        self.blocked.add(plant_id)
+        # Una planta en borrado ya no debe avisar de sensores sin señal
+        liveness_tracker.forget(plant_id)
+        # Con peticiones simultáneas puede quedar una baja repetida; aplicarla dos veces no cambia nada
+        await self.tombstones_collection.insert_one({"tipo": "planta_borrada", "planta_id": plant_id})
+
+        job = {
+            "tipo": "planta", "objetivo_id": plant_id, "estado": "pendiente", "activo": True,
+            "borradas": 0, "ultimo_id": None, "creado_en": now, "actualizado_en": now
+        }
+        try:
+            result = await self.jobs_collection.insert_one(job)
+        except DuplicateKeyError:
+            # Otra petición creó el trabajo a la vez (índice único parcial sobre activos)
+            return await self.jobs_collection.find_one({"tipo": "planta", "objetivo_id": plant_id, "activo": True})
+        job["_id"] = result.inserted_id
+        self.schedule(job["_id"])
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.jobs_collection.find_one({"_id": ObjectId(job_id)})
+
+    def schedule(self, job_id: ObjectId):
+        task = self._tasks.get(job_id)
+        if task is None or task.done():
+            task = self._tasks[job_id] = asyncio.create_task(self.run(job_id))
+            task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def resume_pending(self) -> int:
+        """Reprograma los trabajos que quedaron activos antes de un reinicio"""
+        cursor = self.jobs_collection.find({"estado": {"$in": list(ACTIVE_STATES)}}, {"_id": 1, "objetivo_id": 1})
+        jobs = await cursor.to_list(length=None)
+        for job in jobs:
+            self.blocked.add(job["objetivo_id"])
+            self.schedule(job["_id"])
+        return len(jobs)
+
+    async def shutdown(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _delete_readings(self, job: dict):
+        plant_id = job["objetivo_id"]
+        pacer = DeletionPacer(self.rate)
+        last_id = job.get("ultimo_id")
+        while True:
+            query = {"planta_id": plant_id}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            cursor = self.readings_collection.find(query, {"_id": 1}).sort(
+                [("planta_id", 1), ("_id", 1)]
+            ).limit(self.batch_size)
+            ids = [doc["_id"] for doc in await cursor.to_list(length=self.batch_size)]
+            if not ids:
+                return
+            result = await self.readings_collection.delete_many({"_id": {"$in": ids}})
+            last_id = ids[-1]
+            await self.jobs_collection.update_one(
+                {"_id": job["_id"]},
+                {"$inc": {"borradas": result.deleted_count},
+                 "$set": {"ultimo_id": last_id, "actualizado_en": datetime.utcnow()}}
+            )
+            ingest_watermarks.advance(plant_id)
+            await pacer.spend(result.deleted_count)
+
+    async def run(self, job_id: ObjectId):
+        job = await self.jobs_collection.find_one_and_update(
+            {"_id": job_id, "estado": {"$in": list(ACTIVE_STATES)}},
+            {"$set": {"estado": "en_curso", "actualizado_en": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return
+        try:
+            self.blocked.add(job["objetivo_id"])
+            await self._delete_readings(job)
+            await self.plant_service.delete_plant(job["objetivo_id"])
+            if column_cache is not None:
+                column_cache.evict(job["objetivo_id"])
+            # Las lecturas que llegaron durante el borrado ya no tienen planta
+            await self._delete_readings({**job, "ultimo_id": None})
+            # El último paso: una lectura tardía lo habría vuelto a crear (upsert)
+            await self.summary_collection.delete_one({"_id": ObjectId(job["objetivo_id"])})
+        except asyncio.CancelledError:
+            # Apagado: el trabajo sigue activo y se reanuda en el próximo arranque
+            raise
+        except Exception as e:
+            logger.exception("Error en el trabajo de borrado %s", job_id)
+            await self.jobs_collection.update_one(
+                {"_id": job_id},
+                {"$set": {"estado": "fallido", "error": str(e), "actualizado_en": datetime.utcnow()},
+                 "$unset": {"activo": ""}}
+            )
+            return
+        await self.jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"estado": "completado", "actualizado_en": datetime.utcnow()}, "$unset": {"activo": ""}}
+        )
+
+
+deletion_service = DeletionService()
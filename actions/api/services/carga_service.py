@@ -0,0 +1,315 @@
+import asyncio
+import codecs
+import csv
+import os
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+from pydantic import TypeAdapter, ValidationError
+from pymongo import ReturnDocument
+from data.db.mongo import db
+from data.db.query_monitor import monitored_service
+from data.db.repositories import insert_unordered
+from actions.api.models.models import LecturaHistorica
+from actions.api.services.borrado_service import deletion_service
+from actions.api.services.ingest_watermark import ingest_watermarks
+from actions.api.services.resumen_service import SummaryService
+
+CARGA_CHUNK_SIZE = int(os.getenv("CARGA_CHUNK_SIZE", "5000"))
+CARGA_PARALLEL = int(os.getenv("CARGA_PARALLEL", "4"))
+MAX_ERRORES = 50
+# Límites de la descompresión gzip: por trozo emitido y para el cuerpo completo
+GUNZIP_CHUNK_BYTES = 1 << 20
+CARGA_MAX_BYTES = int(os.getenv("CARGA_MAX_BYTES", str(4 << 30)))
+FORMATOS = ("csv", "ndjson")
+
+_batch_adapter = TypeAdapter(List[LecturaHistorica])
+
+
+class CargaEnCursoError(Exception):
+    """Ya hay una carga con el mismo identificador ejecutándose"""
+
+
+class CargaDemasiadoGrandeError(ValueError):
+    """El cuerpo descomprimido supera CARGA_MAX_BYTES"""
+
+
+async def iter_gunzip(
+    chunks: AsyncIterator[bytes], max_bytes: int = CARGA_MAX_BYTES, chunk_bytes: int = GUNZIP_CHUNK_BYTES
+) -> AsyncIterator[bytes]:
+    """Descomprime por partes un cuerpo con Content-Encoding: gzip.
+
+    Ningún trozo emitido supera `chunk_bytes` aunque unos pocos bytes
+    comprimidos se expandan a cientos de MB (lo que no cabe queda en
+    `unconsumed_tail`), y el total se corta en `max_bytes`.
+    """
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    total = 0
+    async for chunk in chunks:
+        data = chunk
+        while True:
+            out = decompressor.decompress(data, chunk_bytes)
+            data = decompressor.unconsumed_tail
+            if out:
+                total += len(out)
+                if total > max_bytes:
+                    raise CargaDemasiadoGrandeError(f"El cuerpo descomprimido supera {max_bytes} bytes")
+                yield out
+            # Salida por debajo del máximo y sin entrada pendiente: pedir el siguiente trozo
+            if not data and len(out) < chunk_bytes:
+                break
+    tail = decompressor.flush()
+    if tail:
+        if total + len(tail) > max_bytes:
+            raise CargaDemasiadoGrandeError(f"El cuerpo descomprimido supera {max_bytes} bytes")
+        yield tail
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Divide en líneas un flujo de bytes UTF-8 sin cargarlo completo"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_row_batches(lines: AsyncIterator[str], formato: str, batch_size: int) -> AsyncIterator[List[Tuple[int, object]]]:
+    """Lotes de (número de fila, dict | mensaje de error).
+
+    Las filas se numeran desde 1 sin contar la cabecera CSV ni las líneas
+    vacías, de modo que el mismo archivo produce siempre la misma numeración.
+    """
+    header = None
+    number = 0
+    raw: List[Tuple[int, str]] = []
+
+    def parse(batch):
+        if formato == "ndjson":
+            rows = []
+            for row_number, line in batch:
+                try:
+                    data = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    data = f"JSON inválido: {e}"
+                rows.append((row_number, data if isinstance(data, (dict, str)) else "Se esperaba un objeto JSON"))
+            return rows
+        rows = []
+        for (row_number, _), values in zip(batch, csv.reader(line for _, line in batch)):
+            if len(values) != len(header):
+                rows.append((row_number, f"Se esperaban {len(header)} columnas y hay {len(values)}"))
+                continue
+            rows.append((row_number, {key: value for key, value in zip(header, values) if value != ""}))
+        return rows
+
+    async for line in lines:
+        if not line.strip():
+            continue
+        if formato == "csv" and header is None:
+            header = [name.strip() for name in next(csv.reader([line]))]
+            continue
+        number += 1
+        raw.append((number, line))
+        if len(raw) >= batch_size:
+            yield parse(raw)
+            raw = []
+    if raw:
+        yield parse(raw)
+
+
+@monitored_service
+class BulkUploadService:
+    """Carga histórica de lecturas desde CSV o NDJSON.
+
+    El cuerpo se procesa en streaming: cada lote se valida contra
+    `LecturaHistorica` y se inserta sin orden en paralelo (con un máximo de
+    `CARGA_PARALLEL` lotes en vuelo). Cada fila recibe `dispositivo_id =
+    "carga:<id>"` y `secuencia = número de fila`, así que repetir la carga
+    con el mismo id no duplica lecturas; además se salta el prefijo de filas
+    ya confirmado en la colección `cargas`.
+    """
+
+    # Cargas en ejecución en este proceso
+    _active = set()
+
+    def __init__(self):
+        self.readings_collection = db["lecturas"]
+        self.plants_collection = db["plantas"]
+        self.uploads_collection = db["cargas"]
+        self.summary_service = SummaryService()
+
+    async def get_upload(self, upload_id: str) -> Optional[dict]:
+        return await self.uploads_collection.find_one({"_id": upload_id})
+
+    async def _open(self, upload_id: Optional[str], formato: str, plant_id: Optional[str]) -> dict:
+        now = datetime.utcnow()
+        upload_id = upload_id or uuid.uuid4().hex
+        return await self.uploads_collection.find_one_and_update(
+            {"_id": upload_id},
+            {
+                "$set": {"estado": "en_curso", "actualizado_en": now},
+                "$setOnInsert": {
+                    "formato": formato, "planta_id": plant_id, "creado_en": now,
+                    "filas_leidas": 0, "filas_confirmadas": 0, "insertadas": 0,
+                    "duplicadas": 0, "rechazadas": 0, "errores": []
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _validate(self, rows: List[Tuple[int, object]], upload_id: str, plant_id: Optional[str]):
+        """Valida un lote de filas de una vez; devuelve (documentos, errores)"""
+        errors, candidates, numbers = [], [], []
+        for number, data in rows:
+            if isinstance(data, str):
+                errors.append({"fila": number, "error": data})
+                continue
+            if plant_id and not data.get("planta_id"):
+                data["planta_id"] = plant_id
+            if isinstance(data.get("planta_id"), str) and data["planta_id"] in deletion_service.blocked:
+                errors.append({"fila": number, "error": "planta_id: la planta está en borrado"})
+                continue
+            if data.get("dispositivo_id") is None or data.get("secuencia") is None:
+                data["dispositivo_id"] = f"carga:{upload_id}"
+                data["secuencia"] = number
+            candidates.append(data)
+            numbers.append(number)
+
+        try:
+            readings = _batch_adapter.validate_python(candidates)
+        except ValidationError as e:
+            failed = {}
+            for error in e.errors():
+                index = error["loc"][0]
+                field = ".".join(str(part) for part in error["loc"][1:])
+                failed.setdefault(index, f"{field}: {error['msg']}")
+            errors.extend({"fila": numbers[i], "error": message} for i, message in sorted(failed.items()))
+            readings = _batch_adapter.validate_python(
+                [data for i, data in enumerate(candidates) if i not in failed]
+            )
+        return [reading.dict() for reading in readings], errors
+
+    async def _store(self, documents: List[dict]) -> Tuple[int, int]:
+        if not documents:
+            return 0, 0
+        stored, duplicates = await insert_unordered(self.readings_collection, documents)
+
+        newest, oldest = {}, {}
+        for doc in stored:
+            if doc["planta_id"] not in newest or doc["fecha"] > newest[doc["planta_id"]]:
+                newest[doc["planta_id"]] = doc["fecha"]
+            if doc["planta_id"] not in oldest or doc["fecha"] < oldest[doc["planta_id"]]:
+                oldest[doc["planta_id"]] = doc["fecha"]
+        for plant_id, fecha in oldest.items():
+            ingest_watermarks.advance(plant_id, fecha)
+        # La última lectura de la planta solo avanza, nunca retrocede con datos antiguos
+        await asyncio.gather(
+            *(
+                self.plants_collection.update_one(
+                    {"_id": ObjectId(plant_id), "$or": [
+                        {"ultima_lectura": {"$lt": fecha}}, {"ultima_lectura": None}
+                    ]},
+                    {"$set": {"ultima_lectura": fecha}}
+                )
+                for plant_id, fecha in newest.items() if ObjectId.is_valid(plant_id)
+            ),
+            self.summary_service.record_history(stored)
+        )
+        return len(stored), duplicates
+
+    async def upload(
+        self,
+        chunks: AsyncIterator[bytes],
+        formato: str,
+        plant_id: Optional[str] = None,
+        upload_id: Optional[str] = None,
+        chunk_size: int = CARGA_CHUNK_SIZE,
+        parallel: int = CARGA_PARALLEL
+    ) -> dict:
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato no soportado: {formato}")
+        upload = await self._open(upload_id, formato, plant_id)
+        upload_id = upload["_id"]
+        if upload_id in self._active:
+            raise CargaEnCursoError(f"La carga {upload_id} ya está en curso")
+        self._active.add(upload_id)
+
+        resume_from = upload["filas_confirmadas"]
+        slots = asyncio.Semaphore(parallel)
+        # Lotes en orden de envío: [última fila, terminado]; el prefijo
+        # terminado marca hasta qué fila se puede reanudar
+        in_flight = deque()
+        tasks = set()
+        failure: List[BaseException] = []
+        rows_read = 0
+
+        async def run_chunk(entry, documents, errors):
+            try:
+                inserted, duplicates = await self._store(documents)
+                entry[1] = True
+                confirmed = None
+                while in_flight and in_flight[0][1]:
+                    confirmed = in_flight.popleft()[0]
+                update = {
+                    "$inc": {"insertadas": inserted, "duplicadas": duplicates, "rechazadas": len(errors)},
+                    "$set": {"actualizado_en": datetime.utcnow(), "filas_leidas": rows_read}
+                }
+                if confirmed is not None:
+                    update["$max"] = {"filas_confirmadas": confirmed}
+                if errors:
+                    update["$push"] = {"errores": {"$each": errors, "$slice": MAX_ERRORES}}
+                await self.uploads_collection.update_one({"_id": upload_id}, update)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                slots.release()
+
+        try:
+            async for rows in iter_row_batches(iter_lines(chunks), formato, chunk_size):
+                if failure:
+                    break
+                rows_read = rows[-1][0]
+                rows = [row for row in rows if row[0] > resume_from]
+                if not rows:
+                    continue
+                documents, errors = self._validate(rows, upload_id, plant_id)
+                await slots.acquire()
+                entry = [rows[-1][0], False]
+                in_flight.append(entry)
+                task = asyncio.create_task(run_chunk(entry, documents, errors))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            if failure:
+                raise failure[0]
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await self.uploads_collection.update_one(
+                {"_id": upload_id},
+                {"$set": {"estado": "interrumpida", "motivo": str(e) or type(e).__name__, "actualizado_en": datetime.utcnow()}}
+            )
+            raise
+        finally:
+            self._active.discard(upload_id)
+
+        return await self.uploads_collection.find_one_and_update(
+            {"_id": upload_id},
+            {"$set": {
+                "estado": "completada", "filas_leidas": max(rows_read, resume_from),
+                "filas_confirmadas": max(rows_read, resume_from), "actualizado_en": datetime.utcnow()
+            }, "$unset": {"motivo": ""}},
+            return_document=ReturnDocument.AFTER
+        )
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import os
+import shutil
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from bson import ObjectId
+from data.db.mongo import STORAGE_BACKEND, db
+from actions.api.models.models import LECTURA_METRICS
+
+COLUMN_CACHE_DIR = os.getenv("COLUMN_CACHE_DIR")
+COLUMN_CACHE_MAX_BYTES = int(os.getenv("COLUMN_CACHE_MAX_BYTES", str(8 << 30)))
+# Las lecturas más recientes que este margen se leen de Mongo (inserciones aún en vuelo)
+COLUMN_CACHE_SETTLE_SECONDS = float(os.getenv("COLUMN_CACHE_SETTLE_SECONDS", "2"))
+# Lecturas desordenadas que se fusionan en la cola antes de reconstruir la planta
+TAIL_MERGE_LIMIT = int(os.getenv("COLUMN_CACHE_TAIL_MERGE", "20000"))
+FILL_BATCH_SIZE = 20000
+TIME_FILE = "fecha.i8"
+
+
+def documents_to_columns(documents: List[dict], metrics: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(tiempos en ms int64, matriz float64 n x métricas con NaN donde falta)"""
+    times = np.array([doc["fecha"] for doc in documents], dtype="datetime64[ms]").astype(np.int64)
+    values = np.array([[doc.get(name) for name in metrics] for doc in documents], dtype=np.float64)
+    return times, values.reshape(len(documents), len(metrics))
+
+
+class PlantColumns:
+    """Columnas en disco de una planta: `fecha.i8` y un `<métrica>.f8` por métrica.
+
+    Los archivos solo crecen por el final y `meta.json` (escrito de forma
+    atómica después de los datos) dice cuántas filas son válidas; al abrir se
+    recortan los bytes sobrantes de una escritura interrumpida.
+    """
+
+    def __init__(self, directory: str, metrics: Sequence[str] = LECTURA_METRICS):
+        self.directory = directory
+        self.metrics = tuple(metrics)
+        self.rows = 0
+        self.last_id: Optional[ObjectId] = None
+        self.max_time: Optional[int] = None
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _files(self) -> Dict[str, Tuple[str, np.dtype]]:
+        files = {"fecha": (TIME_FILE, np.dtype(np.int64))}
+        files.update({name: (f"{name}.f8", np.dtype(np.float64)) for name in self.metrics})
+        return files
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self._path("meta.json")) as handle:
+                meta = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            meta = {}
+        self.rows = meta.get("filas", 0)
+        self.last_id = ObjectId(meta["ultimo_id"]) if meta.get("ultimo_id") else None
+        self.max_time = meta.get("max_fecha")
+        for filename, dtype in self._files().values():
+            path = self._path(filename)
+            expected = self.rows * dtype.itemsize
+            if not os.path.exists(path) or os.path.getsize(path) < expected:
+                self.truncate(0)
+                return
+            if os.path.getsize(path) > expected:
+                os.truncate(path, expected)
+
+    def _save_meta(self):
+        meta = {
+            "filas": self.rows,
+            "ultimo_id": str(self.last_id) if self.last_id else None,
+            "max_fecha": self.max_time
+        }
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as handle:
+            json.dump(meta, handle)
+        os.replace(tmp, self._path("meta.json"))
+
+    def nbytes(self) -> int:
+        return self.rows * 8 * (len(self.metrics) + 1)
+
+    def column(self, name: str, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Vista de solo lectura (np.memmap) sin copiar datos"""
+        filename, dtype = self._files()[name]
+        stop = self.rows if stop is None else stop
+        if stop <= start:
+            return np.empty(0, dtype=dtype)
+        mapped = np.memmap(self._path(filename), dtype=dtype, mode="r", shape=(self.rows,))
+        return mapped[start:stop]
+
+    def truncate(self, rows: int):
+        for filename, dtype in self._files().values():
+            with open(self._path(filename), "ab") as handle:
+                handle.truncate(rows * dtype.itemsize)
+        self.rows = rows
+        if rows == 0:
+            self.last_id = None
+            self.max_time = None
+        else:
+            self.max_time = int(self.column("fecha", rows - 1)[0])
+        self._save_meta()
+
+    def append(self, times: np.ndarray, values: np.ndarray, last_id: ObjectId):
+        """Añade filas ya ordenadas cuyo primer tiempo no es menor que el último"""
+        if len(times):
+            files = self._files()
+            with open(self._path(files["fecha"][0]), "ab") as handle:
+                handle.write(np.ascontiguousarray(times, dtype=np.int64).tobytes())
+            for index, name in enumerate(self.metrics):
+                with open(self._path(files[name][0]), "ab") as handle:
+                    handle.write(np.ascontiguousarray(values[:, index], dtype=np.float64).tobytes())
+            self.rows += len(times)
+            self.max_time = int(times[-1])
+        self.last_id = last_id
+        self._save_meta()
+
+
+class ColumnCache:
+    """Caché local de historiales por planta en archivos columnares mapeados.
+
+    Cada lectura de columnas primero trae de Mongo (índice planta_id, _id) lo
+    insertado después de la marca `ultimo_id` de la planta y lo añade al
+    final; después sirve el rango pedido con `np.searchsorted` sobre los
+    tiempos y vistas `np.memmap` de cada métrica. Las lecturas que llegan
+    fuera de orden se fusionan en la cola o, si son muchas (carga histórica),
+    provocan la reconstrucción de la planta. Se expulsan plantas completas
+    por LRU cuando el tamaño total supera `max_bytes`.
+    """
+
+    def __init__(self, directory: str, collection, max_bytes: int = COLUMN_CACHE_MAX_BYTES,
+                 settle_seconds: float = COLUMN_CACHE_SETTLE_SECONDS):
+        self.directory = directory
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self.settle_seconds = settle_seconds
+        self._plants: "OrderedDict[str, PlantColumns]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._scanned = False
+
+    def _scan(self):
+        """Registra en el LRU las plantas que ya estaban en disco"""
+        self._scanned = True
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith((".nuevo", ".viejo")):
+                # Restos de una reconstrucción interrumpida
+                shutil.rmtree(path, ignore_errors=True)
+            elif ObjectId.is_valid(name) and os.path.isdir(path):
+                size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                entries.append((os.path.getmtime(path), name, size))
+        for _, name, size in sorted(entries):
+            self._sizes[name] = size
+
+    def _open(self, plant_id: str) -> PlantColumns:
+        plant = self._plants.get(plant_id)
+        if plant is None:
+            plant = self._plants[plant_id] = PlantColumns(os.path.join(self.directory, plant_id))
+        return plant
+
+    def evict(self, plant_id: str):
+        self._plants.pop(plant_id, None)
+        self._sizes.pop(plant_id, None)
+        shutil.rmtree(os.path.join(self.directory, plant_id), ignore_errors=True)
+
+    def _enforce_limit(self, keep: str):
+        total = sum(self._sizes.values())
+        for plant_id in list(self._sizes):
+            if total <= self.max_bytes:
+                break
+            if plant_id == keep:
+                continue
+            total -= self._sizes[plant_id]
+            self.evict(plant_id)
+
+    def _settled_bound(self) -> ObjectId:
+        return ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=self.settle_seconds))
+
+    async def _fetch(self, query: dict, sort: list) -> AsyncIterator[List[dict]]:
+        projection = {"_id": 1, "fecha": 1, **{name: 1 for name in LECTURA_METRICS}}
+        cursor = self.collection.find(query, projection).sort(sort).batch_size(FILL_BATCH_SIZE)
+        while True:
+            batch = await cursor.to_list(length=FILL_BATCH_SIZE)
+            if not batch:
+                return
+            yield batch
+
+    async def _rebuild(self, plant: PlantColumns, plant_id: str, bound: ObjectId) -> PlantColumns:
+        """Rellena la planta desde cero en orden temporal (índice planta_id, fecha).
+
+        Se escribe en un directorio aparte y se intercambia al final: los
+        lectores en curso conservan sus mapas sobre los archivos anteriores.
+        """
+        staging = plant.directory + ".nuevo"
+        shutil.rmtree(staging, ignore_errors=True)
+        fresh = PlantColumns(staging, plant.metrics)
+        last_id = None
+        async for batch in self._fetch(
+            {"planta_id": plant_id, "_id": {"$lt": bound}}, [("planta_id", 1), ("fecha", 1)]
+        ):
+            times, values = documents_to_columns(batch, fresh.metrics)
+            batch_max = max(doc["_id"] for doc in batch)
+            last_id = batch_max if last_id is None else max(last_id, batch_max)
+            fresh.append(times, values, last_id)
+        retired = plant.directory + ".viejo"
+        os.rename(plant.directory, retired)
+        os.rename(staging, plant.directory)
+        shutil.rmtree(retired, ignore_errors=True)
+        fresh.directory = plant.directory
+        self._plants[plant_id] = fresh
+        return fresh
+
+    def invalidate_older(self, plant_id: str, oldest_id: ObjectId):
+        """Descarta la planta si se insertaron lecturas con `_id` ya superado por su marca.
+
+        `refresh` avanza por `_id`: lo insertado tarde con un `_id` antiguo
+        (spool reproducido tras un corte) no se vería nunca.
+        """
+        if not self._scanned:
+            self._scan()
+        if plant_id not in self._plants and plant_id not in self._sizes:
+            return
+        last_id = self._open(plant_id).last_id
+        if last_id is not None and oldest_id <= last_id:
+            self.evict(plant_id)
+
+    async def refresh(self, plant_id: str) -> PlantColumns:
+        """Trae a disco lo insertado desde la marca de la planta hasta el margen de asentamiento"""
+        if not self._scanned:
+            self._scan()
+        lock = self._locks.setdefault(plant_id, asyncio.Lock())
+        async with lock:
+            plant = self._open(plant_id)
+            bound = self._settled_bound()
+            query = {"planta_id": plant_id, "_id": {"$lt": bound}}
+            if plant.last_id is not None:
+                query["_id"]["$gt"] = plant.last_id
+            async for batch in self._fetch(query, [("planta_id", 1), ("_id", 1)]):
+                times, values = documents_to_columns(batch, plant.metrics)
+                order = np.argsort(times, kind="stable")
+                times, values = times[order], values[order]
+                last_id = batch[-1]["_id"]
+                if plant.max_time is None or times[0] >= plant.max_time:
+                    plant.append(times, values, last_id)
+                    continue
+                position = int(np.searchsorted(plant.column("fecha"), times[0], side="right"))
+                if plant.rows - position > TAIL_MERGE_LIMIT:
+                    plant = await self._rebuild(plant, plant_id, bound)
+                    break
+                # Fusiona la cola desordenada con el lote y la reescribe (el archivo no encoge)
+                tail_times = np.concatenate([np.array(plant.column("fecha", position)), times])
+                tail_values = np.concatenate([
+                    np.column_stack([np.array(plant.column(name, position)) for name in plant.metrics])
+                    if plant.rows > position else np.empty((0, len(plant.metrics))),
+                    values
+                ])
+                order = np.argsort(tail_times, kind="stable")
+                plant.truncate(position)
+                plant.append(tail_times[order], tail_values[order], last_id)
+
+            self._sizes[plant_id] = plant.nbytes()
+            self._sizes.move_to_end(plant_id)
+            self._enforce_limit(keep=plant_id)
+            return plant
+
+    async def iter_columns(
+        self,
+        plant_id: str,
+        start: datetime,
+        end: datetime,
+        metrics: Sequence[str],
+        batch_size: int
+    ) -> AsyncIterator[Tuple[np.ndarray, np.ndarray]]:
+        """Mismo contrato que ReadingService.iter_reading_columns, servido desde disco"""
+        plant = await self.refresh(plant_id)
+        # Los mapas se abren antes de ceder el control: una reconstrucción
+        # concurrente no cambia los archivos que ya lee este iterador
+        rows, watermark = plant.rows, plant.last_id
+        times = plant.column("fecha", 0, rows)
+        columns = [plant.column(name, 0, rows) for name in metrics]
+        start_ms = int(np.datetime64(start, "ms").astype(np.int64))
+        end_ms = int(np.datetime64(end, "ms").astype(np.int64))
+        first = int(np.searchsorted(times, start_ms, side="left"))
+        last = int(np.searchsorted(times, end_ms, side="left"))
+
+        # Lo posterior a la marca se pide a Mongo y se fusiona con el último lote
+        query = {"planta_id": plant_id, "fecha": {"$gte": start, "$lt": end}}
+        if watermark is not None:
+            query["_id"] = {"$gt": watermark}
+        recent = [doc async for batch in self._fetch(query, [("planta_id", 1), ("_id", 1)]) for doc in batch]
+
+        chunk_times, chunk_values = np.empty(0, dtype=np.int64), np.empty((0, len(metrics)))
+        for offset in range(first, last, batch_size):
+            stop = min(offset + batch_size, last)
+            chunk_times = times[offset:stop]
+            chunk_values = np.column_stack([column[offset:stop] for column in columns])
+            if stop == last and recent:
+                break
+            yield chunk_times, chunk_values
+
+        if recent:
+            recent_times, recent_values = documents_to_columns(recent, metrics)
+            merged_times = np.concatenate([chunk_times, recent_times])
+            merged_values = np.concatenate([chunk_values, recent_values])
+            order = np.argsort(merged_times, kind="stable")
+            yield merged_times[order], merged_values[order]
+
+
+column_cache: Optional[ColumnCache] = (
+    ColumnCache(COLUMN_CACHE_DIR, db["lecturas"]) if COLUMN_CACHE_DIR and STORAGE_BACKEND == "mongo" else None
+)
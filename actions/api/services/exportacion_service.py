@@ -0,0 +1,323 @@
+import asyncio
+import io
+import logging
+import os
+import zipfile
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+import numpy as np
+import orjson
+from bson import ObjectId
+from data.db.mongo import db, fs_bucket
+from data.db.query_monitor import monitored_service
+from actions.api.models.models import LECTURA_METRICS
+from actions.api.services.lectura_service import ReadingService
+from actions.api.services.resample_service import naive_utc
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_TTL_HOURS = float(os.getenv("EXPORT_TTL_HOURS", "24"))
+EXPORT_CLEANUP_INTERVAL = float(os.getenv("EXPORT_CLEANUP_INTERVAL", "600"))
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(1 << 20)))
+ACTIVE_STATES = ("pendiente", "en_curso")
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    # Un .npz: por planta y lote `<planta>/<n>/fecha` (ms int64) y uno float64 por métrica
+    "columnar": ("application/octet-stream", "npz")
+}
+
+
+def _iso_times(times: np.ndarray) -> np.ndarray:
+    return np.datetime_as_string(times.astype("datetime64[ms]"), unit="ms")
+
+
+class CsvWriter:
+    def __init__(self, metrics: Sequence[str]):
+        self.metrics = list(metrics)
+
+    def header(self) -> bytes:
+        return (",".join(["planta_id", "fecha", *self.metrics]) + "\n").encode()
+
+    def batch(self, plant_id: str, times: np.ndarray, values: np.ndarray) -> bytes:
+        lines = np.char.add(f"{plant_id},", _iso_times(times))
+        for column in values.T:
+            text = np.where(np.isnan(column), "", np.char.mod("%.10g", column))
+            lines = np.char.add(np.char.add(lines, ","), text)
+        return ("\n".join(lines.tolist()) + "\n").encode()
+
+    def end_plant(self, plant_id: str) -> bytes:
+        return b""
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class NdjsonWriter(CsvWriter):
+    def header(self) -> bytes:
+        return b""
+
+    def batch(self, plant_id: str, times: np.ndarray, values: np.ndarray) -> bytes:
+        out = bytearray()
+        present = ~np.isnan(values)
+        for stamp, row, mask in zip(_iso_times(times).tolist(), values.tolist(), present.tolist()):
+            record = {"planta_id": plant_id, "fecha": stamp + "Z"}
+            record.update((name, value) for name, value, ok in zip(self.metrics, row, mask) if ok)
+            out += orjson.dumps(record)
+            out += b"\n"
+        return bytes(out)
+
+
+class _DrainableBuffer(io.RawIOBase):
+    """Destino sin `seek` para zipfile: acumula bytes que se vacían por partes"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
+
+
+class ColumnarWriter(CsvWriter):
+    """Escribe un .npz en streaming: cada lote se emite en cuanto llega.
+
+    Los arrays de un lote van a `<planta>/<n>/fecha.npy` y
+    `<planta>/<n>/<métrica>.npy`; concatenando los lotes de una planta en
+    orden de `n` se obtiene su serie completa. Una planta sin lecturas deja
+    un lote 0 vacío. La memoria queda acotada al lote en curso.
+    """
+
+    def __init__(self, metrics: Sequence[str]):
+        super().__init__(metrics)
+        self._sink = _DrainableBuffer()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._batches = 0
+
+    def header(self) -> bytes:
+        return b""
+
+    def _write_array(self, name: str, array: np.ndarray):
+        with self._zip.open(name, mode="w", force_zip64=True) as entry:
+            np.lib.format.write_array(entry, np.ascontiguousarray(array), allow_pickle=False)
+
+    def _write_batch(self, plant_id: str, times: np.ndarray, values: np.ndarray):
+        prefix = f"{plant_id}/{self._batches}"
+        self._write_array(f"{prefix}/fecha.npy", times)
+        for index, name in enumerate(self.metrics):
+            self._write_array(f"{prefix}/{name}.npy", values[:, index])
+        self._batches += 1
+
+    def batch(self, plant_id: str, times: np.ndarray, values: np.ndarray) -> bytes:
+        self._write_batch(plant_id, times, values)
+        return self._sink.drain()
+
+    def end_plant(self, plant_id: str) -> bytes:
+        if self._batches == 0:
+            self._write_batch(plant_id, np.empty(0, dtype=np.int64), np.empty((0, len(self.metrics))))
+        self._batches = 0
+        return self._sink.drain()
+
+    def footer(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
+
+
+WRITERS = {"csv": CsvWriter, "ndjson": NdjsonWriter, "columnar": ColumnarWriter}
+
+
+class RangoNoSatisfacibleError(ValueError):
+    pass
+
+
+def parse_range(header: Optional[str], size: int):
+    """(inicio, fin inclusivo) de una cabecera `Range: bytes=...` de un solo tramo.
+
+    Devuelve None si no hay cabecera o no se entiende (se sirve completo) y
+    lanza RangoNoSatisfacibleError si el tramo queda fuera del archivo.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, separator, end_text = header[6:].strip().partition("-")
+    if not separator or not (start_text.isdigit() or start_text == "") or not (end_text.isdigit() or end_text == ""):
+        return None
+    if start_text == "":
+        if not end_text or int(end_text) == 0:
+            raise RangoNoSatisfacibleError("Rango vacío")
+        return max(size - int(end_text), 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise RangoNoSatisfacibleError("Rango no satisfacible")
+    return start, min(end, size - 1)
+
+
+@monitored_service
+class ExportService:
+    """Trabajos de exportación en segundo plano almacenados en GridFS.
+
+    Los trabajos se guardan en `exportaciones` y los procesa un conjunto fijo
+    de `EXPORT_WORKERS` tareas; cada una recorre las lecturas por lotes y
+    escribe el archivo en `fs_bucket` por bloques, actualizando el progreso
+    por planta. Los archivos caducan a las `EXPORT_TTL_HOURS` horas.
+    """
+
+    def __init__(self):
+        self.exports_collection = db["exportaciones"]
+        self.chunks_collection = db["fs.chunks"]
+        self.fs_bucket = fs_bucket
+        self.reading_service = ReadingService()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    async def submit(self, plant_ids: List[str], start: datetime, end: datetime, formato: str, user_id: str) -> dict:
+        now = datetime.utcnow()
+        job = {
+            "plantas": sorted(set(plant_ids)), "desde": naive_utc(start), "hasta": naive_utc(end),
+            "formato": formato, "usuario_id": user_id, "estado": "pendiente", "filas": 0,
+            "progreso": 0.0, "archivo_id": None, "tamano": None, "expira_en": None,
+            "creado_en": now, "actualizado_en": now
+        }
+        result = await self.exports_collection.insert_one(job)
+        job["_id"] = result.inserted_id
+        self._queue.put_nowait(job["_id"])
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.exports_collection.find_one({"_id": ObjectId(job_id)})
+
+    async def open_file(self, file_id: ObjectId):
+        return await self.fs_bucket.open_download_stream(file_id)
+
+    async def start(self, workers: int = EXPORT_WORKERS):
+        """Reencola los trabajos interrumpidos y arranca los trabajadores y la limpieza"""
+        cursor = self.exports_collection.find({"estado": {"$in": list(ACTIVE_STATES)}}, {"_id": 1}).sort("_id", 1)
+        for job in await cursor.to_list(length=None):
+            self._queue.put_nowait(job["_id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+        self._tasks.append(asyncio.create_task(self.cleanup_loop()))
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.build(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en la exportación %s", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def build(self, job_id: ObjectId):
+        job = await self.exports_collection.find_one({"_id": job_id, "estado": {"$in": list(ACTIVE_STATES)}})
+        if job is None:
+            return
+        if job.get("archivo_id") is not None:
+            # Restos de un intento interrumpido: GridFS no tiene aún el documento del archivo
+            await self.chunks_collection.delete_many({"files_id": job["archivo_id"]})
+
+        content_type, extension = FORMATS[job["formato"]]
+        file_id = ObjectId()
+        await self.exports_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"estado": "en_curso", "archivo_id": file_id, "filas": 0, "progreso": 0.0,
+                      "actualizado_en": datetime.utcnow()}}
+        )
+        stream = self.fs_bucket.open_upload_stream_with_id(
+            file_id, f"exportacion-{job_id}.{extension}",
+            metadata={"exportacion_id": job_id, "contentType": content_type}
+        )
+        writer = WRITERS[job["formato"]](LECTURA_METRICS)
+        pending = bytearray(writer.header())
+        rows = 0
+        try:
+            for index, plant_id in enumerate(job["plantas"], start=1):
+                async for times, values in self.reading_service.iter_reading_columns(
+                    plant_id, job["desde"], job["hasta"], LECTURA_METRICS
+                ):
+                    rows += len(times)
+                    pending += writer.batch(plant_id, times, values)
+                    if len(pending) >= EXPORT_CHUNK_BYTES:
+                        await stream.write(bytes(pending))
+                        pending.clear()
+                pending += writer.end_plant(plant_id)
+                await self.exports_collection.update_one(
+                    {"_id": job_id},
+                    {"$set": {"filas": rows, "progreso": index / len(job["plantas"]),
+                              "actualizado_en": datetime.utcnow()}}
+                )
+            pending += writer.footer()
+            await stream.write(bytes(pending))
+            await stream.close()
+        except asyncio.CancelledError:
+            # Apagado: el trabajo queda en curso y se rehace al arrancar
+            raise
+        except Exception as e:
+            await stream.abort()
+            await self.exports_collection.update_one(
+                {"_id": job_id},
+                {"$set": {"estado": "fallida", "error": str(e), "actualizado_en": datetime.utcnow()}}
+            )
+            raise
+
+        now = datetime.utcnow()
+        await self.exports_collection.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "estado": "completada", "progreso": 1.0, "filas": rows, "tamano": stream.length,
+                "content_type": content_type, "nombre": stream.filename,
+                "expira_en": now + timedelta(hours=EXPORT_TTL_HOURS), "actualizado_en": now
+            }}
+        )
+
+    async def expire(self, now: Optional[datetime] = None) -> int:
+        cursor = self.exports_collection.find(
+            {"estado": "completada", "expira_en": {"$lte": now or datetime.utcnow()}}, {"archivo_id": 1}
+        )
+        expired = 0
+        for job in await cursor.to_list(length=None):
+            try:
+                await self.fs_bucket.delete(job["archivo_id"])
+            except Exception as e:
+                logger.warning("No se pudo borrar el archivo de la exportación %s: %s", job["_id"], e)
+            await self.exports_collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"estado": "expirada", "actualizado_en": datetime.utcnow()}, "$unset": {"archivo_id": ""}}
+            )
+            expired += 1
+        return expired
+
+    async def cleanup_loop(self, interval: float = EXPORT_CLEANUP_INTERVAL):
+        while True:
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.warning("Error caducando exportaciones: %s", e)
+            await asyncio.sleep(interval)
+
+
+export_service = ExportService()
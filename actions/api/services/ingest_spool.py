@@ -0,0 +1,350 @@
+"""Spool local de ingesta para no perder lecturas cuando MongoDB no responde.
+
+Si una escritura de POST /readings/ o /readings/batch falla por falta de
+disponibilidad (elección del replica set, mantenimiento, red) o tarda más
+de INGEST_SPOOL_WRITE_TIMEOUT, las lecturas se añaden a un registro local
+de solo anexado y se confirman al cliente en cuanto están en disco. Un
+reproductor en segundo plano las inserta en orden, por lotes, cuando MongoDB
+vuelve; mientras quede atraso las lecturas nuevas también pasan por el spool
+para no adelantarse a las anteriores.
+
+Formato: segmentos `NNNNNNNN.seg` de hasta INGEST_SPOOL_SEGMENT_BYTES con
+registros `<longitud u32><crc32 u32><documento BSON>`. Las escrituras que
+coinciden en una vuelta del bucle se agrupan en un único fsync. El punto
+hasta el que ya se reprodujo se guarda en `cursor` (reemplazo atómico) y
+los segmentos consumidos se borran. Al arrancar se valida cada registro
+pendiente por longitud y CRC y el segmento se trunca en el primero roto
+(escritura a medias de un corte).
+
+Cada lectura recibe un `_id` al aceptarse, pero se inserta con uno nuevo
+generado al reproducirla: la sincronización incremental y la caché columnar
+avanzan por `_id` y no verían lecturas insertadas con uno antiguo. El de la
+aceptación (el que se devolvió al cliente) se guarda en `id_aceptacion`, con
+índice único, así que reproducir un lote ya aplicado solo produce duplicados
+que se omiten.
+
+Una escritura directa que vence el plazo puede haberse aplicado igualmente
+con el `_id` de la aceptación: esas lecturas se guardan con la marca
+SPOOL_UNCERTAIN y, si al reproducirlas ese `_id` ya existe, no se insertan
+de nuevo y se completan las actualizaciones posteriores (resumen, última
+lectura, cachés) que la petición no llegó a hacer.
+"""
+import asyncio
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import bson
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, WTimeoutError
+from data.db.mongo import STORAGE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR")
+INGEST_SPOOL_MAX_BYTES = int(os.getenv("INGEST_SPOOL_MAX_BYTES", str(1024 * 1024 * 1024)))
+INGEST_SPOOL_SEGMENT_BYTES = int(os.getenv("INGEST_SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+INGEST_SPOOL_WRITE_TIMEOUT = float(os.getenv("INGEST_SPOOL_WRITE_TIMEOUT", "2"))
+INGEST_SPOOL_REPLAY_BATCH = int(os.getenv("INGEST_SPOOL_REPLAY_BATCH", "1000"))
+INGEST_SPOOL_MAX_BACKOFF = float(os.getenv("INGEST_SPOOL_MAX_BACKOFF", "30"))
+
+# Fallos de disponibilidad: la lectura es válida pero MongoDB no la aceptó a tiempo
+UNAVAILABLE_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError, asyncio.TimeoutError)
+
+# Campo del registro (no llega a MongoDB): la escritura directa se intentó y pudo aplicarse
+SPOOL_UNCERTAIN = "_escritura_incierta"
+# Campo de la lectura reproducida: el `_id` con que se aceptó y se confirmó al cliente
+ACCEPTANCE_ID = "id_aceptacion"
+
+HEADER = struct.Struct("<II")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+Cursor = Tuple[int, int]
+
+
+class SpoolLlenoError(Exception):
+    """El spool alcanzó INGEST_SPOOL_MAX_BYTES pendientes de reproducir"""
+
+
+def _fsync_directory(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def scan_segment(path: str, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[bytes], int]:
+    """Registros válidos desde `offset` (hasta `limit`) y la posición tras el último"""
+    payloads = []
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while limit is None or len(payloads) < limit:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+            length, crc = HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            payloads.append(payload)
+            offset += HEADER.size + length
+    return payloads, offset
+
+
+class IngestSpool:
+    def __init__(self, directory: str, max_bytes: int = INGEST_SPOOL_MAX_BYTES,
+                 segment_bytes: int = INGEST_SPOOL_SEGMENT_BYTES,
+                 write_timeout: float = INGEST_SPOOL_WRITE_TIMEOUT,
+                 replay_batch: int = INGEST_SPOOL_REPLAY_BATCH):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.write_timeout = write_timeout
+        self.replay_batch = replay_batch
+        # Todo el acceso a disco pasa por un único hilo: anexar, leer y borrar no se pisan
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+        self._file = None
+        self._active = 0
+        self._active_size = 0
+        self._cursor: Cursor = (0, 0)
+        self._pending: List[Tuple[List[bytes], asyncio.Future]] = []
+        self._flushing: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.pending_records = 0
+        self.pending_bytes = 0
+        self.stats = {
+            "desviadas": 0, "escritas": 0, "reproducidas": 0, "rechazadas": 0,
+            "fsyncs": 0, "fallos_reproduccion": 0, "bytes_truncados": 0, "ultimo_error": None
+        }
+
+    @property
+    def backlog(self) -> bool:
+        return self.pending_records > 0
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{number:08d}{SEGMENT_SUFFIX}")
+
+    def _segments(self) -> List[int]:
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _read_cursor(self) -> Optional[Cursor]:
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as file:
+                segment, offset = file.read().split()
+            return int(segment), int(offset)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def open(self):
+        """Recupera el estado del disco: cuenta lo pendiente y trunca registros rotos"""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self._segments()
+        cursor = self._read_cursor() or ((segments[0], 0) if segments else (1, 0))
+        for number in segments:
+            path = self._path(number)
+            if number < cursor[0]:
+                # Consumido pero no borrado antes del corte
+                os.remove(path)
+                continue
+            start = cursor[1] if number == cursor[0] else 0
+            payloads, end = scan_segment(path, start)
+            size = os.path.getsize(path)
+            if end < size:
+                logger.warning("Spool: %s bytes rotos al final de %s; se trunca", size - end, path)
+                with open(path, "r+b") as file:
+                    file.truncate(end)
+                    os.fsync(file.fileno())
+                self.stats["bytes_truncados"] += size - end
+            self.pending_records += len(payloads)
+            self.pending_bytes += end - start
+        remaining = [number for number in segments if number >= cursor[0]]
+        # Las escrituras nuevas siempre empiezan segmento: nunca se anexa tras un registro roto
+        self._active = max(remaining[-1] + 1 if remaining else 0, cursor[0])
+        if cursor[0] not in remaining:
+            cursor = (remaining[0] if remaining else self._active, 0)
+        self._cursor = cursor
+        self._open_segment()
+        if self.pending_records:
+            logger.info("Spool recuperado: %s lecturas pendientes de reproducir", self.pending_records)
+
+    def _open_segment(self):
+        self._file = open(self._path(self._active), "ab")
+        self._active_size = self._file.tell()
+        _fsync_directory(self.directory)
+
+    def _rotate(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._active += 1
+        self._open_segment()
+
+    def _write(self, records: List[bytes]):
+        for record in records:
+            if self._active_size and self._active_size + len(record) > self.segment_bytes:
+                self._rotate()
+            self._file.write(record)
+            self._active_size += len(record)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @staticmethod
+    def encode(document: dict) -> bytes:
+        payload = bson.encode(document)
+        return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    async def append(self, documents: List[dict]):
+        """Guarda las lecturas en disco; vuelve cuando el fsync del grupo terminó"""
+        records = [self.encode(document) for document in documents]
+        size = sum(len(record) for record in records)
+        if self.pending_bytes + size > self.max_bytes:
+            self.stats["rechazadas"] += len(records)
+            raise SpoolLlenoError(f"Spool lleno ({self.pending_bytes} bytes pendientes)")
+        # Se cuentan antes del fsync: las escrituras siguientes ya ven el atraso
+        self.pending_records += len(records)
+        self.pending_bytes += size
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((records, future))
+        if self._flushing is None:
+            self._flushing = asyncio.ensure_future(self._flush())
+        try:
+            await future
+        except Exception:
+            self.pending_records -= len(records)
+            self.pending_bytes -= size
+            raise
+        self.stats["escritas"] += len(records)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _flush(self):
+        try:
+            # Deja que se acumulen las escrituras de esta vuelta del bucle
+            await asyncio.sleep(0)
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    await self._run(self._write, [record for records, _ in batch for record in records])
+                    self.stats["fsyncs"] += 1
+                    error = None
+                except Exception as e:
+                    logger.error("Spool: fallo al escribir en disco: %s", e)
+                    error = e
+                for _, future in batch:
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(None)
+        finally:
+            self._flushing = None
+
+    def _read_batch(self, cursor: Cursor, limit: int) -> Tuple[List[dict], Cursor, int]:
+        segment, offset = cursor
+        documents, consumed = [], 0
+        while len(documents) < limit:
+            payloads, end = scan_segment(self._path(segment), offset, limit - len(documents))
+            documents.extend(bson.decode(payload) for payload in payloads)
+            consumed += end - offset
+            offset = end
+            if len(documents) < limit and segment < self._active:
+                # Segmento agotado: el siguiente ya existe
+                segment, offset = segment + 1, 0
+                continue
+            break
+        return documents, (segment, offset), consumed
+
+    def _commit(self, cursor: Cursor):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "w") as file:
+            file.write(f"{cursor[0]} {cursor[1]}")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        for number in self._segments():
+            if number < cursor[0]:
+                os.remove(self._path(number))
+        _fsync_directory(self.directory)
+
+    async def replay_once(self, store: Callable[[List[dict]], Awaitable]) -> int:
+        """Reproduce un lote con `store`; devuelve cuántas lecturas avanzó el cursor"""
+        documents, cursor, consumed = await self._run(self._read_batch, self._cursor, self.replay_batch)
+        if not documents:
+            return 0
+        await store(documents)
+        await self._run(self._commit, cursor)
+        self._cursor = cursor
+        self.pending_records -= len(documents)
+        self.pending_bytes -= consumed
+        self.stats["reproducidas"] += len(documents)
+        return len(documents)
+
+    async def replay_loop(self, store: Callable[[List[dict]], Awaitable]):
+        self._wakeup = asyncio.Event()
+        backoff = 0.5
+        while True:
+            if not self.backlog:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            try:
+                if not await self.replay_once(store):
+                    # Lo pendiente aún está escribiéndose
+                    await asyncio.sleep(0.05)
+                backoff = 0.5
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Nada se descarta: el lote se reintenta hasta que MongoDB lo acepte
+                self.stats["fallos_reproduccion"] += 1
+                self.stats["ultimo_error"] = str(e)
+                logger.warning("Spool: reproducción fallida (reintento en %.1fs): %s", backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, INGEST_SPOOL_MAX_BACKOFF)
+
+    def note_unavailable(self, error: BaseException):
+        self.stats["desviadas"] += 1
+        self.stats["ultimo_error"] = repr(error)
+
+    def start(self, store: Callable[[List[dict]], Awaitable]):
+        self.open()
+        if self._task is None:
+            self._task = asyncio.create_task(self.replay_loop(store))
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._flushing is not None:
+            await asyncio.gather(self._flushing, return_exceptions=True)
+        if self._file is not None:
+            await self._run(self._file.close)
+            self._file = None
+
+    def report(self) -> dict:
+        return {
+            "pendientes": self.pending_records,
+            "bytes_pendientes": self.pending_bytes,
+            "limite_bytes": self.max_bytes,
+            "segmento_activo": self._active,
+            "cursor": list(self._cursor),
+            **self.stats
+        }
+
+
+# Solo con MongoDB y un directorio configurado
+ingest_spool: Optional[IngestSpool] = (
+    IngestSpool(INGEST_SPOOL_DIR) if INGEST_SPOOL_DIR and STORAGE_BACKEND == "mongo" else None
+)
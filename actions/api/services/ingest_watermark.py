@@ -0,0 +1,54 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+# Margen tras el cual un rango ya no recibe lecturas en vivo (fecha = ahora)
+HISTORY_SETTLE_SECONDS = float(os.getenv("INGEST_HISTORY_SETTLE_SECONDS", "300"))
+
+
+class IngestWatermarks:
+    """Contador por planta que avanza con cada escritura de lecturas.
+
+    Las cachés derivadas guardan la marca vigente al calcular un resultado y
+    lo descartan en cuanto la marca de alguna de sus plantas cambia.
+
+    Aparte se lleva una marca histórica que solo avanza con escrituras que
+    pueden tocar el pasado: lecturas con fecha anterior al margen de
+    asentamiento (cargas históricas, spool reproducido tras un corte) o
+    cambios sin fecha conocida (borrados). Un resultado de un rango ya
+    asentado puede validarse con ella y sobrevivir a la ingesta en vivo.
+    """
+
+    def __init__(self, settle_seconds: float = HISTORY_SETTLE_SECONDS):
+        self.settle = timedelta(seconds=settle_seconds)
+        self._marks: Dict[str, int] = {}
+        self._history: Dict[str, int] = {}
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - self.settle
+
+    def advance(self, plant_id: str, oldest: Optional[datetime] = None) -> int:
+        """`oldest` es la fecha más antigua escrita; None si puede afectar a cualquier rango"""
+        mark = self._marks.get(plant_id, 0) + 1
+        self._marks[plant_id] = mark
+        if oldest is not None and oldest.tzinfo is not None:
+            oldest = oldest.astimezone(timezone.utc).replace(tzinfo=None)
+        if oldest is None or oldest < self._cutoff():
+            self._history[plant_id] = self._history.get(plant_id, 0) + 1
+        return mark
+
+    def get(self, plant_id: str) -> int:
+        return self._marks.get(plant_id, 0)
+
+    def history(self, plant_id: str) -> int:
+        return self._history.get(plant_id, 0)
+
+    def is_settled(self, end: datetime) -> bool:
+        """True si el rango que acaba en `end` (UTC naive) ya no recibe lecturas en vivo"""
+        return end <= self._cutoff()
+
+    def snapshot(self, plant_ids: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._marks.get(plant_id, 0) for plant_id in plant_ids)
+
+
+ingest_watermarks = IngestWatermarks()
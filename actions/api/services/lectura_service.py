@@ -1,43 +1,288 @@
-from typing import List, Optional
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple
+import numpy as np
 from bson import ObjectId
 from datetime import datetime
-from data.db.mongo import db
-from actions.api.models.models import LecturaCreate, LecturaOut, LecturaUpdate
+from pymongo.errors import DuplicateKeyError
+from data.db.mongo import STORAGE_BACKEND
+from data.db.repositories import plant_repository, reading_repository
+from data.db.query_monitor import monitored_service
+from actions.api.models.models import LecturaCreate, LecturaOut, LecturaUpdate, LECTURA_METRICS
+from actions.api.services.borrado_service import deletion_service
+from actions.api.services.column_cache import column_cache, documents_to_columns
+from actions.api.services.ingest_spool import ACCEPTANCE_ID, SPOOL_UNCERTAIN, UNAVAILABLE_ERRORS, ingest_spool
+from actions.api.services.ingest_watermark import ingest_watermarks
+from actions.api.services.liveness_service import liveness_tracker
+from actions.api.services.replay_window import ReplayWindow
+from actions.api.services.resumen_service import SummaryService
+from actions.api.services.serializers import reading_serializer
+from actions.api.services.socket_manager import socket_manager
 
+COLUMN_BATCH_SIZE = 5000
+
+# Compartida por todas las instancias del servicio dentro del proceso
+replay_window = ReplayWindow()
+
+
+class LecturaDuplicadaError(Exception):
+    """La lectura (dispositivo_id, secuencia) ya fue almacenada"""
+    def __init__(self, dispositivo_id: str, secuencia: int):
+        super().__init__(f"Lectura duplicada {dispositivo_id}#{secuencia}")
+        self.dispositivo_id = dispositivo_id
+        self.secuencia = secuencia
+
+
+class PlantaEnBorradoError(Exception):
+    """La planta de la lectura está en borrado o ya se borró"""
+    def __init__(self, planta_id: str):
+        super().__init__(f"La planta {planta_id} está en borrado")
+        self.planta_id = planta_id
+
+
+def _idempotency_key(reading: LecturaCreate):
+    if reading.dispositivo_id is None or reading.secuencia is None:
+        return None
+    return reading.dispositivo_id, reading.secuencia
+
+
+@monitored_service
 class ReadingService:
     def __init__(self):
-        self.readings_collection = db["lecturas"]
-        self.plants_collection = db["plantas"]
+        self.readings = reading_repository
+        self.plants = plant_repository
+        self.replay_window = replay_window
+        self.column_cache = column_cache
+        self.spool = ingest_spool
+        self.liveness = liveness_tracker
+        self.deletions = deletion_service
+        # El resumen materializado de la flota solo existe en MongoDB
+        self.summary_service = SummaryService() if STORAGE_BACKEND == "mongo" else None
 
-    async def create_reading(self, reading: LecturaCreate) -> Optional[LecturaOut]:
+    def _to_document(self, reading: LecturaCreate, fecha: datetime) -> dict:
         db_reading = reading.dict()
-        db_reading["fecha"] = datetime.utcnow()
-        
+        db_reading["fecha"] = fecha
+        # Las lecturas sin idempotencia no guardan los campos vacíos (índice parcial)
+        if _idempotency_key(reading) is None:
+            db_reading.pop("dispositivo_id", None)
+            db_reading.pop("secuencia", None)
+        return db_reading
+
+    async def _write_or_divert(self, write: Callable[[], Awaitable]) -> Tuple[Optional[object], bool]:
+        """Ejecuta la escritura en MongoDB; devuelve (resultado, incierta).
+
+        Resultado None: hay que desviarla al spool. `incierta` indica que la
+        escritura se intentó y falló o venció el plazo, así que pudo aplicarse.
+        """
+        if self.spool is None:
+            return await write(), False
+        if self.spool.backlog:
+            # Con atraso todo pasa por el spool para no adelantarse a lo pendiente
+            return None, False
+        try:
+            return await asyncio.wait_for(write(), self.spool.write_timeout), False
+        except UNAVAILABLE_ERRORS as e:
+            self.spool.note_unavailable(e)
+            return None, True
+
+    async def _spool(self, documents: List[dict], uncertain: bool):
+        if uncertain:
+            documents = [{**doc, SPOOL_UNCERTAIN: True} for doc in documents]
+        await self.spool.append(documents)
+
+    async def create_reading(self, reading: LecturaCreate) -> Optional[LecturaOut]:
+        if reading.planta_id in self.deletions.blocked:
+            raise PlantaEnBorradoError(reading.planta_id)
+        key = _idempotency_key(reading)
+        if key and self.replay_window.seen(*key):
+            raise LecturaDuplicadaError(*key)
+
+        db_reading = self._to_document(reading, datetime.utcnow())
+        if self.spool is not None:
+            # _id propio: si la escritura directa llegó a aplicarse, reproducirla no duplica
+            db_reading["_id"] = ObjectId()
+
+        try:
+            inserted_id, uncertain = await self._write_or_divert(lambda: self.readings.insert(db_reading))
+        except DuplicateKeyError:
+            if not key:
+                raise
+            self.replay_window.mark(*key)
+            raise LecturaDuplicadaError(*key)
+        spooled = inserted_id is None
+        if spooled:
+            await self._spool([db_reading], uncertain)
+            inserted_id = db_reading["_id"]
+        if key:
+            self.replay_window.mark(*key)
+        if reading.planta_id:
+            if not spooled:
+                ingest_watermarks.advance(reading.planta_id, db_reading["fecha"])
+            # El sensor reportó aunque la lectura espere en el spool
+            self.liveness.record(reading.planta_id, db_reading["fecha"])
+            socket_manager.publish_reading(reading.planta_id, reading_serializer.to_dict(db_reading))
+
         # TODO: Verificar si la planta existe antes de crear la lectura
-        # Actualizar última lectura en la planta
-        if ObjectId.is_valid(reading.planta_id):
-            await self.plants_collection.update_one(
-                {"_id": ObjectId(reading.planta_id)},
-                {"$set": {"ultima_lectura": db_reading["fecha"]}}
-            )
-        
-        result = await self.readings_collection.insert_one(db_reading)
-        created_reading = await self.readings_collection.find_one({"_id": result.inserted_id})
-        return LecturaOut(**created_reading, id=str(created_reading["_id"]))
-
-    async def get_readings_by_plant(self, plant_id: str) -> List[LecturaOut]:
+        # Actualizar última lectura en la planta y su resumen materializado
+        # (las del spool lo hacen al reproducirse)
+        if not spooled and ObjectId.is_valid(reading.planta_id):
+            updates = [self.plants.set_last_reading([ObjectId(reading.planta_id)], db_reading["fecha"])]
+            if self.summary_service is not None:
+                updates.append(self.summary_service.record_reading(db_reading))
+            await asyncio.gather(*updates)
+
+        # insert_one no transforma el documento: la respuesta sale de él
+        return LecturaOut(**db_reading, id=str(inserted_id))
+
+    async def create_readings_batch(self, readings: List[LecturaCreate]) -> dict:
+        """Inserta un lote sin orden; los duplicados cuentan como confirmados"""
+        fecha = datetime.utcnow()
+        documents, keys = [], []
+        duplicates = rejected_plants = 0
+        batch_keys = set()
+        for reading in readings:
+            if reading.planta_id in self.deletions.blocked:
+                rejected_plants += 1
+                continue
+            key = _idempotency_key(reading)
+            if key and (key in batch_keys or self.replay_window.seen(*key)):
+                duplicates += 1
+                continue
+            if key:
+                batch_keys.add(key)
+            document = self._to_document(reading, fecha)
+            if self.spool is not None:
+                document["_id"] = ObjectId()
+            documents.append(document)
+            keys.append(key)
+
+        if not documents:
+            return {"insertadas": 0, "duplicadas": duplicates, "rechazadas": rejected_plants}
+
+        result, uncertain = await self._write_or_divert(lambda: self.readings.insert_many_unordered(documents))
+        spooled = result is None
+        if spooled:
+            await self._spool(documents, uncertain)
+            stored = documents
+        else:
+            stored, rejected = result
+            duplicates += rejected
+
+        for key in keys:
+            if key:
+                self.replay_window.mark(*key)
+
+        for doc in stored:
+            if doc.get("planta_id"):
+                if not spooled:
+                    ingest_watermarks.advance(doc["planta_id"], fecha)
+                self.liveness.record(doc["planta_id"], fecha)
+                socket_manager.publish_reading(doc["planta_id"], reading_serializer.to_dict(doc))
+        if spooled:
+            return {"insertadas": len(stored), "duplicadas": duplicates, "rechazadas": rejected_plants}
+
+        plant_ids = {
+            ObjectId(doc["planta_id"]) for doc in stored
+            if ObjectId.is_valid(doc.get("planta_id"))
+        }
+        if plant_ids:
+            updates = [self.plants.set_last_reading(plant_ids, fecha)]
+            if self.summary_service is not None:
+                updates.append(self.summary_service.record_readings(stored))
+            await asyncio.gather(*updates)
+
+        return {"insertadas": len(stored), "duplicadas": duplicates, "rechazadas": rejected_plants}
+
+    async def store_spooled(self, documents: List[dict]):
+        """Inserta un lote reproducido del spool (ya confirmado y publicado al aceptarlo).
+
+        Cada lectura se inserta con un `_id` nuevo (la sincronización avanza por
+        `_id`) y el de su aceptación en `id_aceptacion`; un duplicado de ese
+        campo (lote reproducido dos veces tras un corte) ya se aplicó y se
+        omite. Las lecturas cuya escritura directa venció el plazo pueden estar
+        ya en MongoDB con el `_id` de la aceptación: entonces no se insertan y
+        aquí se completan sus actualizaciones.
+        """
+        uncertain = [doc for doc in documents if doc.pop(SPOOL_UNCERTAIN, False)]
+        landed = []
+        if uncertain:
+            found = await asyncio.gather(*(self.readings.find_by_id(doc["_id"], {"_id": 1}) for doc in uncertain))
+            landed = [doc for doc, existing in zip(uncertain, found) if existing is not None]
+        landed_ids = {doc["_id"] for doc in landed}
+
+        pending = []
+        for doc in documents:
+            if doc["_id"] in landed_ids:
+                continue
+            doc[ACCEPTANCE_ID] = doc["_id"]
+            doc["_id"] = ObjectId()
+            pending.append(doc)
+        stored, _ = await self.readings.insert_many_unordered(pending) if pending else ([], 0)
+        applied = landed + stored
+
+        newest, oldest, oldest_ids = {}, {}, {}
+        for doc in applied:
+            plant_id = doc.get("planta_id")
+            if not plant_id:
+                continue
+            if plant_id not in newest or doc["fecha"] > newest[plant_id]:
+                newest[plant_id] = doc["fecha"]
+            if plant_id not in oldest or doc["fecha"] < oldest[plant_id]:
+                oldest[plant_id] = doc["fecha"]
+            if plant_id not in oldest_ids or doc["_id"] < oldest_ids[plant_id]:
+                oldest_ids[plant_id] = doc["_id"]
+        for plant_id, fecha in oldest.items():
+            # Tras un corte largo lo reproducido ya es historia para las cachés
+            ingest_watermarks.advance(plant_id, fecha)
+        if self.column_cache is not None:
+            # Las que llegaron con el `_id` de la aceptación pueden quedar tras la marca de la caché
+            for plant_id, oldest_id in oldest_ids.items():
+                if ObjectId.is_valid(plant_id):
+                    self.column_cache.invalidate_older(plant_id, oldest_id)
+
+        # El spool se reproduce en orden: la fecha más reciente del lote nunca retrocede
+        updates = [
+            self.plants.set_last_reading([ObjectId(plant_id)], fecha)
+            for plant_id, fecha in newest.items() if ObjectId.is_valid(plant_id)
+        ]
+        if self.summary_service is not None and applied:
+            updates.append(self.summary_service.record_history(applied))
+        await asyncio.gather(*updates)
+
+    async def get_readings_by_plant(
+        self, plant_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[dict]:
+        """Devuelve los documentos crudos; se serializan con reading_serializer"""
         if not ObjectId.is_valid(plant_id):
             return []
-        
-        readings = []
-        async for reading in self.readings_collection.find({"planta_id": plant_id}):
-            readings.append(LecturaOut(**reading, id=str(reading["_id"])))
-        return readings
 
-    async def get_reading_by_id(self, reading_id: str) -> Optional[LecturaOut]:
+        return await self.readings.find_by_plant(plant_id, reading_serializer.projection, start, end)
+
+    async def get_reading_by_id(self, reading_id: str) -> Optional[dict]:
         if not ObjectId.is_valid(reading_id):
             return None
-        reading = await self.readings_collection.find_one({"_id": ObjectId(reading_id)})
-        if not reading:
-            return None
-        return LecturaOut(**reading, id=str(reading["_id"]))
\ No newline at end of file
+        reading = await self.readings.find_by_id(ObjectId(reading_id), reading_serializer.projection)
+        if reading is None and self.spool is not None:
+            # Confirmada desde el spool: se insertó con otro `_id`
+            reading = await self.readings.find_by_acceptance_id(ObjectId(reading_id), reading_serializer.projection)
+        return reading
+
+    async def iter_reading_columns(
+        self,
+        plant_id: str,
+        start: datetime,
+        end: datetime,
+        metrics: Sequence[str] = LECTURA_METRICS,
+        batch_size: int = COLUMN_BATCH_SIZE
+    ) -> AsyncIterator[Tuple[np.ndarray, np.ndarray]]:
+        """Recorre las lecturas de [start, end) en orden temporal por lotes.
+
+        Cada lote es (tiempos en ms int64, matriz float64 n x métricas con NaN
+        donde falta el valor); la memoria queda acotada por `batch_size`. Con
+        COLUMN_CACHE_DIR configurado se sirve desde la caché columnar local.
+        """
+        if self.column_cache is not None and ObjectId.is_valid(plant_id):
+            async for batch in self.column_cache.iter_columns(plant_id, start, end, metrics, batch_size):
+                yield batch
+            return
+        async for batch in self.readings.iter_range(plant_id, start, end, metrics, batch_size):
+            yield documents_to_columns(batch, metrics)
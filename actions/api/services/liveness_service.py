@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Set
+
+from bson import ObjectId
+
+from data.db.repositories import plant_repository
+from actions.api.services.socket_manager import socket_manager
+from actions.api.services.timing_wheel import TimingWheel
+
+logger = logging.getLogger(__name__)
+
+LIVENESS_TICK_SECONDS = float(os.getenv("LIVENESS_TICK_SECONDS", "1"))
+# Intervalo esperado entre lecturas si la planta no define `intervalo_lecturas`
+LIVENESS_DEFAULT_INTERVAL = float(os.getenv("LIVENESS_DEFAULT_INTERVAL", "300"))
+# Lecturas perdidas seguidas antes de dar el sensor por silencioso
+LIVENESS_MISSED_READINGS = float(os.getenv("LIVENESS_MISSED_READINGS", "3"))
+LIVENESS_GROUP = os.getenv("LIVENESS_GROUP", "sensores")
+# Al arrancar solo se notifican los silencios que empezaron hace menos de esto
+LIVENESS_REBUILD_NOTIFY_SECONDS = float(os.getenv("LIVENESS_REBUILD_NOTIFY_SECONDS", "3600"))
+
+
+def _timestamp(fecha: datetime) -> float:
+    # Las fechas de lecturas y plantas se guardan en UTC sin zona
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.timestamp()
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class LivenessTracker:
+    """Detecta plantas cuyas sondas dejan de enviar lecturas.
+
+    Cada lectura aceptada reprograma el plazo de su planta en una rueda de
+    temporización (última lectura + intervalo esperado x lecturas perdidas):
+    refrescar y vencer cuestan O(1) y el tick periódico solo toca las plantas
+    que vencen en él, no recorre la flota. Al vencer se emite `sensor_silent`
+    al grupo LIVENESS_GROUP y con la siguiente lectura `sensor_recovered`.
+
+    El estado vive en memoria y se reconstruye al arrancar desde
+    `plantas.ultima_lectura` e `intervalo_lecturas`.
+    """
+
+    def __init__(
+        self,
+        tick_seconds: float = LIVENESS_TICK_SECONDS,
+        default_interval: float = LIVENESS_DEFAULT_INTERVAL,
+        missed_readings: float = LIVENESS_MISSED_READINGS,
+        group: str = LIVENESS_GROUP,
+        clock: Callable[[], float] = time.time
+    ):
+        self.tick_seconds = tick_seconds
+        self.default_interval = default_interval
+        self.missed_readings = missed_readings
+        self.group = group
+        self.clock = clock
+        self.plants = plant_repository
+        self.wheel = TimingWheel(self._tick(clock()))
+        self._last: Dict[str, float] = {}
+        self._intervals: Dict[str, float] = {}
+        # planta -> instante en que venció su plazo
+        self._silent: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._notifications: Set[asyncio.Task] = set()
+        self.stats = {"lecturas": 0, "silencios": 0, "recuperaciones": 0, "reprogramadas": 0}
+
+    def _tick(self, timestamp: float) -> int:
+        return math.floor(timestamp / self.tick_seconds)
+
+    def interval(self, plant_id: str) -> float:
+        return self._intervals.get(plant_id, self.default_interval)
+
+    def _deadline(self, plant_id: str) -> float:
+        return self._last[plant_id] + self.interval(plant_id) * self.missed_readings
+
+    def _schedule(self, plant_id: str):
+        self.wheel.schedule(plant_id, math.ceil(self._deadline(plant_id) / self.tick_seconds))
+
+    def _notify(self, event: str, plant_id: str):
+        message = {
+            "type": event,
+            "data": {
+                "planta_id": plant_id,
+                "ultima_lectura": _isoformat(self._last[plant_id]),
+                "intervalo_lecturas": self.interval(plant_id)
+            }
+        }
+        try:
+            task = asyncio.get_running_loop().create_task(socket_manager.broadcast_to_group(message, self.group))
+        except RuntimeError:
+            return
+        # Referencia fuerte hasta que termine el envío
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+    def record(self, plant_id: str, fecha: datetime):
+        """Refresca el plazo de la planta con una lectura; síncrono y O(1)"""
+        if not ObjectId.is_valid(plant_id):
+            return
+        timestamp = _timestamp(fecha)
+        # Lecturas atrasadas (spool, reintentos) no adelantan el plazo
+        if timestamp <= self._last.get(plant_id, -math.inf):
+            return
+        self._last[plant_id] = timestamp
+        self.stats["lecturas"] += 1
+        if self._silent.pop(plant_id, None) is not None:
+            self.stats["recuperaciones"] += 1
+            logger.info("Sensor recuperado", extra={"planta": plant_id})
+            self._notify("sensor_recovered", plant_id)
+        self._schedule(plant_id)
+
+    def set_interval(self, plant_id: str, seconds: Optional[float]):
+        """Cambia el intervalo esperado (None vuelve al de por defecto)"""
+        if seconds is None:
+            self._intervals.pop(plant_id, None)
+        else:
+            self._intervals[plant_id] = seconds
+        if plant_id in self._last and plant_id not in self._silent:
+            self._schedule(plant_id)
+
+    def forget(self, plant_id: str):
+        self.wheel.cancel(plant_id)
+        self._last.pop(plant_id, None)
+        self._intervals.pop(plant_id, None)
+        self._silent.pop(plant_id, None)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Avanza la rueda hasta `now` y marca como silenciosas las plantas vencidas"""
+        now = self.clock() if now is None else now
+        silenced = 0
+        for plant_id in self.wheel.advance(self._tick(now)):
+            deadline = self._deadline(plant_id)
+            if deadline > now:
+                # Plazo más allá del horizonte de la rueda: se vuelve a programar
+                self.stats["reprogramadas"] += 1
+                self._schedule(plant_id)
+                continue
+            self._silent[plant_id] = deadline
+            silenced += 1
+            self.stats["silencios"] += 1
+            logger.warning("Sensor sin señal", extra={"planta": plant_id, "ultima_lectura": _isoformat(self._last[plant_id])})
+            self._notify("sensor_silent", plant_id)
+        return silenced
+
+    async def rebuild(self):
+        """Carga intervalos y últimas lecturas de todas las plantas"""
+        plants = await self.plants.list({"ultima_lectura": 1, "intervalo_lecturas": 1})
+        now = self.clock()
+        for plant in plants:
+            plant_id = str(plant["_id"])
+            if plant.get("intervalo_lecturas"):
+                self._intervals[plant_id] = float(plant["intervalo_lecturas"])
+            if plant.get("ultima_lectura") is None:
+                continue
+            # Las lecturas recibidas mientras se consultaba ya están registradas
+            timestamp = max(_timestamp(plant["ultima_lectura"]), self._last.get(plant_id, -math.inf))
+            self._last[plant_id] = timestamp
+            deadline = self._deadline(plant_id)
+            if deadline > now:
+                self._schedule(plant_id)
+            elif plant_id not in self._silent:
+                self.wheel.cancel(plant_id)
+                self._silent[plant_id] = deadline
+                # Los silencios antiguos ya se notificaron antes del reinicio
+                if now - deadline <= LIVENESS_REBUILD_NOTIFY_SECONDS:
+                    self.stats["silencios"] += 1
+                    self._notify("sensor_silent", plant_id)
+        logger.info("Seguimiento de sensores reconstruido",
+                    extra={"plantas": len(self._last), "silenciosas": len(self._silent)})
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                self.expire()
+            except Exception:
+                logger.exception("Error al vencer plazos de sensores")
+
+    async def start(self):
+        if self._task is not None:
+            return
+        await self.rebuild()
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._notifications, return_exceptions=True)
+
+    def silent(self) -> list:
+        return [
+            {
+                "planta_id": plant_id,
+                "ultima_lectura": _isoformat(self._last[plant_id]),
+                "sin_senal_desde": _isoformat(deadline),
+                "intervalo_lecturas": self.interval(plant_id)
+            }
+            for plant_id, deadline in sorted(self._silent.items(), key=lambda item: item[1])
+        ]
+
+    def report(self) -> dict:
+        return {
+            "plantas": len(self._last),
+            "programadas": len(self.wheel),
+            "grupo": self.group,
+            **self.stats,
+            "silenciosas": self.silent()
+        }
+
+
+liveness_tracker = LivenessTracker()
@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_CAPACITY = int(os.getenv("WS_OUTBOX_CAPACITY", "1000"))
+OUTBOX_COLLECTION_BYTES = int(os.getenv("WS_OUTBOX_COLLECTION_BYTES", str(64 * 1024 * 1024)))
+RESTORE_LIMIT = int(os.getenv("WS_OUTBOX_RESTORE_LIMIT", "50000"))
+OUTBOX_MAX_STREAMS = int(os.getenv("WS_OUTBOX_MAX_STREAMS", "10000"))
+
+
+class Outbox:
+    """Registro acotado de eventos por canal con números de secuencia.
+
+    Cada canal (`grupo:<nombre>` o `usuario:<id>`) numera sus eventos de forma
+    consecutiva y guarda los últimos `capacity` en memoria. Opcionalmente se
+    copian en una colección capada de MongoDB para sobrevivir a reinicios y
+    cubrir huecos mayores. Un cliente que reconecta con su última secuencia
+    recibe solo lo que perdió; si el hueco ya salió del registro, debe
+    resincronizar. La `epoch` distingue numeraciones de distintas vidas del
+    servidor cuando no hay persistencia.
+
+    Se guardan como mucho `max_streams` canales; se expulsa el que lleva más
+    tiempo sin eventos. Un canal expulsado que vuelve a usarse numera por
+    encima de toda secuencia expulsada, así que quien reconecta con una
+    secuencia antigua ve un hueco y resincroniza.
+    """
+
+    def __init__(
+        self,
+        capacity: int = OUTBOX_CAPACITY,
+        serializer: Callable = json.dumps,
+        max_streams: int = OUTBOX_MAX_STREAMS
+    ):
+        self.capacity = capacity
+        self.serializer = serializer
+        self.max_streams = max_streams
+        self.epoch = uuid.uuid4().hex[:12]
+        self._streams: "OrderedDict[str, Deque[Tuple[int, str]]]" = OrderedDict()
+        self._last_seq: Dict[str, int] = {}
+        # Mayor secuencia de los canales expulsados: los canales nuevos parten de aquí
+        self._seq_floor = 0
+        self.collection = None
+        self._writes: set = set()
+
+    async def enable_persistence(self, database, name: str = "eventos_ws"):
+        """Usa (creándola si falta) una colección capada y restaura los últimos eventos"""
+        if name not in await database.list_collection_names():
+            await database.create_collection(name, capped=True, size=OUTBOX_COLLECTION_BYTES)
+            await database[name].create_index([("canal", 1), ("seq", 1)])
+        self.collection = database[name]
+        await self.restore()
+
+    async def restore(self):
+        cursor = self.collection.find({}, {"_id": 0}).sort("$natural", -1).limit(RESTORE_LIMIT)
+        events = await cursor.to_list(length=None)
+        if events:
+            # Se continúa la numeración de la vida anterior
+            self.epoch = events[0].get("epoca", self.epoch)
+        for event in reversed(events):
+            stream, seq = event["canal"], event["seq"]
+            if seq <= self._last_seq.get(stream, 0):
+                continue
+            self._buffer(stream).append((seq, event["texto"]))
+            self._last_seq[stream] = seq
+
+    def _buffer(self, stream: str) -> Deque[Tuple[int, str]]:
+        buffer = self._streams.get(stream)
+        if buffer is None:
+            buffer = self._streams[stream] = deque(maxlen=self.capacity)
+            while len(self._streams) > self.max_streams:
+                evicted, _ = self._streams.popitem(last=False)
+                self._seq_floor = max(self._seq_floor, self._last_seq.pop(evicted, 0))
+        else:
+            self._streams.move_to_end(stream)
+        return buffer
+
+    def last_seq(self, stream: str) -> int:
+        return self._last_seq.get(stream, 0)
+
+    def append(self, stream: str, message: dict) -> str:
+        """Numera el evento, lo guarda y devuelve su texto serializado"""
+        buffer = self._buffer(stream)
+        seq = self._last_seq.get(stream, self._seq_floor) + 1
+        self._last_seq[stream] = seq
+        text = self.serializer({**message, "canal": stream, "seq": seq})
+        buffer.append((seq, text))
+        if self.collection is not None:
+            write = asyncio.ensure_future(self.collection.insert_one({
+                "canal": stream, "seq": seq, "epoca": self.epoch, "texto": text, "fecha": datetime.utcnow()
+            }))
+            self._writes.add(write)
+            write.add_done_callback(self._write_done)
+        return text
+
+    def _write_done(self, write: asyncio.Future):
+        self._writes.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            logger.warning("No se pudo guardar el evento en el outbox: %s", write.exception())
+
+    def since(self, stream: str, last_seq: int) -> Optional[List[str]]:
+        """Eventos posteriores a `last_seq` en memoria; None si el hueco no está cubierto"""
+        current = self._last_seq.get(stream, 0)
+        if last_seq == current:
+            return []
+        if last_seq > current:
+            # El cliente viene de otra vida del servidor
+            return None
+        buffer = self._streams.get(stream)
+        if not buffer or buffer[0][0] > last_seq + 1:
+            return None
+        # Las secuencias son consecutivas: el desplazamiento es directo
+        start = last_seq + 1 - buffer[0][0]
+        return [text for _, text in itertools.islice(buffer, start, None)]
+
+    async def replay(self, stream: str, last_seq: int) -> Optional[List[str]]:
+        events = self.since(stream, last_seq)
+        if events is not None or self.collection is None:
+            return events
+        current = self._last_seq.get(stream, 0)
+        if last_seq > current:
+            return None
+        cursor = self.collection.find(
+            {"canal": stream, "seq": {"$gt": last_seq, "$lte": current}}, {"_id": 0, "seq": 1, "texto": 1}
+        ).sort("seq", 1)
+        stored = await cursor.to_list(length=None)
+        if not stored or stored[0]["seq"] != last_seq + 1 or len(stored) != current - last_seq:
+            return None
+        return [event["texto"] for event in stored]
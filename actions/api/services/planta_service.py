@@ -1,34 +1,40 @@
 from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime
-from data.db.mongo import db
+from data.db.repositories import plant_repository, reading_repository
+from data.db.query_monitor import monitored_service
 from actions.api.models.models import PlantaCreate, PlantaOut, PlantaUpdate
+from actions.api.services.ingest_watermark import ingest_watermarks
+from actions.api.services.liveness_service import liveness_tracker
+from actions.api.services.serializers import plant_serializer
 
+@monitored_service
 class PlantService:
     def __init__(self):
-        self.plants_collection = db["plantas"]
+        self.plants = plant_repository
+        self.readings = reading_repository
+        self.liveness = liveness_tracker
 
     async def create_plant(self, plant: PlantaCreate) -> Optional[PlantaOut]:
         db_plant = plant.dict()
         db_plant["creado_en"] = datetime.utcnow()
+        # Marca usada por la sincronización incremental
+        db_plant["actualizado_en"] = db_plant["creado_en"]
         
-        result = await self.plants_collection.insert_one(db_plant)
-        created_plant = await self.plants_collection.find_one({"_id": result.inserted_id})
-        return PlantaOut(**created_plant, id=str(created_plant["_id"]))
+        plant_id = await self.plants.insert(db_plant)
+        self.liveness.set_interval(str(plant_id), plant.intervalo_lecturas)
+        return PlantaOut(**db_plant, id=str(plant_id))
 
-    async def get_plant_by_id(self, plant_id: str) -> Optional[PlantaOut]:
+    async def get_plant_by_id(self, plant_id: str) -> Optional[dict]:
+        """Devuelve el documento crudo; se serializa con plant_serializer"""
         if not ObjectId.is_valid(plant_id):
             return None
-        plant = await self.plants_collection.find_one({"_id": ObjectId(plant_id)})
-        if not plant:
-            return None
-        return PlantaOut(**plant, id=str(plant["_id"]))
+        return await self.plants.find_by_id(ObjectId(plant_id), plant_serializer.projection)
 
-    async def list_plants(self) -> List[PlantaOut]:
-        plants = []
-        async for plant in self.plants_collection.find():
-            plants.append(PlantaOut(**plant, id=str(plant["_id"])))
-        return plants
+    async def list_plants(self) -> List[dict]:
+        plants = await self.plants.list(plant_serializer.projection)
+        # Las plantas en borrado solo se consultan por id (para ver su estado)
+        return [plant for plant in plants if not plant.get("pendiente_borrado")]
 
     async def update_plant(self, plant_id: str, plant_data: PlantaUpdate) -> Optional[PlantaOut]:
         if not ObjectId.is_valid(plant_id):
@@ -38,19 +44,26 @@ class PlantService:
         
         if not update_data:
             return None
+        update_data["actualizado_en"] = datetime.utcnow()
         
-        result = await self.plants_collection.update_one(
-            {"_id": ObjectId(plant_id)},
-            {"$set": update_data}
-        )
+        updated_plant = await self.plants.update(ObjectId(plant_id), update_data)
         
-        if result.modified_count == 1:
-            updated_plant = await self.plants_collection.find_one({"_id": ObjectId(plant_id)})
+        if updated_plant:
+            if "intervalo_lecturas" in update_data:
+                self.liveness.set_interval(plant_id, update_data["intervalo_lecturas"])
             return PlantaOut(**updated_plant, id=str(updated_plant["_id"]))
         return None
 
     async def delete_plant(self, plant_id: str) -> bool:
         if not ObjectId.is_valid(plant_id):
             return False
-        result = await self.plants_collection.delete_one({"_id": ObjectId(plant_id)})
-        return result.deleted_count == 1
\ No newline at end of file
+        self.liveness.forget(plant_id)
+        return await self.plants.delete(ObjectId(plant_id))
+
+    async def delete_plant_and_readings(self, plant_id: str) -> bool:
+        """Borrado inmediato en cascada (sin MongoDB no hay trabajos de borrado en segundo plano)"""
+        if not await self.delete_plant(plant_id):
+            return False
+        await self.readings.delete_by_plant(plant_id)
+        ingest_watermarks.advance(plant_id)
+        return True
\ No newline at end of file
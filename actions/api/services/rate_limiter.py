@@ -0,0 +1,239 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+
+from actions.api.models.models import Role
+
+load_dotenv()
+
+ANONYMOUS = "anonimo"
+
+# Proxies inversos cuya cabecera X-Forwarded-For se acepta (IPs separadas por comas)
+TRUSTED_PROXIES = {ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "").split(",") if ip.strip()}
+# Dispositivos anónimos con cubo propio por IP; el resto comparte el de la IP
+RATE_LIMIT_DEVICES_PER_IP = int(os.getenv("RATE_LIMIT_DEVICES_PER_IP", "32"))
+
+# (tokens por segundo, ráfaga máxima); configurable como RATE_LIMIT_<ROL>="tasa:rafaga"
+DEFAULT_LIMITS = {
+    ANONYMOUS: (5.0, 20.0),
+    Role.AGRIC.value: (10.0, 50.0),
+    Role.INVES.value: (20.0, 100.0),
+    Role.ADMIN.value: (50.0, 200.0),
+}
+
+
+def _parse_limit(value: Optional[str], default: Tuple[float, float]) -> Tuple[float, float]:
+    if not value:
+        return default
+    rate, _, burst = value.partition(":")
+    rate, burst = float(rate), float(burst or rate)
+    # Con tasa 0 un cubo vacío no se recargaría nunca (y el tiempo de espera sería infinito)
+    if not rate > 0 or burst < 1:
+        raise ValueError(f"Límite inválido '{value}': la tasa debe ser > 0 y la ráfaga >= 1")
+    return rate, burst
+
+
+def load_role_limits() -> Dict[str, Tuple[float, float]]:
+    return {
+        ANONYMOUS: _parse_limit(os.getenv("RATE_LIMIT_ANONIMO"), DEFAULT_LIMITS[ANONYMOUS]),
+        Role.AGRIC.value: _parse_limit(os.getenv("RATE_LIMIT_AGRIC"), DEFAULT_LIMITS[Role.AGRIC.value]),
+        Role.INVES.value: _parse_limit(os.getenv("RATE_LIMIT_INVES"), DEFAULT_LIMITS[Role.INVES.value]),
+        Role.ADMIN.value: _parse_limit(os.getenv("RATE_LIMIT_ADMIN"), DEFAULT_LIMITS[Role.ADMIN.value]),
+    }
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Consume un token; devuelve 0 o los segundos a esperar"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Limita las peticiones en curso de un ámbito y la tasa por llamante"""
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        limits: Dict[str, Tuple[float, float]],
+        max_keys: int = 50000
+    ):
+        self.max_in_flight = max_in_flight
+        self.limits = limits
+        self.max_keys = max_keys
+        self.in_flight = 0
+        self.rejected = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def try_acquire(self, key: str, role: str, now: Optional[float] = None) -> float:
+        """Admite la petición (devuelve 0) o los segundos para reintentar"""
+        if now is None:
+            now = time.monotonic()
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            return 1.0
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate, burst = self.limits.get(role, self.limits[ANONYMOUS])
+            bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        wait = bucket.take(now)
+        if wait:
+            self.rejected += 1
+            return wait
+        self.in_flight += 1
+        return 0.0
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+
+class DeviceRegistry:
+    """Dispositivos anónimos vistos por IP, como mucho `per_ip` en cada una.
+
+    Una IP no libera sus plazas aunque cambie de dispositivos: rotar
+    `X-Device-Id` solo da `per_ip` cubos. Se olvidan las IPs menos recientes
+    por encima de `max_ips`.
+    """
+
+    def __init__(self, per_ip: int = RATE_LIMIT_DEVICES_PER_IP, max_ips: int = 50000):
+        self.per_ip = per_ip
+        self.max_ips = max_ips
+        self._devices: "OrderedDict[str, Set[str]]" = OrderedDict()
+
+    def admit(self, ip: str, device_id: str) -> bool:
+        devices = self._devices.get(ip)
+        if devices is None:
+            devices = self._devices[ip] = set()
+            if len(self._devices) > self.max_ips:
+                self._devices.popitem(last=False)
+        else:
+            self._devices.move_to_end(ip)
+        if device_id in devices:
+            return True
+        if len(devices) >= self.per_ip:
+            return False
+        devices.add(device_id)
+        return True
+
+
+_anonymous_devices = DeviceRegistry()
+
+
+def client_ip(request: Request) -> str:
+    """IP del cliente; detrás de un proxy de TRUSTED_PROXIES, la de X-Forwarded-For"""
+    host = request.client.host if request.client else "desconocido"
+    if host in TRUSTED_PROXIES:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # Desde el final: el primer salto que no es un proxy propio es el cliente
+            for hop in reversed(forwarded.split(",")):
+                hop = hop.strip()
+                if hop and hop not in TRUSTED_PROXIES:
+                    return hop
+    return host
+
+
+# token -> (clave, rol, exp); una entrada no sobrevive a la caducidad del token
+_token_cache: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+_TOKEN_CACHE_SIZE = 4096
+
+
+def _token_identity(token: str) -> Optional[Tuple[str, str]]:
+    """Decodifica (y memoriza hasta su `exp`) el sujeto y rol del JWT sin consultar la BD"""
+    cached = _token_cache.get(token)
+    if cached is not None:
+        if time.time() < cached[2]:
+            return cached[:2]
+        del _token_cache[token]
+    try:
+        payload = jwt.decode(token, os.getenv("SECRET_KEY"), algorithms=["HS256"])
+    except JWTError:
+        return None
+    identity = (f"user:{payload.get('sub')}", payload.get("role") or ANONYMOUS)
+    # Sin `exp` el token no caduca: se revalida igualmente de vez en cuando
+    expires = float(payload.get("exp") or time.time() + 300)
+    _token_cache[token] = (*identity, expires)
+    if len(_token_cache) > _TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return identity
+
+
+def identify_caller(request: Request) -> Tuple[str, str]:
+    """Clave de limitación: usuario del token o IP del cliente, más su dispositivo.
+
+    La ingesta de lecturas no exige token: los gateways de un mismo sitio (o
+    detrás de un NAT o proxy) comparten IP y se separan por `X-Device-Id`.
+    Sin token solo RATE_LIMIT_DEVICES_PER_IP dispositivos por IP tienen cubo
+    propio, porque cambiar el dispositivo en cada petición daría uno nuevo
+    cada vez; los demás comparten el de la IP. Con token no hay tope.
+    """
+    authorization = request.headers.get("authorization")
+    identity = None
+    if authorization and authorization[:7].lower() == "bearer ":
+        identity = _token_identity(authorization[7:])
+    device_id = request.headers.get("x-device-id")
+    device_id = device_id[:64] if device_id else None
+    if identity:
+        if device_id:
+            return f"{identity[0]}/device:{device_id}", identity[1]
+        return identity
+    ip = client_ip(request)
+    if device_id and _anonymous_devices.admit(ip, device_id):
+        return f"ip:{ip}/device:{device_id}", ANONYMOUS
+    return f"ip:{ip}", ANONYMOUS
+
+
+readings_admission = AdmissionController(
+    max_in_flight=int(os.getenv("MAX_IN_FLIGHT_READINGS", "256")),
+    limits=load_role_limits()
+)
+# El login hace bcrypt: se limita por IP y con menos concurrencia
+auth_admission = AdmissionController(
+    max_in_flight=int(os.getenv("MAX_IN_FLIGHT_AUTH", "32")),
+    limits={ANONYMOUS: _parse_limit(os.getenv("RATE_LIMIT_AUTH"), (1.0, 10.0))}
+)
+
+
+def admission_control(controller: AdmissionController, by_ip: bool = False):
+    """Factory de dependencias que aplica el control de admisión"""
+    async def dependency(request: Request):
+        if by_ip:
+            key, role = f"ip:{client_ip(request)}", ANONYMOUS
+        else:
+            key, role = identify_caller(request)
+        wait = controller.try_acquire(key, role)
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Demasiadas solicitudes, intente más tarde",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+        try:
+            yield
+        finally:
+            controller.release()
+    return dependency
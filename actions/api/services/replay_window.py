@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from typing import Tuple
+
+
+class ReplayWindow:
+    """Ventana anti-repetición por dispositivo.
+
+    Guarda para cada dispositivo la secuencia más alta vista (marca de agua) y
+    un bitmap de las últimas `size` secuencias. Solo responde "ya vista" cuando
+    está seguro; las secuencias fuera de la ventana las resuelve el índice único
+    de MongoDB.
+    """
+
+    def __init__(self, size: int = 64, max_devices: int = 10000):
+        self.size = size
+        self.max_devices = max_devices
+        self._mask = (1 << size) - 1
+        self._devices: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+
+    def seen(self, device_id: str, seq: int) -> bool:
+        state = self._devices.get(device_id)
+        if state is None:
+            return False
+        high, bits = state
+        offset = high - seq
+        if offset < 0 or offset >= self.size:
+            return False
+        return bool((bits >> offset) & 1)
+
+    def mark(self, device_id: str, seq: int) -> None:
+        state = self._devices.get(device_id)
+        if state is None:
+            high, bits = seq, 1
+        else:
+            high, bits = state
+            if seq > high:
+                bits = ((bits << (seq - high)) | 1) & self._mask
+                high = seq
+            elif high - seq < self.size:
+                bits |= 1 << (high - seq)
+        self._devices[device_id] = (high, bits)
+        self._devices.move_to_end(device_id)
+        if len(self._devices) > self.max_devices:
+            self._devices.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._devices)
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence
+
+import numpy as np
+
+from actions.api.models.models import LECTURA_METRICS
+from actions.api.services.lectura_service import ReadingService
+
+RESAMPLE_METHODS = ("mean", "last", "linear")
+MAX_BINS = 200000
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Mongo guarda fechas UTC sin zona: normaliza las que vienen con zona"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class GridAccumulator:
+    """Acumula lotes ordenados por tiempo sobre una rejilla regular.
+
+    La memoria depende del número de celdas (rango / paso) y no del número
+    de lecturas: cada lote se reduce por celda con `np.add.reduceat`.
+    """
+
+    def __init__(self, start_ms: int, step_ms: int, bins: int, columns: int):
+        self.start_ms = start_ms
+        self.step_ms = step_ms
+        self.bins = bins
+        self.sums = np.zeros((bins, columns))
+        self.counts = np.zeros((bins, columns), dtype=np.int64)
+        self.last = np.full((bins, columns), np.nan)
+
+    def add(self, times: np.ndarray, values: np.ndarray):
+        if not len(times):
+            return
+        idx = (times - self.start_ms) // self.step_ms
+        inside = (idx >= 0) & (idx < self.bins)
+        if not inside.all():
+            idx, values = idx[inside], values[inside]
+            if not len(idx):
+                return
+        n, columns = values.shape
+        # Las lecturas vienen ordenadas: cada celda es un tramo contiguo
+        starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        cells = idx[starts]
+
+        valid = ~np.isnan(values)
+        self.sums[cells] += np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+        self.counts[cells] += np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+
+        # Última posición válida hasta cada fila; vale si cae dentro de la celda
+        positions = np.maximum.accumulate(np.where(valid, np.arange(n)[:, None], -1), axis=0)
+        last_pos = positions[ends]
+        found = last_pos >= starts[:, None]
+        last_values = values[np.clip(last_pos, 0, None), np.arange(columns)]
+        self.last[cells] = np.where(found, last_values, self.last[cells])
+
+    @property
+    def coverage(self) -> np.ndarray:
+        return self.counts > 0
+
+    def mean(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.coverage, self.sums / np.maximum(self.counts, 1), np.nan)
+
+    def result(self, method: str, max_gap_bins: Optional[int]) -> np.ndarray:
+        if method == "mean":
+            return self.mean()
+        if method == "last":
+            return _hold(self.last, self.coverage, max_gap_bins)
+        return _interpolate(self.mean(), self.coverage, max_gap_bins)
+
+
+def _gap_bounds(known: np.ndarray):
+    """Índice de la celda conocida anterior y siguiente para cada celda (2-D)"""
+    bins = known.shape[0]
+    index = np.arange(bins)[:, None]
+    previous = np.maximum.accumulate(np.where(known, index, -1), axis=0)
+    following = np.minimum.accumulate(np.where(known, index, bins)[::-1], axis=0)[::-1]
+    return previous, following
+
+
+def _hold(values: np.ndarray, known: np.ndarray, max_gap_bins: Optional[int]) -> np.ndarray:
+    """Mantiene el último valor hacia adelante hasta `max_gap_bins` celdas"""
+    previous, _ = _gap_bounds(known)
+    index = np.arange(values.shape[0])[:, None]
+    fill = (~known) & (previous >= 0)
+    if max_gap_bins is not None:
+        fill &= (index - previous) <= max_gap_bins
+    out = values.copy()
+    rows, cols = np.nonzero(fill)
+    out[rows, cols] = values[previous[rows, cols], cols]
+    return out
+
+
+def _interpolate(values: np.ndarray, known: np.ndarray, max_gap_bins: Optional[int]) -> np.ndarray:
+    """Interpolación lineal de los huecos interiores no mayores que `max_gap_bins`"""
+    bins = values.shape[0]
+    previous, following = _gap_bounds(known)
+    fill = (~known) & (previous >= 0) & (following < bins)
+    if max_gap_bins is not None:
+        fill &= (following - previous) <= max_gap_bins
+    out = values.copy()
+    rows, cols = np.nonzero(fill)
+    if len(rows):
+        before, after = previous[rows, cols], following[rows, cols]
+        weight = (rows - before) / (after - before)
+        out[rows, cols] = values[before, cols] + weight * (values[after, cols] - values[before, cols])
+    return out
+
+
+class ResampleService:
+    def __init__(self):
+        self.reading_service = ReadingService()
+
+    async def resample(
+        self,
+        plant_id: str,
+        start: datetime,
+        end: datetime,
+        step_seconds: float,
+        method: str = "mean",
+        max_gap_seconds: Optional[float] = None,
+        metrics: Sequence[str] = LECTURA_METRICS
+    ) -> dict:
+        if method not in RESAMPLE_METHODS:
+            raise ValueError(f"Método inválido, use uno de {RESAMPLE_METHODS}")
+        start, end = naive_utc(start), naive_utc(end)
+        step_ms = int(step_seconds * 1000)
+        if step_ms <= 0 or end <= start:
+            raise ValueError("Rango o paso inválido")
+        start_ms = int(np.datetime64(start, "ms").astype(np.int64))
+        bins = -(-int((end - start) / timedelta(milliseconds=1)) // step_ms)
+        if bins > MAX_BINS:
+            raise ValueError(f"La rejilla excede {MAX_BINS} celdas; aumente el paso")
+
+        grid = GridAccumulator(start_ms, step_ms, bins, len(metrics))
+        async for times, values in self.reading_service.iter_reading_columns(plant_id, start, end, metrics):
+            grid.add(times, values)
+
+        max_gap_bins = None if max_gap_seconds is None else int(max_gap_seconds * 1000 // step_ms)
+        # Filas contiguas por métrica (orjson serializa arrays C-contiguos)
+        values = np.ascontiguousarray(grid.result(method, max_gap_bins).T)
+        coverage = np.ascontiguousarray(grid.coverage.T)
+        return {
+            "planta_id": plant_id,
+            "inicio": start,
+            "paso_segundos": step_seconds,
+            "metodo": method,
+            "tiempos": start_ms + step_ms * np.arange(bins, dtype=np.int64),
+            "metricas": {name: values[i] for i, name in enumerate(metrics)},
+            "cobertura": {name: coverage[i] for i, name in enumerate(metrics)}
+        }
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from actions.api.services.ingest_watermark import IngestWatermarks, ingest_watermarks
+
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Un resultado mayor que esta fracción del total no se guarda (vaciaría la caché)
+RESULT_CACHE_MAX_ENTRY_FRACTION = 8
+# Las marcas de ingesta solo ven las escrituras de este proceso: lo que escriban
+# otros workers, cargas externas o borrados en otro proceso aparece como mucho tras este plazo
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "60"))
+
+
+class ResultCache:
+    """Caché compartida de respuestas ya serializadas (bytes JSON) por planta.
+
+    La clave describe la consulta completa (tipo, planta, rango, parámetros y
+    formato) y el valor es el cuerpo listo para enviar, así que un acierto no
+    toca MongoDB ni vuelve a serializar. Las peticiones idénticas que llegan
+    mientras se calcula una esperan ese mismo cálculo en lugar de lanzar otra
+    consulta. Cada entrada guarda la marca de ingesta de su planta: la normal
+    si el rango sigue abierto (sin fin o con fin reciente) y la histórica si
+    ya está asentado, de modo que la ingesta en vivo no invalida consultas de
+    días pasados. Una entrada con más de `ttl` segundos cuenta como fallo
+    aunque su marca coincida (la marca es del proceso y no ve otros workers).
+    Se expulsa por LRU al superar `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        watermarks: IngestWatermarks = ingest_watermarks,
+        ttl: float = RESULT_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_bytes = max_bytes
+        self.watermarks = watermarks
+        self.ttl = ttl
+        self.clock = clock
+        # clave -> (marca, instante de inserción, cuerpo)
+        self._entries: "OrderedDict[Hashable, Tuple[tuple, float, bytes]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Tuple[tuple, asyncio.Future]] = {}
+        self.size = 0
+        self.stats = {"aciertos": 0, "fallos": 0, "compartidas": 0, "invalidadas": 0, "caducadas": 0, "expulsadas": 0}
+
+    def _mark(self, plant_id: str, end: Optional[datetime]) -> tuple:
+        if end is not None and self.watermarks.is_settled(end):
+            return "historica", self.watermarks.history(plant_id)
+        return "ingesta", self.watermarks.get(plant_id)
+
+    def _drop(self, key: Hashable):
+        _, _, body = self._entries.pop(key)
+        self.size -= len(body)
+
+    def _store(self, key: Hashable, mark: tuple, body: bytes):
+        if len(body) > self.max_bytes // RESULT_CACHE_MAX_ENTRY_FRACTION:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (mark, self.clock(), body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats["expulsadas"] += 1
+
+    async def _fill(self, key: Hashable, mark: tuple, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            body = await compute()
+        finally:
+            if self._inflight.get(key, (None, None))[1] is asyncio.current_task():
+                del self._inflight[key]
+        # Si hubo escrituras durante el cálculo la marca ya no coincide y se recalculará
+        self._store(key, mark, body)
+        return body
+
+    async def get_or_compute(
+        self, key: Hashable, plant_id: str, end: Optional[datetime], compute: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        """Cuerpo en caché para `key` o el resultado de `compute()` (una sola vez por ráfaga)"""
+        mark = self._mark(plant_id, end)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expired = self.clock() - entry[1] >= self.ttl
+            if entry[0] == mark and not expired:
+                self._entries.move_to_end(key)
+                self.stats["aciertos"] += 1
+                return entry[2]
+            self._drop(key)
+            self.stats["caducadas" if expired else "invalidadas"] += 1
+
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] == mark:
+            self.stats["compartidas"] += 1
+            return await asyncio.shield(inflight[1])
+
+        self.stats["fallos"] += 1
+        # Tarea propia: si quien la lanzó se desconecta, las demás esperas siguen
+        task = asyncio.ensure_future(self._fill(key, mark, compute))
+        self._inflight[key] = (mark, task)
+        return await asyncio.shield(task)
+
+    def report(self) -> dict:
+        return {"entradas": len(self._entries), "bytes": self.size, "limite_bytes": self.max_bytes, **self.stats}
+
+
+result_cache = ResultCache()
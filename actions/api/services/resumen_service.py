@@ -0,0 +1,191 @@
+import asyncio
+import calendar
+import logging
+import os
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from data.db.mongo import db
+from data.db.query_monitor import monitored_service
+from actions.api.models.models import LECTURA_METRICS as METRICS
+
+logger = logging.getLogger(__name__)
+
+WINDOW_HOURS = 24
+COMPACTION_INTERVAL = float(os.getenv("RESUMEN_COMPACTION_INTERVAL", "600"))
+
+
+def _hour(fecha: datetime) -> int:
+    """Hora (época UTC) a la que pertenece la fecha"""
+    return calendar.timegm(fecha.utctimetuple()) // 3600
+
+
+@monitored_service
+class SummaryService:
+    """Vista materializada por planta: última lectura y agregados horarios.
+
+    Cada lectura actualiza el documento de su planta en `resumen_plantas` con
+    `$set` (última lectura), `$min`/`$max` e `$inc` sobre el cubo de su hora.
+    La ventana de 24 h se calcula combinando los cubos vigentes; la compactación
+    periódica elimina los cubos que ya salieron de la ventana.
+    """
+
+    def __init__(self):
+        self.summary_collection = db["resumen_plantas"]
+        self.plants_collection = db["plantas"]
+
+    @staticmethod
+    def _last_reading(reading: dict) -> dict:
+        last = {name: reading.get(name) for name in METRICS}
+        last["fecha"] = reading["fecha"]
+        return last
+
+    def _update_for(self, reading: dict, set_last: bool = True):
+        plant_id = reading.get("planta_id")
+        if not ObjectId.is_valid(plant_id):
+            return None
+        fecha = reading["fecha"]
+        bucket = f"horas.{_hour(fecha)}"
+        update = {
+            "$set": {"ultima_lectura": self._last_reading(reading)},
+            "$max": {"ultima_fecha": fecha},
+            "$inc": {f"{bucket}.n": 1},
+            "$min": {}
+        }
+        if not set_last:
+            del update["$set"]
+            del update["$max"]["ultima_fecha"]
+        for name in METRICS:
+            value = reading.get(name)
+            if value is None:
+                continue
+            update["$min"][f"{bucket}.{name}.min"] = value
+            update["$max"][f"{bucket}.{name}.max"] = value
+            update["$inc"][f"{bucket}.{name}.suma"] = value
+            update["$inc"][f"{bucket}.{name}.n"] = 1
+        for operator in ("$min", "$max"):
+            if not update[operator]:
+                del update[operator]
+        return {"_id": ObjectId(plant_id)}, update
+
+    async def record_reading(self, reading: dict):
+        operation = self._update_for(reading)
+        if operation:
+            await self.summary_collection.update_one(*operation, upsert=True)
+
+    async def record_readings(self, readings: Iterable[dict]):
+        operations = [
+            UpdateOne(*operation, upsert=True)
+            for operation in map(self._update_for, readings) if operation
+        ]
+        if operations:
+            await self.summary_collection.bulk_write(operations, ordered=False)
+
+    async def record_history(self, readings: List[dict], now: Optional[datetime] = None):
+        """Registra lecturas históricas sin retroceder la última lectura.
+
+        Solo las lecturas dentro de la ventana alimentan los cubos horarios; la
+        última lectura de cada planta se reemplaza únicamente si la nueva es
+        posterior a la almacenada.
+        """
+        cutoff = _hour(now or datetime.utcnow()) - WINDOW_HOURS + 1
+        operations = [
+            UpdateOne(*operation, upsert=True)
+            for operation in (
+                self._update_for(reading, set_last=False)
+                for reading in readings if _hour(reading["fecha"]) >= cutoff
+            ) if operation
+        ]
+
+        newest = {}
+        for reading in readings:
+            plant_id = reading.get("planta_id")
+            if ObjectId.is_valid(plant_id) and (plant_id not in newest or reading["fecha"] > newest[plant_id]["fecha"]):
+                newest[plant_id] = reading
+        for plant_id, reading in newest.items():
+            last = {"ultima_lectura": self._last_reading(reading), "ultima_fecha": reading["fecha"]}
+            # Sin upsert el filtro condicional no crea duplicados; si el
+            # documento no existe, $setOnInsert lo crea con esta lectura.
+            # Ambas operaciones convergen en cualquier orden del lote
+            operations.append(UpdateOne(
+                {"_id": ObjectId(plant_id), "$or": [
+                    {"ultima_fecha": {"$lt": reading["fecha"]}},
+                    {"ultima_fecha": {"$exists": False}}
+                ]},
+                {"$set": last}
+            ))
+            operations.append(UpdateOne({"_id": ObjectId(plant_id)}, {"$setOnInsert": last}, upsert=True))
+        if operations:
+            await self.summary_collection.bulk_write(operations, ordered=False)
+
+    async def compact(self, now: Optional[datetime] = None):
+        """Elimina (en el servidor) los cubos horarios fuera de la ventana"""
+        cutoff = _hour(now or datetime.utcnow()) - WINDOW_HOURS + 1
+        result = await self.summary_collection.update_many({}, [
+            {"$set": {"horas": {"$arrayToObject": {"$filter": {
+                "input": {"$objectToArray": {"$ifNull": ["$horas", {}]}},
+                "cond": {"$gte": [{"$toLong": "$$this.k"}, cutoff]}
+            }}}}}
+        ])
+        return result.modified_count
+
+    async def compaction_loop(self, interval: float = COMPACTION_INTERVAL):
+        while True:
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.warning("Error compactando resumen de plantas: %s", e)
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def window_stats(hours: dict, now: datetime) -> dict:
+        """Combina los cubos de las últimas 24 h en min/max/promedio por métrica"""
+        cutoff = _hour(now) - WINDOW_HOURS + 1
+        total = 0
+        stats = {}
+        for key, bucket in (hours or {}).items():
+            if int(key) < cutoff:
+                continue
+            total += bucket.get("n", 0)
+            for name in METRICS:
+                values = bucket.get(name)
+                if not values:
+                    continue
+                current = stats.setdefault(name, {"min": values["min"], "max": values["max"], "suma": 0.0, "n": 0})
+                current["min"] = min(current["min"], values["min"])
+                current["max"] = max(current["max"], values["max"])
+                current["suma"] += values["suma"]
+                current["n"] += values["n"]
+        metrics = {
+            name: {"min": s["min"], "max": s["max"], "promedio": s["suma"] / s["n"]}
+            for name, s in stats.items() if s["n"]
+        }
+        return {"lecturas": total, "metricas": metrics}
+
+    async def fleet_overview(self) -> List[dict]:
+        """Todas las plantas con su resumen en una sola consulta ($lookup por _id)"""
+        now = datetime.utcnow()
+        pipeline = [
+            {"$match": {"pendiente_borrado": {"$ne": True}}},
+            {"$project": {"nombre": 1, "especie": 1, "ubicacion": 1}},
+            {"$lookup": {
+                "from": self.summary_collection.name,
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "resumen"
+            }}
+        ]
+        overview = []
+        async for plant in self.plants_collection.aggregate(pipeline):
+            summary = plant["resumen"][0] if plant["resumen"] else {}
+            overview.append({
+                "id": str(plant["_id"]),
+                "nombre": plant.get("nombre"),
+                "especie": plant.get("especie"),
+                "ubicacion": plant.get("ubicacion"),
+                "ultima_lectura": summary.get("ultima_lectura"),
+                "ventana_24h": self.window_stats(summary.get("horas"), now)
+            })
+        return overview
@@ -0,0 +1,114 @@
+import gzip
+import typing
+from typing import Any, Iterable, List, Optional, Tuple, Type, Union
+
+import orjson
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+from actions.api.models.models import LecturaOut, PlantaOut, UserOut
+from actions.api.tracing import span
+
+try:  # zstd es opcional: si no está instalado se usa gzip
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY
+
+
+class RawJSONResponse(Response):
+    """Respuesta con el cuerpo ya serializado a bytes JSON"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        with span("serializacion"):
+            return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def _is_float_field(annotation: Any) -> bool:
+    if annotation is float:
+        return True
+    return typing.get_origin(annotation) is Union and float in typing.get_args(annotation)
+
+
+class DocumentSerializer:
+    """Convierte documentos BSON en JSON con el mismo esquema que el modelo Pydantic.
+
+    Evita construir un modelo por fila: renombra `_id` a `id`, convierte a float
+    los campos numéricos y omite los campos que el modelo no expone.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.fields = []
+        for name, info in model.model_fields.items():
+            if info.default_factory is not None:
+                default, factory = None, info.default_factory
+            else:
+                default = None if info.default is PydanticUndefined else info.default
+                factory = None
+            self.fields.append((name, _is_float_field(info.annotation), default, factory))
+        # Proyección para Mongo: solo lo que se va a devolver (+ _id)
+        self.projection = {name: 1 for name, *_ in self.fields if name != "id"}
+
+    def to_dict(self, document: dict) -> dict:
+        out = {}
+        for name, is_float, default, factory in self.fields:
+            if name == "id":
+                out["id"] = str(document["_id"])
+                continue
+            if name in document:
+                value = document[name]
+                if is_float and type(value) is int:
+                    value = float(value)
+            else:
+                value = factory() if factory else default
+            out[name] = value
+        return out
+
+    def dumps(self, document: dict) -> bytes:
+        return orjson.dumps(self.to_dict(document), option=ORJSON_OPTIONS)
+
+    def dumps_many(self, documents: Iterable[dict]) -> bytes:
+        return orjson.dumps([self.to_dict(doc) for doc in documents], option=ORJSON_OPTIONS)
+
+
+reading_serializer = DocumentSerializer(LecturaOut)
+plant_serializer = DocumentSerializer(PlantaOut)
+user_serializer = DocumentSerializer(UserOut)
+
+
+def fast_json_response(
+    data: Union[dict, BaseModel, List[Union[dict, BaseModel]]],
+    serializer: DocumentSerializer,
+    status_code: int = 200
+) -> RawJSONResponse:
+    """Serializa documentos crudos por la vía rápida; acepta también modelos Pydantic"""
+    with span("serializacion"):
+        if isinstance(data, list):
+            if data and isinstance(data[0], BaseModel):
+                body = orjson.dumps(jsonable_encoder(data), option=ORJSON_OPTIONS)
+            else:
+                body = serializer.dumps_many(data)
+        elif isinstance(data, BaseModel):
+            body = orjson.dumps(jsonable_encoder(data), option=ORJSON_OPTIONS)
+        else:
+            body = serializer.dumps(data)
+    return RawJSONResponse(content=body, status_code=status_code)
+
+
+def compress_body(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """Comprime según Accept-Encoding (zstd > gzip); devuelve (cuerpo, codificación)"""
+    accepted = {
+        item.split(";")[0].strip().lower() for item in (accept_encoding or "").split(",")
+    }
+    if zstandard is not None and "zstd" in accepted:
+        return zstandard.ZstdCompressor(level=3).compress(body), "zstd"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
@@ -1,10 +1,22 @@
 from fastapi import WebSocket
-from typing import Dict, List, Set
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import itertools
 import json
-from collections import defaultdict
+import logging
+import os
+import time
 from starlette.websockets import WebSocketState
 
 from datetime import datetime
+from actions.api.services.outbox import Outbox
+from actions.api.services.subscriptions import Subscription, SubscriptionIndex
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))
+HEARTBEAT_TIMEOUT = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "60"))
+REPLAY_BATCH = int(os.getenv("WS_REPLAY_BATCH", "100"))
 
 def custom_serializer(obj):
     if isinstance(obj, datetime):
@@ -12,58 +24,196 @@ def custom_serializer(obj):
     raise TypeError(f'Object of type {type(obj)} is not JSON serializable')
 
 
+class Connection:
+    """Una conexión WebSocket registrada (un usuario puede tener varias)"""
+    __slots__ = ("id", "websocket", "user_id", "groups", "last_seen", "subscriptions")
+
+    def __init__(self, connection_id: int, websocket: WebSocket, user_id: str, groups: Iterable[str]):
+        self.id = connection_id
+        self.websocket = websocket
+        self.user_id = user_id
+        self.groups = tuple(groups)
+        self.last_seen = time.monotonic()
+        self.subscriptions: Dict[str, Subscription] = {}
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+
 class SocketManager:
     def __init__(self):
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = defaultdict(dict)
-        self.user_groups: Dict[str, Set[str]] = defaultdict(set)
+        self._ids = itertools.count(1)
+        # Índices por id de conexión, usuario y grupo: alta, baja y búsqueda en O(1)
+        self.connections: Dict[int, Connection] = {}
+        self.user_connections: Dict[str, Dict[int, Connection]] = {}
+        self.group_connections: Dict[str, Dict[int, Connection]] = {}
+        self.subscription_index = SubscriptionIndex(self._send_message)
+        # Eventos numerados por canal para reenviar lo perdido al reconectar
+        self.outbox = Outbox(serializer=lambda message: json.dumps(message, default=custom_serializer))
+        self._heartbeat_task: Optional[asyncio.Task] = None
 
-    async def connect(self, websocket: WebSocket, user_id: str, groups: List[str]):
+    async def connect(self, websocket: WebSocket, user_id: str, groups: List[str]) -> Connection:
         try:
             # Asegurar que websocket está aceptado
             if websocket.client_state != WebSocketState.CONNECTED:
                 await websocket.accept()
-                
-            for group in groups:
-                self.active_connections[group][user_id] = websocket
-                self.user_groups[user_id].add(group)
-            
-            print(f"Usuario {user_id} conectado a grupos: {groups}")
-            
+
+            connection = Connection(next(self._ids), websocket, user_id, dict.fromkeys(groups))
+            self.connections[connection.id] = connection
+            self.user_connections.setdefault(user_id, {})[connection.id] = connection
+            for group in connection.groups:
+                self.group_connections.setdefault(group, {})[connection.id] = connection
+
+            logger.info("Usuario conectado", extra={"conexion": connection.id, "grupos": groups})
+
             # Enviar confirmación
             await websocket.send_text(json.dumps({
                 "type": "connection_established",
                 "message": "Successfully connected"
             }))
-            
-        except Exception as e:
-            print(f"Error connecting user {user_id}: {e}")
+            return connection
+
+        except Exception:
+            logger.exception("Error conectando al usuario %s", user_id)
             raise
 
-    def disconnect(self, websocket: WebSocket, user_id: str):
-        for group in self.user_groups.get(user_id, []):
-            if user_id in self.active_connections.get(group, {}):
-                del self.active_connections[group][user_id]
-        if user_id in self.user_groups:
-            del self.user_groups[user_id]
+    def disconnect(self, connection: Connection):
+        """Da de baja la conexión; es idempotente"""
+        if self.connections.pop(connection.id, None) is None:
+            return
+        user = self.user_connections.get(connection.user_id)
+        if user is not None:
+            user.pop(connection.id, None)
+            if not user:
+                del self.user_connections[connection.user_id]
+        for group in connection.groups:
+            members = self.group_connections.get(group)
+            if members is not None:
+                members.pop(connection.id, None)
+                if not members:
+                    del self.group_connections[group]
+        for subscription in connection.subscriptions.values():
+            self.subscription_index.remove(subscription)
+        connection.subscriptions.clear()
+
+    def subscribe(
+        self,
+        connection: Connection,
+        key: str,
+        plants: List[str],
+        metrics: Optional[List[str]] = None,
+        max_per_second: Optional[float] = None
+    ) -> Subscription:
+        """Crea (o reemplaza) la suscripción `key` de la conexión"""
+        self.unsubscribe(connection, key)
+        min_interval = 1.0 / max_per_second if max_per_second else 0.0
+        subscription = Subscription(key, connection, plants, metrics, min_interval)
+        connection.subscriptions[key] = subscription
+        self.subscription_index.add(subscription)
+        return subscription
+
+    def unsubscribe(self, connection: Connection, key: str) -> bool:
+        subscription = connection.subscriptions.pop(key, None)
+        if subscription is None:
+            return False
+        self.subscription_index.remove(subscription)
+        return True
+
+    def publish_reading(self, plant_id: str, reading: dict):
+        """Encola la lectura para los suscriptores de la planta (no bloquea)"""
+        self.subscription_index.publish(plant_id, reading)
+
+    async def _send(self, connection: Connection, text: str):
+        try:
+            await connection.websocket.send_text(text)
+        except Exception as e:
+            logger.warning("Error enviando a %s, desconectando: %s", connection.user_id, e,
+                           extra={"conexion": connection.id})
+            self.disconnect(connection)
+
+    async def _send_message(self, connection: Connection, message: dict):
+        await self._send(connection, json.dumps(message, default=custom_serializer))
+
+    async def _send_all(self, connections: Iterable[Connection], text: str):
+        # Se serializa una sola vez para todos los destinatarios
+        await asyncio.gather(*(self._send(connection, text) for connection in list(connections)))
 
     async def send_personal_message(self, message: dict, user_id: str):
-        for group in self.user_groups.get(user_id, []):
-            if user_id in self.active_connections.get(group, {}):
-                websocket = self.active_connections[group][user_id]
-                await websocket.send_text(json.dumps(message, default=custom_serializer))
+        # Se registra aunque el usuario no esté conectado: lo recibirá al reconectar
+        text = self.outbox.append(f"usuario:{user_id}", message)
+        connections = self.user_connections.get(user_id)
+        if connections:
+            await self._send_all(connections.values(), text)
 
     async def broadcast_to_group(self, message: dict, group: str):
-        if group not in self.active_connections:
-            return
+        text = self.outbox.append(f"grupo:{group}", message)
+        connections = self.group_connections.get(group)
+        if connections:
+            await self._send_all(connections.values(), text)
 
-        # Copiamos la lista para evitar errores si el dict cambia durante la iteración
-        for user_id, websocket in list(self.active_connections[group].items()):
-            try:
-                await websocket.send_text(json.dumps(message, default=custom_serializer))
-            except Exception as e:
-                print(f"[SOCKET] Error enviando a {user_id}, desconectando: {e}")
-                await self.disconnect(user_id=user_id, websocket=websocket)
+    @staticmethod
+    def streams_for(connection: Connection) -> List[str]:
+        return [f"usuario:{connection.user_id}"] + [f"grupo:{group}" for group in connection.groups]
+
+    def sequences(self, connection: Connection) -> Dict[str, int]:
+        """Última secuencia de cada canal de la conexión (punto de partida del cliente)"""
+        return {stream: self.outbox.last_seq(stream) for stream in self.streams_for(connection)}
+
+    async def resume(self, connection: Connection, last_seqs: Dict[str, int], epoch: Optional[str] = None):
+        """Reenvía por lotes los eventos posteriores a la última secuencia de cada canal.
+
+        Si el hueco ya no está en el registro se pide un `resync` de ese canal.
+        Los eventos en vivo pueden intercalarse con la repetición: el cliente
+        descarta los `seq` que ya aplicó.
+        """
+        for stream in self.streams_for(connection):
+            last_seq = last_seqs.get(stream)
+            if not isinstance(last_seq, int) or isinstance(last_seq, bool) or last_seq < 0:
+                continue
+            # Otra época: las secuencias del cliente no son comparables
+            events = await self.outbox.replay(stream, last_seq) if epoch == self.outbox.epoch else None
+            if events is None:
+                await self._send_message(connection, {
+                    "type": "resync", "canal": stream, "seq": self.outbox.last_seq(stream)
+                })
+                continue
+            prefix = '{"type": "replay", "canal": %s, "eventos": [' % json.dumps(stream)
+            for start in range(0, len(events), REPLAY_BATCH):
+                await self._send(connection, prefix + ", ".join(events[start:start + REPLAY_BATCH]) + "]}")
 
+    async def _close(self, connection: Connection):
+        self.disconnect(connection)
+        try:
+            await connection.websocket.close()
+        except Exception:
+            pass
+
+    async def heartbeat(self, interval: float = HEARTBEAT_INTERVAL, timeout: float = HEARTBEAT_TIMEOUT):
+        """Envía ping periódico y cierra las conexiones que no responden"""
+        ping = json.dumps({"type": "ping"})
+        while True:
+            await asyncio.sleep(interval)
+            deadline = time.monotonic() - timeout
+            alive, dead = [], []
+            for connection in list(self.connections.values()):
+                (dead if connection.last_seen < deadline else alive).append(connection)
+            if dead:
+                logger.info("[SOCKET] Cerrando %d conexiones sin respuesta", len(dead))
+                await asyncio.gather(*(self._close(connection) for connection in dead))
+            await asyncio.gather(*(self._send(connection, ping) for connection in alive))
+
+    def start_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self.heartbeat())
+
+    async def stop_heartbeat(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
 
     async def notify_solicitud_update(self, solicitud: dict, user_id: str, jefe_id: str):
     # Notificar al usuario
@@ -71,20 +221,20 @@ class SocketManager:
             "type": "solicitud_update",
             "data": solicitud
         }, user_id)
-        
+
         # Notificar al jefe
         if jefe_id:
             await self.send_personal_message({
                 "type": "solicitud_update",
                 "data": solicitud
             }, jefe_id)
-        
+
         # Notificar a todos los admins
         await self.broadcast_to_group({
             "type": "solicitud_update",
             "data": solicitud
         }, "admin")
-        
+
         await self.broadcast_to_group({
             "type": "solicitud_update",
             "data": solicitud
@@ -0,0 +1,125 @@
+import asyncio
+import gzip
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import orjson
+from data.db.mongo import STORAGE_BACKEND
+from data.db.repositories import reading_repository
+from actions.api.models.models import LECTURA_METRICS
+from actions.api.services.serializers import ORJSON_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+EDGE_UPSTREAM_URL = os.getenv("EDGE_UPSTREAM_URL")
+EDGE_UPSTREAM_TOKEN = os.getenv("EDGE_UPSTREAM_TOKEN")
+EDGE_SITE_ID = os.getenv("EDGE_SITE_ID", "edge")
+EDGE_UPLOAD_BATCH = int(os.getenv("EDGE_UPLOAD_BATCH", "5000"))
+EDGE_UPLOAD_INTERVAL = float(os.getenv("EDGE_UPLOAD_INTERVAL", "10"))
+EDGE_UPLOAD_MAX_BACKOFF = float(os.getenv("EDGE_UPLOAD_MAX_BACKOFF", "300"))
+UPLOAD_FIELDS = ("planta_id", "fecha", *LECTURA_METRICS, "notas")
+
+
+class EdgeUploader:
+    """Sube al servidor central las lecturas guardadas en el SQLite local.
+
+    Recorre las lecturas por orden de inserción (`seq`) a partir del punto de
+    control, las envía como NDJSON comprimido con gzip a POST /readings/carga
+    (que conserva las fechas originales) y solo avanza el punto de control
+    cuando el servidor confirma el bloque. Cada bloque usa un `carga_id`
+    determinista y las lecturas sin idempotencia reciben
+    (`edge:<sitio>`, seq), así que reenviar un bloque tras un corte no duplica
+    nada. Mientras no hay enlace la ingesta local sigue sin esperar.
+    """
+
+    def __init__(self, repository, url: str = EDGE_UPSTREAM_URL, token: Optional[str] = EDGE_UPSTREAM_TOKEN,
+                 site_id: str = EDGE_SITE_ID, batch_size: int = EDGE_UPLOAD_BATCH,
+                 interval: float = EDGE_UPLOAD_INTERVAL, client=None):
+        self.repository = repository
+        self.url = url
+        self.token = token
+        self.site_id = site_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self.checkpoint_key = f"subida:{site_id}"
+        self._client = client
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"subidas": 0, "bloques": 0, "rechazadas": 0, "fallos": 0}
+
+    def encode(self, rows: List[Tuple[int, dict]]) -> bytes:
+        lines = []
+        for seq, document in rows:
+            record = {name: document.get(name) for name in UPLOAD_FIELDS if document.get(name) is not None}
+            record["dispositivo_id"] = document.get("dispositivo_id") or f"edge:{self.site_id}"
+            record["secuencia"] = document["secuencia"] if document.get("dispositivo_id") else seq
+            lines.append(orjson.dumps(record, option=ORJSON_OPTIONS))
+        return gzip.compress(b"\n".join(lines) + b"\n", compresslevel=6)
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            self._client = httpx.AsyncClient(base_url=self.url, headers=headers, timeout=60)
+        return self._client
+
+    async def upload_once(self) -> int:
+        """Envía un bloque; devuelve cuántas lecturas se confirmaron (0 si no había)"""
+        checkpoint = await self.repository.get_checkpoint(self.checkpoint_key)
+        rows = await self.repository.since(checkpoint, self.batch_size)
+        if not rows:
+            return 0
+        first, last = rows[0][0], rows[-1][0]
+        response = await self._get_client().post(
+            "/readings/carga",
+            params={"formato": "ndjson", "carga_id": f"{self.site_id}-{first}-{last}"},
+            headers={"Content-Encoding": "gzip", "Content-Type": "application/x-ndjson"},
+            content=self.encode(rows)
+        )
+        response.raise_for_status()
+        result = response.json()
+        if result.get("rechazadas"):
+            # Reintentar no las arreglaría: se registran y se sigue adelante
+            logger.warning("El servidor central rechazó %s lecturas del bloque %s-%s: %s",
+                           result["rechazadas"], first, last, result.get("errores", [])[:5])
+            self.stats["rechazadas"] += result["rechazadas"]
+        await self.repository.set_checkpoint(self.checkpoint_key, last)
+        self.stats["subidas"] += len(rows)
+        self.stats["bloques"] += 1
+        return len(rows)
+
+    async def run(self):
+        backoff = self.interval
+        while True:
+            try:
+                sent = await self.upload_once()
+                backoff = self.interval
+                if sent == self.batch_size:
+                    # Queda atraso: se sigue sin esperar
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["fallos"] += 1
+                backoff = min(backoff * 2, EDGE_UPLOAD_MAX_BACKOFF)
+                logger.warning("Subida al servidor central fallida (reintento en %.0fs): %s", backoff, e)
+            await asyncio.sleep(backoff)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Solo en modo edge con un servidor central configurado
+edge_uploader: Optional[EdgeUploader] = (
+    EdgeUploader(reading_repository) if STORAGE_BACKEND == "sqlite" and EDGE_UPSTREAM_URL else None
+)
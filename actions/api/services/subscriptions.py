@@ -0,0 +1,113 @@
+import asyncio
+from typing import Callable, Dict, Iterable, Optional
+
+from actions.api.models.models import LECTURA_METRICS
+
+# Métricas que se pueden filtrar en una suscripción
+METRICS = frozenset(LECTURA_METRICS)
+
+
+class Subscription:
+    """Suscripción de una conexión a un conjunto de plantas y métricas.
+
+    Con `min_interval` > 0 las ráfagas se combinan: por cada planta solo se
+    guarda el último valor pendiente y se envía al cumplirse el intervalo.
+    """
+    __slots__ = (
+        "key", "connection", "plants", "metrics", "min_interval",
+        "last_sent", "pending", "flush_handle", "sending"
+    )
+
+    def __init__(self, key: str, connection, plants: Iterable[str], metrics: Optional[Iterable[str]], min_interval: float):
+        self.key = key
+        self.connection = connection
+        self.plants = frozenset(plants)
+        self.metrics = frozenset(metrics) if metrics else None
+        self.min_interval = min_interval
+        self.last_sent = float("-inf")
+        self.pending: Dict[str, dict] = {}
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.sending = False
+
+    def project(self, reading: dict) -> Optional[dict]:
+        if self.metrics is None:
+            return reading
+        values = {name: reading[name] for name in self.metrics if name in reading}
+        if not values:
+            return None
+        values["fecha"] = reading.get("fecha")
+        values["id"] = reading.get("id")
+        return values
+
+    def cancel(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        self.pending.clear()
+
+
+class SubscriptionIndex:
+    """Índice planta -> suscripciones para enrutar en O(suscriptores afectados)"""
+
+    def __init__(self, send: Callable[[object, dict], "asyncio.Future"]):
+        self._send = send
+        self.by_plant: Dict[str, Dict[int, Subscription]] = {}
+
+    def add(self, subscription: Subscription):
+        for plant_id in subscription.plants:
+            self.by_plant.setdefault(plant_id, {})[id(subscription)] = subscription
+
+    def remove(self, subscription: Subscription):
+        subscription.cancel()
+        for plant_id in subscription.plants:
+            subscribers = self.by_plant.get(plant_id)
+            if subscribers is not None:
+                subscribers.pop(id(subscription), None)
+                if not subscribers:
+                    del self.by_plant[plant_id]
+
+    def publish(self, plant_id: str, reading: dict):
+        subscribers = self.by_plant.get(plant_id)
+        if not subscribers:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        for subscription in list(subscribers.values()):
+            payload = subscription.project(reading)
+            if payload is None:
+                continue
+            subscription.pending[plant_id] = payload  # conflación: el último gana
+            self._schedule(subscription, loop, now)
+
+    def _schedule(self, subscription: Subscription, loop, now: float):
+        if subscription.sending or subscription.flush_handle is not None:
+            return
+        wait = subscription.last_sent + subscription.min_interval - now
+        if wait <= 0:
+            self._flush(subscription)
+        else:
+            subscription.flush_handle = loop.call_later(wait, self._flush, subscription)
+
+    def _flush(self, subscription: Subscription):
+        subscription.flush_handle = None
+        if not subscription.pending:
+            return
+        loop = asyncio.get_running_loop()
+        batch = list(subscription.pending.items())
+        subscription.pending.clear()
+        subscription.sending = True
+        subscription.last_sent = loop.time()
+        message = {
+            "type": "lecturas",
+            "sub": subscription.key,
+            "datos": [{"planta_id": plant_id, **payload} for plant_id, payload in batch]
+        }
+        task = loop.create_task(self._send(subscription.connection, message))
+        task.add_done_callback(lambda _: self._sent(subscription))
+
+    def _sent(self, subscription: Subscription):
+        subscription.sending = False
+        # Lo que llegó mientras se enviaba sale en el siguiente intervalo
+        if subscription.pending and subscription.connection.subscriptions.get(subscription.key) is subscription:
+            loop = asyncio.get_running_loop()
+            self._schedule(subscription, loop, loop.time())
@@ -0,0 +1,197 @@
+import base64
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import orjson
+from bson import ObjectId
+from data.db.mongo import db
+from data.db.query_monitor import monitored_service
+from actions.api.services.serializers import plant_serializer, reading_serializer
+
+# Margen para que las inserciones concurrentes de otros workers (con ObjectId
+# generados un poco antes) lleguen a la BD antes de que el cursor las pase.
+SYNC_SETTLE_SECONDS = float(os.getenv("SYNC_SETTLE_SECONDS", "2"))
+TOKEN_VERSION = 2
+# Bajas que el cliente debe aplicar: {tipo: "planta_borrada", planta_id}, en orden de `_id`
+TOMBSTONES_COLLECTION = "bajas"
+
+
+class TokenInvalidoError(ValueError):
+    pass
+
+
+def encode_token(
+    reading_id: Optional[ObjectId], plant_ts: Optional[int], plant_id: Optional[ObjectId],
+    tombstone_id: Optional[ObjectId] = None
+) -> str:
+    raw = orjson.dumps([
+        TOKEN_VERSION,
+        str(reading_id) if reading_id else None,
+        plant_ts,
+        str(plant_id) if plant_id else None,
+        str(tombstone_id) if tombstone_id else None
+    ])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_token(token: Optional[str]):
+    """Devuelve (último id de lectura, ms de la última planta, id de la última planta, id de la última baja)"""
+    if not token:
+        return None, None, None, None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        version, reading_id, plant_ts, plant_id, *rest = orjson.loads(raw)
+        # Los tokens v1 no llevan bajas: se envían todas las registradas
+        if version not in (1, TOKEN_VERSION) or len(rest) != (version == TOKEN_VERSION):
+            raise ValueError(version)
+        tombstone_id = rest[0] if rest else None
+        return (
+            ObjectId(reading_id) if reading_id else None,
+            plant_ts,
+            ObjectId(plant_id) if plant_id else None,
+            ObjectId(tombstone_id) if tombstone_id else None
+        )
+    except Exception as e:
+        raise TokenInvalidoError("Token de sincronización inválido") from e
+
+
+def _to_ms(value: Optional[datetime]) -> int:
+    if value is None:
+        return 0
+    return int((value - datetime(1970, 1, 1, tzinfo=value.tzinfo)).total_seconds() * 1000)
+
+
+@monitored_service
+class SyncService:
+    """Sincronización incremental de lecturas y plantas desde un token opaco.
+
+    Las lecturas se recorren por `_id` (orden de inserción) y las plantas por
+    (`actualizado_en`, `_id`). Ambas consultas van en una sola agregación con
+    `$unionWith`, de modo que una sincronización sin cambios es una única
+    búsqueda indexada.
+
+    Las plantas borradas (o en borrado, ya ocultas) llegan como bajas desde
+    TOMBSTONES_COLLECTION, también por `_id`: el cliente elimina la planta y
+    sus lecturas, incluidas las que reciba después en el mismo recorrido. La
+    primera sincronización no recibe bajas anteriores, solo las nuevas.
+
+    El orden por `_id` supone que cada lectura se inserta poco después de
+    generarse su `_id` (SYNC_SETTLE_SECONDS); el spool de ingesta por eso
+    asigna uno nuevo al reproducir.
+    """
+
+    def __init__(self):
+        self.readings_collection = db["lecturas"]
+        self.plants_collection = db["plantas"]
+        self.tombstones_collection = db[TOMBSTONES_COLLECTION]
+
+    def _pipeline(
+        self, token: Optional[str], limit: int, plant_ids: Optional[List[str]], upper: Optional[datetime] = None
+    ) -> list:
+        last_reading, plant_ts, last_plant, last_tombstone = decode_token(token)
+        if upper is None:
+            upper = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+
+        reading_filter = {"_id": {"$lt": ObjectId.from_datetime(upper)}}
+        if last_reading:
+            reading_filter["_id"]["$gt"] = last_reading
+        if plant_ids:
+            reading_filter["planta_id"] = {"$in": plant_ids}
+
+        if plant_ts is None:
+            # Primera sincronización: incluye plantas antiguas sin marca de actualización
+            plant_filter = {"$or": [
+                {"actualizado_en": {"$lt": upper}},
+                {"actualizado_en": {"$exists": False}}
+            ]}
+        else:
+            since = datetime(1970, 1, 1) + timedelta(milliseconds=plant_ts)
+            after = [
+                {"actualizado_en": {"$gt": since, "$lt": upper}},
+                {"actualizado_en": since, "_id": {"$gt": last_plant}}
+            ]
+            if plant_ts == 0 and last_plant:
+                # Paginación a mitad de las plantas antiguas sin marca
+                after.append({"actualizado_en": {"$exists": False}, "_id": {"$gt": last_plant}})
+            plant_filter = {"$or": after}
+        # Una planta en borrado ya se envió como baja: no debe volver como cambio
+        plant_filter["pendiente_borrado"] = {"$ne": True}
+        if plant_ids:
+            plant_filter["_id"] = {"$in": [ObjectId(pid) for pid in plant_ids if ObjectId.is_valid(pid)]}
+
+        tombstone_upper = ObjectId.from_datetime(upper)
+        tombstone_filter = {"_id": {"$lt": tombstone_upper}}
+        if last_tombstone:
+            tombstone_filter["_id"]["$gt"] = last_tombstone
+        elif not token:
+            # Sin token no hay nada que dar de baja en el cliente
+            tombstone_filter["_id"]["$gt"] = tombstone_upper
+        if plant_ids:
+            tombstone_filter["planta_id"] = {"$in": plant_ids}
+
+        plant_projection = dict(plant_serializer.projection, actualizado_en=1)
+        return [
+            {"$match": reading_filter},
+            {"$sort": {"_id": 1}},
+            {"$limit": limit + 1},
+            {"$project": reading_serializer.projection},
+            {"$unionWith": {
+                "coll": self.plants_collection.name,
+                "pipeline": [
+                    {"$match": plant_filter},
+                    {"$sort": {"actualizado_en": 1, "_id": 1}},
+                    {"$limit": limit + 1},
+                    {"$project": {**plant_projection, "_coleccion": {"$literal": "plantas"}}}
+                ]
+            }},
+            {"$unionWith": {
+                "coll": self.tombstones_collection.name,
+                "pipeline": [
+                    {"$match": tombstone_filter},
+                    {"$sort": {"_id": 1}},
+                    {"$limit": limit + 1},
+                    {"$project": {"tipo": 1, "planta_id": 1, "_coleccion": {"$literal": "bajas"}}}
+                ]
+            }}
+        ]
+
+    async def changes_since(self, token: Optional[str], limit: int = 1000, plant_ids: Optional[List[str]] = None) -> dict:
+        last_reading, plant_ts, last_plant, last_tombstone = decode_token(token)
+        upper = datetime.utcnow() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+        pipeline = self._pipeline(token, limit, plant_ids, upper)
+
+        readings, plants, tombstones = [], [], []
+        async for doc in self.readings_collection.aggregate(pipeline):
+            source = doc.pop("_coleccion", None)
+            if source == "plantas":
+                plants.append(doc)
+            elif source == "bajas":
+                tombstones.append(doc)
+            else:
+                readings.append(doc)
+
+        more = len(readings) > limit or len(plants) > limit or len(tombstones) > limit
+        readings, plants, tombstones = readings[:limit], plants[:limit], tombstones[:limit]
+
+        if readings:
+            last_reading = readings[-1]["_id"]
+        if plants:
+            plant_ts = _to_ms(plants[-1].get("actualizado_en"))
+            last_plant = plants[-1]["_id"]
+        if tombstones:
+            last_tombstone = tombstones[-1]["_id"]
+        elif not token:
+            # Sincronización inicial: lo borrado antes ya no aparece en las plantas
+            last_tombstone = ObjectId.from_datetime(upper)
+
+        return {
+            "lecturas": [reading_serializer.to_dict(doc) for doc in readings],
+            "plantas": [plant_serializer.to_dict(doc) for doc in plants],
+            "bajas": [
+                {"tipo": doc["tipo"], "planta_id": doc["planta_id"], "version": str(doc["_id"])}
+                for doc in tombstones
+            ],
+            "token": encode_token(last_reading, plant_ts if plant_ts is not None else 0, last_plant, last_tombstone),
+            "mas": more
+        }
@@ -0,0 +1,83 @@
+from typing import Dict, Hashable, List, Set, Tuple
+
+WHEEL_BITS = 6
+WHEEL_SIZE = 1 << WHEEL_BITS
+WHEEL_MASK = WHEEL_SIZE - 1
+
+
+class TimingWheel:
+    """Rueda de temporización jerárquica con ticks enteros.
+
+    `levels` ruedas de 64 ranuras: la del nivel l agrupa los vencimientos por
+    bloques de 64**l ticks, así que con 4 niveles y ticks de un segundo se
+    cubren ~194 días. Programar, reprogramar y cancelar una clave son O(1)
+    (un conjunto por ranura más un índice clave -> ranura). Cada tick procesa
+    una ranura del nivel 0; al completar un bloque, la ranura correspondiente
+    del nivel superior se redistribuye hacia abajo (cada clave baja como
+    mucho `levels - 1` veces en toda su vida). Los vencimientos más allá del
+    horizonte se recortan a él: quien consume la rueda debe comprobar su
+    plazo real y reprogramar si aún no venció.
+    """
+
+    def __init__(self, now: int, levels: int = 4):
+        self.now = now
+        self.levels = levels
+        self.horizon = (1 << (WHEEL_BITS * levels)) - 1
+        self._slots: List[List[Set[Hashable]]] = [[set() for _ in range(WHEEL_SIZE)] for _ in range(levels)]
+        self._index: Dict[Hashable, Tuple[int, int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._index
+
+    def _place(self, key: Hashable, expires: int):
+        # Nivel más bajo en el que el vencimiento cae dentro del bloque actual
+        level = 0
+        while level < self.levels - 1 and (expires >> (WHEEL_BITS * (level + 1))) != (self.now >> (WHEEL_BITS * (level + 1))):
+            level += 1
+        slot = (expires >> (WHEEL_BITS * level)) & WHEEL_MASK
+        self._slots[level][slot].add(key)
+        self._index[key] = (level, slot, expires)
+
+    def schedule(self, key: Hashable, expires: int):
+        """Programa (o reprograma) `key` para el tick `expires`"""
+        self.cancel(key)
+        self._place(key, min(max(expires, self.now + 1), self.now + self.horizon))
+
+    def cancel(self, key: Hashable) -> bool:
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return False
+        self._slots[entry[0]][entry[1]].discard(key)
+        return True
+
+    def deadline(self, key: Hashable) -> int:
+        return self._index[key][2]
+
+    def _cascade(self, level: int):
+        slot = (self.now >> (WHEEL_BITS * level)) & WHEEL_MASK
+        keys, self._slots[level][slot] = self._slots[level][slot], set()
+        for key in keys:
+            self._place(key, self._index[key][2])
+
+    def tick(self) -> List[Hashable]:
+        """Avanza un tick y devuelve las claves vencidas (ya retiradas de la rueda)"""
+        self.now += 1
+        # Primero bajan los bloques que empiezan en este tick, de arriba abajo
+        for level in range(self.levels - 1, 0, -1):
+            if self.now & ((1 << (WHEEL_BITS * level)) - 1) == 0:
+                self._cascade(level)
+        slot = self.now & WHEEL_MASK
+        expired, self._slots[0][slot] = self._slots[0][slot], set()
+        for key in expired:
+            del self._index[key]
+        return list(expired)
+
+    def advance(self, to: int) -> List[Hashable]:
+        """Avanza hasta el tick `to` inclusive acumulando las claves vencidas"""
+        expired = []
+        while self.now < to:
+            expired.extend(self.tick())
+        return expired
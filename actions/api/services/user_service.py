@@ -1,19 +1,20 @@
 from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime
-from data.db.mongo import db
+from pymongo.errors import DuplicateKeyError
+from data.db.repositories import user_repository
+from data.db.query_monitor import monitored_service
 from actions.api.models.models import UserCreate, UserOut, UserUpdate, UserInDB
 from actions.api.services.auth_service import AuthService
+from actions.api.services.serializers import user_serializer
 
+@monitored_service
 class UserService:
     def __init__(self):
-        self.users_collection = db["users"]
+        self.users = user_repository
 
     async def create_user(self, user: UserCreate) -> Optional[UserOut]:
-        existing_user = await self.users_collection.find_one({"username": user.username})
-        if existing_user:
-            return None
-        
+        """Devuelve None si el nombre de usuario ya existe (índice único)"""
         # Crear diccionario excluyendo la contraseña
         user_data = user.dict(exclude={"password"})
         
@@ -21,31 +22,28 @@ class UserService:
         user_data["hashed_password"] = AuthService().get_password_hash(user.password)
         user_data["creado_en"] = datetime.utcnow()
         
-        result = await self.users_collection.insert_one(user_data)
-        created_user = await self.users_collection.find_one({"_id": result.inserted_id})
+        try:
+            user_id = await self.users.insert(user_data)
+        except DuplicateKeyError:
+            return None
         
-        # Asegurarse de no devolver el hash en la respuesta
-        return UserOut(**created_user, id=str(created_user["_id"]))
+        # La respuesta sale del documento insertado; UserOut no incluye el hash
+        return UserOut(**user_data, id=str(user_id))
 
-    async def get_user_by_id(self, user_id: str) -> Optional[UserOut]:
+    async def get_user_by_id(self, user_id: str) -> Optional[dict]:
+        """Devuelve el documento crudo (sin hash); se serializa con user_serializer"""
         if not ObjectId.is_valid(user_id):
             return None
-        user = await self.users_collection.find_one({"_id": ObjectId(user_id)})
-        if not user:
-            return None
-        return UserOut(**user, id=str(user["_id"]))
+        return await self.users.find_by_id(ObjectId(user_id), user_serializer.projection)
 
     async def get_full_user(self, username: str) -> Optional[UserInDB]:
-        user = await self.users_collection.find_one({"username": username})
+        user = await self.users.find_by_username(username)
         if not user:
             return None
         return UserInDB(**user, id=str(user["_id"]))
 
-    async def list_users(self) -> List[UserOut]:
-        users = []
-        async for user in self.users_collection.find():
-            users.append(UserOut(**user, id=str(user["_id"])))
-        return users
+    async def list_users(self) -> List[dict]:
+        return await self.users.list(user_serializer.projection)
 
     async def update_user(self, user_id: str, user_data: UserUpdate) -> Optional[UserOut]:
         if not ObjectId.is_valid(user_id):
@@ -59,18 +57,13 @@ class UserService:
         if not update_data:
             return None
         
-        result = await self.users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_data}
-        )
+        updated_user = await self.users.update(ObjectId(user_id), update_data, {"hashed_password": 0})
         
-        if result.modified_count == 1:
-            updated_user = await self.users_collection.find_one({"_id": ObjectId(user_id)})
+        if updated_user:
             return UserOut(**updated_user, id=str(updated_user["_id"]))
         return None
 
     async def delete_user(self, user_id: str) -> bool:
         if not ObjectId.is_valid(user_id):
             return False
-        result = await self.users_collection.delete_one({"_id": ObjectId(user_id)})
-        return result.deleted_count == 1
\ No newline at end of file
+        return await self.users.delete(ObjectId(user_id))
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""Trazas ligeras por petición: cabecera `Server-Timing` y registro muestreado.
+
+Cada petición HTTP abre una `Trace` en una contextvar; `span()` mide bloques
+(autenticación, métodos de servicio, serialización) y el listener de pymongo
+añade un tramo por comando. Sin traza activa `span()` devuelve un objeto
+vacío compartido, así que el coste con todo desactivado es una lectura de
+contextvar.
+"""
+import contextvars
+import logging
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+import orjson
+from pymongo import monitoring
+
+logger = logging.getLogger("trazas")
+
+# Opcional: la cabecera expone a cualquier cliente los tiempos internos de cada petición
+SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "0") == "1"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "api-agricola")
+
+current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+current_span_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span_id", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Trace:
+    """Tramos de una petición; solo guarda el detalle si está muestreada"""
+    __slots__ = ("trace_id", "root_id", "name", "sampled", "start_ns", "totals", "spans")
+
+    def __init__(self, name: str, sampled: bool, trace_id: Optional[str] = None, parent_id: Optional[str] = None):
+        self.trace_id = trace_id or _new_id(128)
+        self.root_id = _new_id(64)
+        self.name = name
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        # nombre -> [duración acumulada en ns, número de tramos]
+        self.totals: Dict[str, list] = {}
+        self.spans: List[dict] = []
+        if sampled:
+            self.spans.append({
+                "traceId": self.trace_id, "spanId": self.root_id, "parentSpanId": parent_id or "",
+                "name": name, "kind": 2, "startTimeUnixNano": self.start_ns, "endTimeUnixNano": 0,
+                "attributes": []
+            })
+
+    def add(self, name: str, start_ns: int, end_ns: int, span_id: Optional[str] = None,
+            parent_id: Optional[str] = None, attributes: Optional[dict] = None):
+        total = self.totals.get(name)
+        if total is None:
+            self.totals[name] = [end_ns - start_ns, 1]
+        else:
+            total[0] += end_ns - start_ns
+            total[1] += 1
+        if self.sampled:
+            self.spans.append({
+                "traceId": self.trace_id, "spanId": span_id or _new_id(64),
+                "parentSpanId": parent_id or self.root_id, "name": name, "kind": 1,
+                "startTimeUnixNano": start_ns, "endTimeUnixNano": end_ns,
+                "attributes": _attributes(attributes)
+            })
+
+    def server_timing(self) -> str:
+        """Valor de `Server-Timing`: un métrico por nombre de tramo más el total"""
+        parts = [
+            f'{name};dur={total[0] / 1e6:.2f}' + (f';desc="x{total[1]}"' if total[1] > 1 else "")
+            for name, total in self.totals.items()
+        ]
+        parts.append(f"total;dur={(time.time_ns() - self.start_ns) / 1e6:.2f}")
+        return ", ".join(parts)
+
+    def finish(self, attributes: Optional[dict] = None) -> Optional[bytes]:
+        """Cierra el tramo raíz y devuelve el JSON OTLP si la traza está muestreada"""
+        if not self.sampled:
+            return None
+        root = self.spans[0]
+        root["endTimeUnixNano"] = time.time_ns()
+        root["attributes"] = _attributes(attributes)
+        return orjson.dumps({"resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": self.spans}]
+        }]})
+
+
+def _attributes(values: Optional[dict]) -> List[dict]:
+    if not values:
+        return []
+    result = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attributes", "start_ns", "span_id", "parent_id", "token")
+
+    def __init__(self, trace: Trace, name: str, attributes: Optional[dict]):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.span_id = self.parent_id = self.token = None
+
+    def __enter__(self):
+        if self.trace.sampled:
+            self.span_id = _new_id(64)
+            self.parent_id = current_span_id.get()
+            self.token = current_span_id.set(self.span_id)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end_ns = time.time_ns()
+        if self.token is not None:
+            current_span_id.reset(self.token)
+        self.trace.add(self.name, self.start_ns, end_ns, self.span_id, self.parent_id, self.attributes)
+        return False
+
+
+def span(name: str, **attributes):
+    """Mide el bloque `with` dentro de la traza actual (no hace nada sin traza)"""
+    trace = current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name, attributes or None)
+
+
+def _parse_traceparent(value: Optional[str]):
+    """(trace_id, parent_id, muestreada) de una cabecera W3C `traceparent`"""
+    if not value:
+        return None, None, False
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None, False
+    return parts[1], parts[2], parts[3].endswith("1")
+
+
+class TracingMiddleware:
+    """Abre una traza por petición HTTP y la expone en `Server-Timing`"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.app = app
+        self.server_timing = server_timing
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id, sampled = None, None, False
+        if self.sample_rate > 0:
+            headers = dict(scope.get("headers") or [])
+            trace_id, parent_id, sampled = _parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+            sampled = sampled or random.random() < self.sample_rate
+        if not sampled and not self.server_timing:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}", sampled, trace_id, parent_id)
+        token = current_trace.set(trace)
+        status = {"code": 0}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", trace.server_timing().encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            payload = trace.finish({"http.method": scope["method"], "http.route": route, "http.status_code": status["code"]})
+            if payload is not None:
+                logger.info(payload.decode())
+
+
+class MongoSpanListener(monitoring.CommandListener):
+    """Añade un tramo `mongo.<comando>` por cada comando de la traza actual.
+
+    Motor ejecuta pymongo con una copia del contexto, así que la traza y el
+    tramo padre son visibles desde los hilos del ejecutor.
+    """
+
+    def __init__(self):
+        self._started: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        trace = current_trace.get()
+        if trace is not None:
+            self._started[(event.request_id, event.connection_id)] = (trace, current_span_id.get())
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        started = self._started.pop((event.request_id, event.connection_id), None)
+        if started is None:
+            return
+        trace, parent_id = started
+        end_ns = time.time_ns()
+        trace.add(
+            f"mongo.{event.command_name}", end_ns - event.duration_micros * 1000, end_ns,
+            parent_id=parent_id, attributes={"db.system": "mongodb", "db.operation": event.command_name}
+        )
+
+
+mongo_span_listener = MongoSpanListener()
@@ -0,0 +1,215 @@
+"""Motor de almacenamiento en memoria para pruebas y mediciones sin MongoDB.
+
+Implementa los repositorios de `data.db.repositories` con la misma semántica
+que Mongo en las consultas que usan los servicios: `_id` ObjectId asignado
+al insertar, proyecciones de inclusión o exclusión, índice único de
+`username` y de (dispositivo_id, secuencia). Las lecturas de cada planta se
+mantienen ordenadas por (fecha, _id) y los rangos se resuelven con `bisect`.
+El estado vive en el proceso y se pierde al reiniciar.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from data.db.repositories import DUPLICATE_KEY_CODE, PlantRepository, ReadingRepository, UserRepository
+
+
+def project(document: dict, projection: Optional[dict] = None) -> dict:
+    """Copia del documento con la proyección de Mongo aplicada"""
+    if not projection:
+        return dict(document)
+    include_id = projection.get("_id", 1)
+    fields = {name: flag for name, flag in projection.items() if name != "_id"}
+    if any(fields.values()):
+        out = {name: document[name] for name in fields if name in document}
+    else:
+        out = {name: value for name, value in document.items() if name not in fields}
+    if include_id and "_id" in document:
+        out["_id"] = document["_id"]
+    else:
+        out.pop("_id", None)
+    return out
+
+
+def _duplicate(index: str, key) -> DuplicateKeyError:
+    return DuplicateKeyError(f"E11000 duplicate key error index: {index} dup key: {key}", DUPLICATE_KEY_CODE)
+
+
+class _PlantSeries:
+    """Lecturas de una planta ordenadas por (fecha, _id) en listas paralelas"""
+
+    __slots__ = ("keys", "documents")
+
+    def __init__(self):
+        self.keys: List[Tuple[datetime, ObjectId]] = []
+        self.documents: List[dict] = []
+
+    def add(self, document: dict):
+        key = (document["fecha"], document["_id"])
+        if not self.keys or key >= self.keys[-1]:
+            # Caso habitual: las lecturas llegan en orden
+            self.keys.append(key)
+            self.documents.append(document)
+            return
+        position = bisect_right(self.keys, key)
+        self.keys.insert(position, key)
+        self.documents.insert(position, document)
+
+    def span(self, start: datetime, end: datetime) -> Tuple[int, int]:
+        # (fecha,) ordena antes que cualquier (fecha, _id) con la misma fecha
+        return bisect_left(self.keys, (start,)), bisect_left(self.keys, (end,))
+
+
+class MemoryReadingRepository(ReadingRepository):
+    def __init__(self):
+        self._by_id: Dict[ObjectId, dict] = {}
+        self._series: Dict[Optional[str], _PlantSeries] = {}
+        self._device_keys: set = set()
+
+    @staticmethod
+    def _device_key(document: dict):
+        device, sequence = document.get("dispositivo_id"), document.get("secuencia")
+        # Igual que el índice parcial: solo cuentan las lecturas con ambos campos
+        if isinstance(device, str) and isinstance(sequence, (int, float)):
+            return device, sequence
+        return None
+
+    async def insert(self, document: dict) -> ObjectId:
+        key = self._device_key(document)
+        if key is not None and key in self._device_keys:
+            raise _duplicate("dispositivo_secuencia_unico", key)
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._by_id:
+            raise _duplicate("_id_", document["_id"])
+        stored = dict(document)
+        if key is not None:
+            self._device_keys.add(key)
+        self._by_id[stored["_id"]] = stored
+        series = self._series.get(stored.get("planta_id"))
+        if series is None:
+            series = self._series[stored.get("planta_id")] = _PlantSeries()
+        series.add(stored)
+        return stored["_id"]
+
+    async def insert_many_unordered(self, documents: List[dict]) -> Tuple[List[dict], int]:
+        stored = []
+        for document in documents:
+            try:
+                await self.insert(document)
+            except DuplicateKeyError:
+                continue
+            stored.append(document)
+        return stored, len(documents) - len(stored)
+
+    async def find_by_id(self, reading_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        document = self._by_id.get(reading_id)
+        return project(document, projection) if document else None
+
+    async def find_by_acceptance_id(self, acceptance_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        # El spool de ingesta solo existe con MongoDB
+        return None
+
+    async def find_by_plant(
+        self, plant_id: str, projection: Optional[dict] = None,
+        start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[dict]:
+        series = self._series.get(plant_id)
+        if series is None:
+            return []
+        first = 0 if start is None else series.span(start, start)[0]
+        last = len(series.documents) if end is None else series.span(end, end)[0]
+        return [project(doc, projection) for doc in series.documents[first:last]]
+
+    async def iter_range(
+        self, plant_id: str, start: datetime, end: datetime, fields: Sequence[str], batch_size: int
+    ) -> AsyncIterator[List[dict]]:
+        series = self._series.get(plant_id)
+        if series is None:
+            return
+        first, last = series.span(start, end)
+        names = ("fecha", *fields)
+        for offset in range(first, last, batch_size):
+            yield [
+                {name: doc[name] for name in names if name in doc}
+                for doc in series.documents[offset:min(offset + batch_size, last)]
+            ]
+
+    async def delete_by_plant(self, plant_id: str) -> int:
+        series = self._series.pop(plant_id, None)
+        if series is None:
+            return 0
+        for document in series.documents:
+            del self._by_id[document["_id"]]
+            self._device_keys.discard(self._device_key(document))
+        return len(series.documents)
+
+
+class _MemoryDocuments:
+    """Documentos por `_id` en orden de inserción (como un recorrido natural)"""
+
+    def __init__(self):
+        self._documents: Dict[ObjectId, dict] = {}
+
+    def _insert(self, document: dict) -> ObjectId:
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise _duplicate("_id_", document["_id"])
+        self._documents[document["_id"]] = dict(document)
+        return document["_id"]
+
+    async def find_by_id(self, document_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        document = self._documents.get(document_id)
+        return project(document, projection) if document else None
+
+    async def list(self, projection: Optional[dict] = None) -> List[dict]:
+        return [project(doc, projection) for doc in self._documents.values()]
+
+    def _update(self, document_id: ObjectId, fields: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        document = self._documents.get(document_id)
+        if document is None:
+            return None
+        document.update(fields)
+        return project(document, projection)
+
+    async def delete(self, document_id: ObjectId) -> bool:
+        return self._documents.pop(document_id, None) is not None
+
+
+class MemoryPlantRepository(_MemoryDocuments, PlantRepository):
+    async def insert(self, document: dict) -> ObjectId:
+        return self._insert(document)
+
+    async def update(self, plant_id: ObjectId, fields: dict) -> Optional[dict]:
+        return self._update(plant_id, fields)
+
+    async def set_last_reading(self, plant_ids: Iterable[ObjectId], fecha: datetime):
+        for plant_id in plant_ids:
+            self._update(plant_id, {"ultima_lectura": fecha})
+
+
+class MemoryUserRepository(_MemoryDocuments, UserRepository):
+    def __init__(self):
+        super().__init__()
+        self._by_username: Dict[str, ObjectId] = {}
+
+    async def insert(self, document: dict) -> ObjectId:
+        if document.get("username") in self._by_username:
+            raise _duplicate("username_1", document["username"])
+        user_id = self._insert(document)
+        self._by_username[document["username"]] = user_id
+        return user_id
+
+    async def find_by_username(self, username: str) -> Optional[dict]:
+        user_id = self._by_username.get(username)
+        return await self.find_by_id(user_id) if user_id else None
+
+    async def update(self, user_id: ObjectId, fields: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return self._update(user_id, fields, projection)
+
+    async def delete(self, user_id: ObjectId) -> bool:
+        document = self._documents.get(user_id)
+        if document is not None:
+            self._by_username.pop(document.get("username"), None)
+        return await super().delete(user_id)
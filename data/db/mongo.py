@@ -1,30 +1,68 @@
+import logging
 import os
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from dotenv import load_dotenv
+from data.db.query_monitor import query_monitor
+from actions.api.tracing import mongo_span_listener
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("MONGO_DB_NAME", "agricultura_db")
+# "mongo", "memory" (data.db.memory_store) o "sqlite" (data.db.sqlite_store, modo edge)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
 
 if not MONGO_URI:
-    raise ValueError("MONGO_URI no configurada")
+    if STORAGE_BACKEND == "mongo":
+        raise ValueError("MONGO_URI no configurada")
+    # El cliente no conecta hasta la primera operación; sin Mongo no llega a usarse
+    MONGO_URI = "mongodb://localhost:27017"
 
-client = AsyncIOMotorClient(MONGO_URI)
+# El monitor registra las operaciones lentas junto con la ruta y el servicio de origen
+client = AsyncIOMotorClient(MONGO_URI, event_listeners=[query_monitor, mongo_span_listener])
 db = client.get_database(DB_NAME)
 
 async def init_db():
     try:
         await client.admin.command('ping')
-        print("✅ MongoDB conectado")
+        logger.info("MongoDB conectado")
         
         # Índices básicos (opcionales pero recomendados)
         await db.users.create_index("username", unique=True)
         await db.plantas.create_index("nombre")
+        await db.plantas.create_index([("actualizado_en", 1), ("_id", 1)])
         await db.lecturas.create_index([("planta_id", 1), ("fecha", -1)])
+        # Sincronización incremental por orden de inserción para un subconjunto de plantas
+        await db.lecturas.create_index([("planta_id", 1), ("_id", 1)])
+        # Idempotencia de ingesta: solo aplica a lecturas con dispositivo y secuencia
+        await db.lecturas.create_index(
+            [("dispositivo_id", 1), ("secuencia", 1)],
+            unique=True,
+            partialFilterExpression={
+                "dispositivo_id": {"$type": "string"},
+                "secuencia": {"$type": "number"}
+            },
+            name="dispositivo_secuencia_unico"
+        )
+        # Lecturas reproducidas desde el spool de ingesta: evita insertarlas dos veces
+        await db.lecturas.create_index(
+            "id_aceptacion",
+            unique=True,
+            partialFilterExpression={"id_aceptacion": {"$exists": True}},
+            name="id_aceptacion_unico"
+        )
+        # Un único trabajo de borrado activo por objetivo
+        await db.trabajos_borrado.create_index(
+            [("tipo", 1), ("objetivo_id", 1)],
+            unique=True,
+            partialFilterExpression={"activo": True},
+            name="borrado_activo_unico"
+        )
         
     except Exception as e:
-        print(f"❌ Error MongoDB: {e}")
+        logger.error("Error MongoDB: %s", e)
         raise
 
 async def ensure_collections():
@@ -35,7 +73,7 @@ async def ensure_collections():
     for col in required_collections:
         if col not in existing_collections:
             await db.create_collection(col)
-            print(f"Colección '{col}' creada")
+            logger.info("Colección '%s' creada", col)
 
 # Colecciones principales
 users_collection = db["users"]
@@ -0,0 +1,320 @@
+"""Registro de consultas lentas a MongoDB con captura de `explain`.
+
+Un `CommandListener` de pymongo mide cada comando; los que superan el umbral
+se agrupan por forma de consulta junto con la ruta HTTP y el método de
+servicio que los originaron (tomados de contextvars). Para una muestra de
+ellos se ejecuta `explain` en segundo plano y se marcan COLLSCAN y ordenaciones
+en memoria, con una sugerencia de índice.
+"""
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+from actions.api.tracing import span
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.2"))
+EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+
+# Ámbito ASGI de la petición en curso y método de servicio que consulta
+current_request_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("current_request_scope", default=None)
+current_operation: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_operation", default=None)
+
+IGNORED_COMMANDS = frozenset({
+    "explain", "hello", "ismaster", "isMaster", "ping", "buildInfo", "saslStart",
+    "saslContinue", "endSessions", "killCursors", "getMore"
+})
+# Claves del comando que identifican la colección según el tipo de operación
+COLLECTION_KEYS = ("find", "aggregate", "count", "distinct", "update", "delete", "insert", "findAndModify")
+
+
+def shape(value: Any) -> Any:
+    """Sustituye los valores por marcadores conservando campos y operadores"""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    return 1
+
+
+def _route_of(scope: Optional[dict]) -> Optional[str]:
+    if scope is None:
+        return None
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path")
+    return f"{scope.get('method', 'WS')} {path}"
+
+
+def _query_parts(command: dict):
+    """(filtro, orden) principales del comando para agrupar y sugerir índices"""
+    if "find" in command:
+        return command.get("filter") or {}, command.get("sort") or {}
+    if "aggregate" in command:
+        pipeline = command.get("pipeline") or []
+        match = next((stage["$match"] for stage in pipeline if "$match" in stage), {})
+        sort = next((stage["$sort"] for stage in pipeline if "$sort" in stage), {})
+        return match, sort
+    if "count" in command:
+        return command.get("query") or {}, {}
+    if "distinct" in command:
+        return command.get("query") or {}, {}
+    if "findAndModify" in command:
+        return command.get("query") or {}, command.get("sort") or {}
+    for key in ("updates", "deletes"):
+        if command.get(key):
+            return command[key][0].get("q") or {}, {}
+    return {}, {}
+
+
+def suggest_index(filter_: dict, sort: dict) -> List[list]:
+    """Índice candidato según la regla igualdad-orden-rango (ESR)"""
+    equality, ranges = [], []
+    for field, condition in filter_.items():
+        if field.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(op in condition for op in ("$gt", "$gte", "$lt", "$lte", "$ne", "$exists")):
+            ranges.append(field)
+        else:
+            equality.append(field)
+    keys = [[field, 1] for field in equality]
+    keys += [[field, int(direction)] for field, direction in sort.items() if field not in equality]
+    keys += [[field, 1] for field in ranges if field not in sort]
+    return keys
+
+
+def analyze_plan(explain: dict) -> dict:
+    """Busca en el plan ganador las etapas COLLSCAN / SORT y los índices usados"""
+    stages, indexes = set(), set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            if "rejectedPlans" in node:
+                node = {k: v for k, v in node.items() if k != "rejectedPlans"}
+            stage = node.get("stage")
+            if isinstance(stage, str):
+                stages.add(stage)
+            if isinstance(node.get("indexName"), str):
+                indexes.add(node["indexName"])
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(explain.get("queryPlanner", explain))
+    return {
+        "collscan": "COLLSCAN" in stages,
+        "sort_en_memoria": "SORT" in stages,
+        "indices": sorted(indexes),
+        "etapas": sorted(stages)
+    }
+
+
+class QueryShape:
+    __slots__ = ("key", "coleccion", "operacion", "forma", "count", "total_ms", "max_ms",
+                 "rutas", "metodos", "command", "database", "plan", "explained_at", "suggestion")
+
+    def __init__(self, key, coleccion, operacion, forma, command, database, suggestion):
+        self.key = key
+        self.coleccion = coleccion
+        self.operacion = operacion
+        self.forma = forma
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rutas: Dict[str, int] = {}
+        self.metodos: Dict[str, int] = {}
+        self.command = command
+        self.database = database
+        self.plan: Optional[dict] = None
+        self.explained_at = 0.0
+        self.suggestion = suggestion
+
+    def as_dict(self) -> dict:
+        flagged = self.plan is not None and (self.plan["collscan"] or self.plan["sort_en_memoria"])
+        return {
+            "coleccion": self.coleccion,
+            "operacion": self.operacion,
+            "forma": self.forma,
+            "ejecuciones": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "promedio_ms": round(self.total_ms / self.count, 2) if self.count else 0,
+            "max_ms": round(self.max_ms, 2),
+            "rutas": self.rutas,
+            "metodos": self.metodos,
+            "plan": self.plan,
+            "indice_sugerido": self.suggestion if flagged else None
+        }
+
+
+class SlowQueryMonitor(monitoring.CommandListener):
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, max_shapes: int = 500, max_recent: int = 200):
+        self.threshold_ms = threshold_ms
+        self.max_shapes = max_shapes
+        self.shapes: Dict[str, QueryShape] = {}
+        self.recent: deque = deque(maxlen=max_recent)
+        self._pending: Dict[tuple, tuple] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._database = None
+
+    def start(self, database):
+        """Activa los `explain` en segundo plano sobre el loop actual"""
+        self._loop = asyncio.get_running_loop()
+        self._database = database
+
+    # --- CommandListener (se ejecuta en los hilos de motor) ---
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        self._pending[(event.request_id, event.connection_id)] = (
+            event.command, event.database_name, current_request_scope.get(), current_operation.get()
+        )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000.0
+        if duration_ms < self.threshold_ms:
+            return
+        command, database, scope, operation = pending
+        record = (event.command_name, command, database, _route_of(scope), operation, duration_ms)
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.record, *record)
+        else:
+            self.record(*record)
+
+    # --- Agregación (en el event loop) ---
+
+    def record(self, command_name: str, command: dict, database: str, route: Optional[str], operation: Optional[str], duration_ms: float):
+        collection = next((command[key] for key in COLLECTION_KEYS if key in command), None)
+        filter_, sort = _query_parts(command)
+        forma = {"filtro": shape(filter_), "orden": sort}
+        key = f"{collection}.{command_name} {json.dumps(forma, sort_keys=True, default=str)}"
+
+        entry = self.shapes.get(key)
+        if entry is None:
+            if len(self.shapes) >= self.max_shapes:
+                # Descarta la forma menos costosa para acotar memoria
+                cheapest = min(self.shapes.values(), key=lambda s: s.total_ms)
+                del self.shapes[cheapest.key]
+            entry = self.shapes[key] = QueryShape(
+                key, collection, command_name, forma, command, database, suggest_index(filter_, sort)
+            )
+        entry.count += 1
+        entry.total_ms += duration_ms
+        entry.max_ms = max(entry.max_ms, duration_ms)
+        entry.command = command
+        if route:
+            entry.rutas[route] = entry.rutas.get(route, 0) + 1
+        if operation:
+            entry.metodos[operation] = entry.metodos.get(operation, 0) + 1
+        self.recent.append({
+            "fecha": datetime.utcnow(), "coleccion": collection, "operacion": command_name,
+            "duracion_ms": round(duration_ms, 2), "ruta": route, "metodo": operation
+        })
+
+        now = time.monotonic()
+        if (
+            self._database is not None
+            and now - entry.explained_at > EXPLAIN_INTERVAL
+            and random.random() < EXPLAIN_SAMPLE_RATE
+        ):
+            entry.explained_at = now
+            asyncio.ensure_future(self._explain(entry))
+
+    async def _explain(self, entry: QueryShape):
+        command = {k: v for k, v in entry.command.items() if not k.startswith("$") and k not in ("lsid", "txnNumber")}
+        try:
+            result = await self._database.client[entry.database].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+            entry.plan = analyze_plan(result)
+        except Exception as e:
+            logger.debug("No se pudo ejecutar explain para %s: %s", entry.key, e)
+
+    def report(self, limit: int = 20) -> dict:
+        shapes = sorted(self.shapes.values(), key=lambda s: s.total_ms, reverse=True)[:limit]
+        summaries = [s.as_dict() for s in shapes]
+        suggestions = {}
+        for summary in summaries:
+            if summary["indice_sugerido"]:
+                index = json.dumps(summary["indice_sugerido"])
+                suggestions.setdefault((summary["coleccion"], index), summary["indice_sugerido"])
+        return {
+            "umbral_ms": self.threshold_ms,
+            "formas": summaries,
+            "indices_sugeridos": [
+                {"coleccion": collection, "claves": keys} for (collection, _), keys in suggestions.items()
+            ],
+            "recientes": list(self.recent)[-50:]
+        }
+
+
+def monitored_service(cls):
+    """Decorador de clase: anota en `current_operation` el método que consulta
+    y lo mide como tramo de la traza de la petición"""
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_"):
+            continue
+        label = f"{cls.__name__}.{name}"
+        if inspect.isasyncgenfunction(method):
+            setattr(cls, name, _wrap_async_gen(method, label))
+        elif inspect.iscoroutinefunction(method):
+            setattr(cls, name, _wrap_coroutine(method, label))
+    return cls
+
+
+def _wrap_coroutine(method, label):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = current_operation.set(label)
+        try:
+            with span(label):
+                return await method(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+    return wrapper
+
+
+def _wrap_async_gen(method, label):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        generator = method(*args, **kwargs)
+        try:
+            while True:
+                token = current_operation.set(label)
+                try:
+                    with span(label):
+                        item = await generator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    current_operation.reset(token)
+                yield item
+        finally:
+            await generator.aclose()
+    return wrapper
+
+
+query_monitor = SlowQueryMonitor()
@@ -0,0 +1,241 @@
+"""Repositorios de lecturas, plantas y usuarios.
+
+Los servicios hablan con estas interfaces en lugar de con las colecciones.
+`STORAGE_BACKEND=mongo` (por defecto) usa MongoDB; `STORAGE_BACKEND=memory`
+usa el motor en memoria de `data.db.memory_store`, con el que el API arranca
+y se puede medir sin base de datos, y `STORAGE_BACKEND=sqlite` el archivo
+local de `data.db.sqlite_store` (modo edge, ver SQLITE_PATH).
+"""
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from data.db.mongo import STORAGE_BACKEND, db
+
+DUPLICATE_KEY_CODE = 11000
+
+
+async def insert_unordered(collection, documents: List[dict]) -> Tuple[List[dict], int]:
+    """insert_many sin orden; devuelve (documentos almacenados, duplicados omitidos)"""
+    try:
+        await collection.insert_many(documents, ordered=False)
+        return documents, 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY_CODE for err in errors):
+            raise
+        failed = {err["index"] for err in errors}
+        stored = [doc for index, doc in enumerate(documents) if index not in failed]
+        return stored, len(errors)
+
+
+class ReadingRepository(ABC):
+    @abstractmethod
+    async def insert(self, document: dict) -> ObjectId:
+        """Inserta (añadiendo `_id` al documento); DuplicateKeyError si (dispositivo_id, secuencia) existe"""
+
+    @abstractmethod
+    async def insert_many_unordered(self, documents: List[dict]) -> Tuple[List[dict], int]:
+        """(documentos almacenados, duplicados omitidos)"""
+
+    @abstractmethod
+    async def find_by_id(self, reading_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def find_by_acceptance_id(self, acceptance_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        """Lectura reproducida desde el spool de ingesta por el `_id` con que se aceptó"""
+
+    @abstractmethod
+    async def find_by_plant(
+        self, plant_id: str, projection: Optional[dict] = None,
+        start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[dict]:
+        """Lecturas de la planta, opcionalmente limitadas a [start, end)"""
+
+    @abstractmethod
+    def iter_range(
+        self, plant_id: str, start: datetime, end: datetime, fields: Sequence[str], batch_size: int
+    ) -> AsyncIterator[List[dict]]:
+        """Lotes de documentos de [start, end) en orden temporal con `fecha` y `fields`"""
+
+    @abstractmethod
+    async def delete_by_plant(self, plant_id: str) -> int:
+        """Borra todas las lecturas de la planta; devuelve cuántas había"""
+
+
+class PlantRepository(ABC):
+    @abstractmethod
+    async def insert(self, document: dict) -> ObjectId:
+        ...
+
+    @abstractmethod
+    async def find_by_id(self, plant_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def list(self, projection: Optional[dict] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def update(self, plant_id: ObjectId, fields: dict) -> Optional[dict]:
+        """Aplica `$set` y devuelve el documento resultante (None si no existe)"""
+
+    @abstractmethod
+    async def delete(self, plant_id: ObjectId) -> bool:
+        ...
+
+    @abstractmethod
+    async def set_last_reading(self, plant_ids: Iterable[ObjectId], fecha: datetime):
+        ...
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def insert(self, document: dict) -> ObjectId:
+        """DuplicateKeyError si el `username` ya existe"""
+
+    @abstractmethod
+    async def find_by_id(self, user_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def find_by_username(self, username: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def list(self, projection: Optional[dict] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def update(self, user_id: ObjectId, fields: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def delete(self, user_id: ObjectId) -> bool:
+        ...
+
+
+class MongoReadingRepository(ReadingRepository):
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else db["lecturas"]
+
+    async def insert(self, document: dict) -> ObjectId:
+        result = await self.collection.insert_one(document)
+        return result.inserted_id
+
+    async def insert_many_unordered(self, documents: List[dict]) -> Tuple[List[dict], int]:
+        return await insert_unordered(self.collection, documents)
+
+    async def find_by_id(self, reading_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"_id": reading_id}, projection)
+
+    async def find_by_acceptance_id(self, acceptance_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"id_aceptacion": acceptance_id}, projection)
+
+    async def find_by_plant(
+        self, plant_id: str, projection: Optional[dict] = None,
+        start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[dict]:
+        query = {"planta_id": plant_id}
+        if start is not None or end is not None:
+            query["fecha"] = {}
+            if start is not None:
+                query["fecha"]["$gte"] = start
+            if end is not None:
+                query["fecha"]["$lt"] = end
+        cursor = self.collection.find(query, projection)
+        return await cursor.to_list(length=None)
+
+    async def iter_range(
+        self, plant_id: str, start: datetime, end: datetime, fields: Sequence[str], batch_size: int
+    ) -> AsyncIterator[List[dict]]:
+        projection = {"_id": 0, "fecha": 1, **{name: 1 for name in fields}}
+        cursor = self.collection.find(
+            {"planta_id": plant_id, "fecha": {"$gte": start, "$lt": end}}, projection
+        ).sort("fecha", 1).batch_size(batch_size)
+        while True:
+            batch = await cursor.to_list(length=batch_size)
+            if not batch:
+                return
+            yield batch
+
+    async def delete_by_plant(self, plant_id: str) -> int:
+        result = await self.collection.delete_many({"planta_id": plant_id})
+        return result.deleted_count
+
+
+class MongoPlantRepository(PlantRepository):
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else db["plantas"]
+
+    async def insert(self, document: dict) -> ObjectId:
+        result = await self.collection.insert_one(document)
+        return result.inserted_id
+
+    async def find_by_id(self, plant_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"_id": plant_id}, projection)
+
+    async def list(self, projection: Optional[dict] = None) -> List[dict]:
+        return await self.collection.find({}, projection).to_list(length=None)
+
+    async def update(self, plant_id: ObjectId, fields: dict) -> Optional[dict]:
+        return await self.collection.find_one_and_update(
+            {"_id": plant_id}, {"$set": fields}, return_document=ReturnDocument.AFTER
+        )
+
+    async def delete(self, plant_id: ObjectId) -> bool:
+        result = await self.collection.delete_one({"_id": plant_id})
+        return result.deleted_count == 1
+
+    async def set_last_reading(self, plant_ids: Iterable[ObjectId], fecha: datetime):
+        await self.collection.update_many({"_id": {"$in": list(plant_ids)}}, {"$set": {"ultima_lectura": fecha}})
+
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, collection=None):
+        self.collection = collection if collection is not None else db["users"]
+
+    async def insert(self, document: dict) -> ObjectId:
+        result = await self.collection.insert_one(document)
+        return result.inserted_id
+
+    async def find_by_id(self, user_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"_id": user_id}, projection)
+
+    async def find_by_username(self, username: str) -> Optional[dict]:
+        return await self.collection.find_one({"username": username})
+
+    async def list(self, projection: Optional[dict] = None) -> List[dict]:
+        return await self.collection.find({}, projection).to_list(length=None)
+
+    async def update(self, user_id: ObjectId, fields: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one_and_update(
+            {"_id": user_id}, {"$set": fields}, projection=projection, return_document=ReturnDocument.AFTER
+        )
+
+    async def delete(self, user_id: ObjectId) -> bool:
+        result = await self.collection.delete_one({"_id": user_id})
+        return result.deleted_count == 1
+
+
+def build_repositories(backend: str = STORAGE_BACKEND) -> Tuple[ReadingRepository, PlantRepository, UserRepository]:
+    if backend == "memory":
+        from data.db.memory_store import MemoryPlantRepository, MemoryReadingRepository, MemoryUserRepository
+        return MemoryReadingRepository(), MemoryPlantRepository(), MemoryUserRepository()
+    if backend == "sqlite":
+        from data.db.sqlite_store import (
+            SqliteDatabase, SqlitePlantRepository, SqliteReadingRepository, SqliteUserRepository
+        )
+        database = SqliteDatabase()
+        return SqliteReadingRepository(database), SqlitePlantRepository(database), SqliteUserRepository(database)
+    if backend != "mongo":
+        raise ValueError(f"STORAGE_BACKEND desconocido: {backend}")
+    return MongoReadingRepository(), MongoPlantRepository(), MongoUserRepository()
+
+
+# Compartidos por todos los servicios del proceso (el motor en memoria guarda el estado aquí)
+reading_repository, plant_repository, user_repository = build_repositories()
@@ -0,0 +1,339 @@
+"""Almacenamiento SQLite local para el modo edge (STORAGE_BACKEND=sqlite).
+
+Un único archivo en modo WAL con una conexión que solo usa un hilo propio,
+de modo que las llamadas no bloquean el bucle de eventos. Las lecturas van
+a una tabla con columnas tipadas (fecha en ms) indexada por (planta_id,
+fecha); sus inserciones se agrupan: todas las que llegan mientras se escribe
+el lote anterior se confirman juntas en una sola transacción. Plantas y
+usuarios se guardan como documentos BSON. La columna `seq` da el orden de
+inserción que usa el subidor hacia el servidor central.
+"""
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from actions.api.models.models import LECTURA_METRICS
+from data.db.memory_store import project
+from data.db.repositories import DUPLICATE_KEY_CODE, PlantRepository, ReadingRepository, UserRepository
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "agricultura.sqlite3")
+EPOCH = datetime(1970, 1, 1)
+
+READING_COLUMNS = ("planta_id", "fecha", *LECTURA_METRICS, "notas", "dispositivo_id", "secuencia")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS lecturas (
+    seq INTEGER PRIMARY KEY,
+    id BLOB NOT NULL UNIQUE,
+    planta_id TEXT,
+    fecha INTEGER NOT NULL,
+    {", ".join(f"{name} REAL" for name in LECTURA_METRICS)},
+    notas TEXT,
+    dispositivo_id TEXT,
+    secuencia INTEGER
+);
+CREATE INDEX IF NOT EXISTS lecturas_planta_fecha ON lecturas (planta_id, fecha);
+CREATE UNIQUE INDEX IF NOT EXISTS lecturas_dispositivo_secuencia ON lecturas (dispositivo_id, secuencia)
+    WHERE dispositivo_id IS NOT NULL AND secuencia IS NOT NULL;
+CREATE TABLE IF NOT EXISTS plantas (id BLOB PRIMARY KEY, doc BLOB NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS users (id BLOB PRIMARY KEY, username TEXT NOT NULL UNIQUE, doc BLOB NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS puntos_control (clave TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+"""
+
+_INSERT_READING = (
+    f"INSERT INTO lecturas (id, {', '.join(READING_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * (len(READING_COLUMNS) + 1))})"
+)
+
+
+def to_ms(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def from_ms(value: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=value)
+
+
+def _duplicate(error: sqlite3.IntegrityError) -> DuplicateKeyError:
+    return DuplicateKeyError(f"E11000 duplicate key error: {error}", DUPLICATE_KEY_CODE)
+
+
+class SqliteDatabase:
+    """Conexión SQLite atendida por un solo hilo, con confirmación en grupo de lecturas"""
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[tuple, asyncio.Future]] = []
+        self._flushing: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # Con WAL, NORMAL no pierde consistencia ante un corte; solo las últimas transacciones
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def _call(self, function, args):
+        if self._connection is None:
+            self._connection = self._connect()
+        return function(self._connection, *args)
+
+    async def run(self, function, *args):
+        """Ejecuta `function(conexión, *args)` en el hilo de la base de datos"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, function, args)
+
+    async def insert_reading(self, row: tuple):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future))
+        if self._flushing is None:
+            self._flushing = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self):
+        try:
+            # Deja que se acumulen las inserciones de esta vuelta del bucle
+            await asyncio.sleep(0)
+            while self._pending:
+                batch, self._pending = self._pending, []
+                try:
+                    results = await self.run(_insert_readings, [row for row, _ in batch])
+                except Exception as e:
+                    results = [e] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._flushing = None
+
+    def close(self):
+        def _close(connection):
+            connection.close()
+        if self._connection is not None:
+            self._executor.submit(self._call, _close, ()).result()
+            self._connection = None
+
+
+def _insert_readings(connection: sqlite3.Connection, rows: List[tuple]) -> list:
+    results = []
+    connection.execute("BEGIN")
+    try:
+        for row in rows:
+            try:
+                connection.execute(_INSERT_READING, row)
+                results.append(None)
+            except sqlite3.IntegrityError as e:
+                # El fallo de una sentencia no deshace el resto de la transacción
+                results.append(_duplicate(e))
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    return results
+
+
+def _reading_row(document: dict) -> tuple:
+    values = []
+    for name in READING_COLUMNS:
+        value = document.get(name)
+        values.append(to_ms(value) if name == "fecha" else value)
+    return (document["_id"].binary, *values)
+
+
+def _reading_document(names: Sequence[str], row: tuple) -> dict:
+    document = {}
+    for name, value in zip(names, row):
+        if name == "id":
+            document["_id"] = ObjectId(value)
+        elif name == "fecha":
+            document["fecha"] = from_ms(value)
+        elif name in ("dispositivo_id", "secuencia") and value is None:
+            # Como en Mongo: las lecturas sin idempotencia no guardan estos campos
+            continue
+        else:
+            document[name] = value
+    return document
+
+
+class SqliteReadingRepository(ReadingRepository):
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    async def insert(self, document: dict) -> ObjectId:
+        document.setdefault("_id", ObjectId())
+        await self.database.insert_reading(_reading_row(document))
+        return document["_id"]
+
+    async def insert_many_unordered(self, documents: List[dict]) -> Tuple[List[dict], int]:
+        results = await asyncio.gather(*(self.insert(doc) for doc in documents), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, DuplicateKeyError):
+                raise result
+        stored = [doc for doc, result in zip(documents, results) if not isinstance(result, Exception)]
+        return stored, len(documents) - len(stored)
+
+    async def _select(self, where: str, params: tuple, columns: Sequence[str] = ("id", *READING_COLUMNS)) -> List[dict]:
+        query = f"SELECT {', '.join(columns)} FROM lecturas WHERE {where}"
+        rows = await self.database.run(lambda connection: connection.execute(query, params).fetchall())
+        return [_reading_document(columns, row) for row in rows]
+
+    async def find_by_id(self, reading_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        documents = await self._select("id = ?", (reading_id.binary,))
+        return project(documents[0], projection) if documents else None
+
+    async def find_by_acceptance_id(self, acceptance_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        # El spool de ingesta solo existe con MongoDB
+        return None
+
+    async def find_by_plant(
+        self, plant_id: str, projection: Optional[dict] = None,
+        start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[dict]:
+        where, params = "planta_id = ?", (plant_id,)
+        if start is not None:
+            where, params = where + " AND fecha >= ?", params + (to_ms(start),)
+        if end is not None:
+            where, params = where + " AND fecha < ?", params + (to_ms(end),)
+        documents = await self._select(where + " ORDER BY fecha, seq", params)
+        return [project(doc, projection) for doc in documents]
+
+    async def iter_range(
+        self, plant_id: str, start: datetime, end: datetime, fields: Sequence[str], batch_size: int
+    ) -> AsyncIterator[List[dict]]:
+        columns = ("seq", "fecha", *fields)
+        last = (to_ms(start) - 1, 0)
+        while True:
+            # Paginación por (fecha, seq) sobre el índice (planta_id, fecha)
+            documents = await self._select(
+                "planta_id = ? AND fecha >= ? AND fecha < ? AND (fecha > ? OR (fecha = ? AND seq > ?)) "
+                "ORDER BY fecha, seq LIMIT ?",
+                (plant_id, to_ms(start), to_ms(end), last[0], last[0], last[1], batch_size), columns
+            )
+            if not documents:
+                return
+            last = (to_ms(documents[-1]["fecha"]), documents[-1]["seq"])
+            for doc in documents:
+                del doc["seq"]
+            yield documents
+
+    async def delete_by_plant(self, plant_id: str) -> int:
+        cursor = await self.database.run(
+            lambda connection: connection.execute("DELETE FROM lecturas WHERE planta_id = ?", (plant_id,))
+        )
+        return cursor.rowcount
+
+    async def since(self, seq: int, limit: int) -> List[Tuple[int, dict]]:
+        """Lecturas en orden de inserción posteriores a `seq` (para el subidor)"""
+        columns = ("seq", "id", *READING_COLUMNS)
+        documents = await self._select("seq > ? ORDER BY seq LIMIT ?", (seq, limit), columns)
+        return [(doc.pop("seq"), doc) for doc in documents]
+
+    async def get_checkpoint(self, key: str) -> int:
+        rows = await self.database.run(
+            lambda connection: connection.execute("SELECT valor FROM puntos_control WHERE clave = ?", (key,)).fetchall()
+        )
+        return rows[0][0] if rows else 0
+
+    async def set_checkpoint(self, key: str, value: int):
+        await self.database.run(lambda connection: connection.execute(
+            "INSERT INTO puntos_control (clave, valor) VALUES (?, ?) "
+            "ON CONFLICT (clave) DO UPDATE SET valor = excluded.valor", (key, value)
+        ))
+
+
+class _SqliteDocuments:
+    """Documentos BSON por `_id` en una tabla (id, doc)"""
+
+    table = ""
+
+    def __init__(self, database: SqliteDatabase):
+        self.database = database
+
+    async def find_by_id(self, document_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        rows = await self.database.run(lambda connection: connection.execute(
+            f"SELECT doc FROM {self.table} WHERE id = ?", (document_id.binary,)
+        ).fetchall())
+        return project(bson.decode(rows[0][0]), projection) if rows else None
+
+    async def list(self, projection: Optional[dict] = None) -> List[dict]:
+        rows = await self.database.run(
+            lambda connection: connection.execute(f"SELECT doc FROM {self.table} ORDER BY id").fetchall()
+        )
+        return [project(bson.decode(row[0]), projection) for row in rows]
+
+    def _update_in(self, connection, document_id: ObjectId, fields: dict) -> Optional[dict]:
+        row = connection.execute(f"SELECT doc FROM {self.table} WHERE id = ?", (document_id.binary,)).fetchone()
+        if row is None:
+            return None
+        document = bson.decode(row[0])
+        document.update(fields)
+        connection.execute(f"UPDATE {self.table} SET doc = ? WHERE id = ?", (bson.encode(document), document_id.binary))
+        return document
+
+    async def delete(self, document_id: ObjectId) -> bool:
+        cursor = await self.database.run(
+            lambda connection: connection.execute(f"DELETE FROM {self.table} WHERE id = ?", (document_id.binary,))
+        )
+        return cursor.rowcount == 1
+
+
+class SqlitePlantRepository(_SqliteDocuments, PlantRepository):
+    table = "plantas"
+
+    async def insert(self, document: dict) -> ObjectId:
+        document.setdefault("_id", ObjectId())
+        await self.database.run(lambda connection: connection.execute(
+            "INSERT INTO plantas (id, doc) VALUES (?, ?)", (document["_id"].binary, bson.encode(document))
+        ))
+        return document["_id"]
+
+    async def update(self, plant_id: ObjectId, fields: dict) -> Optional[dict]:
+        return await self.database.run(self._update_in, plant_id, fields)
+
+    async def set_last_reading(self, plant_ids: Iterable[ObjectId], fecha: datetime):
+        def _set(connection, ids):
+            for plant_id in ids:
+                self._update_in(connection, plant_id, {"ultima_lectura": fecha})
+        await self.database.run(_set, list(plant_ids))
+
+
+class SqliteUserRepository(_SqliteDocuments, UserRepository):
+    table = "users"
+
+    async def insert(self, document: dict) -> ObjectId:
+        document.setdefault("_id", ObjectId())
+
+        def _insert(connection):
+            try:
+                connection.execute(
+                    "INSERT INTO users (id, username, doc) VALUES (?, ?, ?)",
+                    (document["_id"].binary, document["username"], bson.encode(document))
+                )
+            except sqlite3.IntegrityError as e:
+                raise _duplicate(e)
+        await self.database.run(_insert)
+        return document["_id"]
+
+    async def find_by_username(self, username: str) -> Optional[dict]:
+        rows = await self.database.run(lambda connection: connection.execute(
+            "SELECT doc FROM users WHERE username = ?", (username,)
+        ).fetchall())
+        return bson.decode(rows[0][0]) if rows else None
+
+    async def update(self, user_id: ObjectId, fields: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        document = await self.database.run(self._update_in, user_id, fields)
+        return project(document, projection) if document else None
@@ -0,0 +1,103 @@
+"""Mide la latencia y los viajes a MongoDB de las rutas de escritura del API.
+
+Lanza `--repeticiones` peticiones secuenciales por ruta contra un API en
+marcha e informa p50/p95 y los comandos de Mongo por petición, leídos de la
+cabecera Server-Timing (TRACE_SERVER_TIMING=1 en el servidor). Para comparar
+dos versiones se ejecuta contra cada una con los mismos parámetros.
+
+Rutas medidas:
+    register      POST /auth/register
+    crear_planta  POST /plants/
+    editar_planta PUT  /plants/{id}
+    editar_usuario PUT /users/{id}
+    crear_lectura POST /readings/
+
+Ejemplo:
+    python -m data.seed.bench_escrituras --url http://localhost:5055 --token $TOKEN --repeticiones 500
+"""
+import argparse
+import os
+import re
+import statistics
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+MONGO_METRIC = re.compile(r'mongo\.\w+;dur=[\d.]+(?:;desc="x(\d+)")?')
+
+
+def mongo_round_trips(server_timing: str) -> int:
+    """Suma los comandos `mongo.*` de una cabecera Server-Timing"""
+    return sum(int(count or 1) for count in MONGO_METRIC.findall(server_timing or ""))
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def measure(name: str, send: Callable[[int], object], repetitions: int) -> Dict[str, float]:
+    latencies, trips = [], []
+    for index in range(repetitions):
+        began = time.perf_counter()
+        response = send(index)
+        latencies.append((time.perf_counter() - began) * 1000)
+        response.raise_for_status()
+        trips.append(mongo_round_trips(response.headers.get("server-timing")))
+    return {
+        "ruta": name, "p50_ms": statistics.median(latencies), "p95_ms": percentile(latencies, 0.95),
+        "mongo_por_peticion": statistics.mean(trips)
+    }
+
+
+def run(args) -> List[Dict[str, float]]:
+    import httpx
+
+    prefix = uuid.uuid4().hex[:8]
+    params = {"token": args.token} if args.token else {}
+    with httpx.Client(base_url=args.url, params=params, timeout=30) as client:
+        plant = client.post("/plants/", json={"nombre": f"bench-{prefix}"}).raise_for_status().json()
+        user = client.post("/auth/register", json={
+            "username": f"bench-{prefix}", "password": "bench-password",
+            "nombre": "Bench", "apellido": "Escrituras"
+        }).raise_for_status().json()
+
+        routes: List[Tuple[str, Callable[[int], object]]] = [
+            ("register", lambda i: client.post("/auth/register", json={
+                "username": f"bench-{prefix}-{i}", "password": "bench-password",
+                "nombre": "Bench", "apellido": str(i)
+            })),
+            ("crear_planta", lambda i: client.post("/plants/", json={"nombre": f"bench-{prefix}-{i}"})),
+            ("editar_planta", lambda i: client.put(f"/plants/{plant['id']}", json={"descripcion": str(i)})),
+            ("editar_usuario", lambda i: client.put(f"/users/{user['id']}", json={"apellido": str(i)})),
+            ("crear_lectura", lambda i: client.post("/readings/", json={
+                "planta_id": plant["id"], "humedad": 50.0, "temperatura": 21.0, "ec": 1.4, "ph": 6.4
+            }))
+        ]
+        return [measure(name, send, args.repeticiones) for name, send in routes if name in args.rutas]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5055")
+    parser.add_argument("--token", default=os.getenv("API_TOKEN"), help="JWT de un investigador o admin")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    parser.add_argument(
+        "--rutas", nargs="+",
+        default=["register", "crear_planta", "editar_planta", "editar_usuario", "crear_lectura"]
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    print(f"{'ruta':<16}{'p50 ms':>10}{'p95 ms':>10}{'mongo/pet':>12}")
+    for row in run(args):
+        print(f"{row['ruta']:<16}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['mongo_por_peticion']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
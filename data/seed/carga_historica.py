@@ -0,0 +1,97 @@
+"""Carga histórica de volcados de registradores (CSV o NDJSON) vía el API.
+
+El archivo se envía en streaming a POST /readings/carga sin cargarlo en
+memoria. Si la conexión se corta, se reintenta con el mismo `carga_id`: el
+servidor salta las filas ya confirmadas y descarta duplicados por
+(dispositivo_id, secuencia).
+
+Ejemplos:
+    python -m data.seed.carga_historica lecturas_2019.csv --planta 65f0... --token $TOKEN
+    python -m data.seed.carga_historica volcado.ndjson --carga-id granja-norte-2019
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from typing import Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+CHUNK_BYTES = 1 << 20
+
+
+def iter_file(path: str, chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Lee el archivo por bloques e informa del avance en stderr"""
+    total = os.path.getsize(path) or 1
+    sent = 0
+    began = time.perf_counter()
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(chunk_bytes)
+            if not chunk:
+                break
+            sent += len(chunk)
+            elapsed = max(time.perf_counter() - began, 1e-6)
+            print(f"\r{sent / total:6.1%}  {sent / elapsed / 1e6:,.1f} MB/s", end="", file=sys.stderr)
+            yield chunk
+    print(file=sys.stderr)
+
+
+def detect_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def upload(args) -> dict:
+    import httpx
+
+    params = {"formato": args.formato or detect_format(args.archivo), "carga_id": args.carga_id}
+    if args.planta:
+        params["planta_id"] = args.planta
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+
+    with httpx.Client(base_url=args.url, headers=headers, timeout=httpx.Timeout(30, read=None)) as client:
+        for attempt in range(1, args.reintentos + 1):
+            try:
+                response = client.post("/readings/carga", params=params, content=iter_file(args.archivo))
+                if response.status_code == 409:
+                    raise httpx.HTTPError("la carga sigue en curso en el servidor")
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                if attempt == args.reintentos:
+                    raise
+                wait = min(2 ** attempt, 60)
+                print(f"Intento {attempt} fallido ({e}); se reanuda en {wait}s", file=sys.stderr)
+                time.sleep(wait)
+    raise RuntimeError("sin intentos")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archivo", help="Archivo .csv o .ndjson")
+    parser.add_argument("--url", default="http://localhost:5055")
+    parser.add_argument("--token", default=os.getenv("API_TOKEN"), help="JWT (por defecto API_TOKEN)")
+    parser.add_argument("--planta", help="Planta para las filas sin planta_id")
+    parser.add_argument("--formato", choices=("csv", "ndjson"), help="Por defecto según la extensión")
+    parser.add_argument("--carga-id", default=None, help="Repetir el id reanuda una carga interrumpida")
+    parser.add_argument("--reintentos", type=int, default=5)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+    args.carga_id = args.carga_id or uuid.uuid4().hex
+    print(f"carga_id={args.carga_id}", file=sys.stderr)
+    result = upload(args)
+    print(
+        f"{result['estado']}: {result['insertadas']} insertadas, {result['duplicadas']} duplicadas, "
+        f"{result['rechazadas']} rechazadas de {result['filas_leidas']} filas"
+    )
+    for error in result.get("errores", [])[:10]:
+        print(f"  fila {error['fila']}: {error['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Simulador de una flota de sensores y cargador masivo de datos.
+
+Modos:
+    bulk  genera meses de lecturas para miles de plantas y las inserta en
+          MongoDB con `insert_many` sin orden desde varios procesos.
+    live  envía lecturas al API en marcha a una tasa objetivo para pruebas
+          de carga (POST /readings/ o /readings/batch). Con --token cada
+          dispositivo simulado tiene su propio cubo de limitación; sin él
+          solo RATE_LIMIT_DEVICES_PER_IP lo tienen y el resto comparte el
+          cubo anónimo de la IP (se mide sobre todo 429).
+
+Ejemplos:
+    python -m data.seed.simulator bulk --plantas 2000 --dias 90 --workers 8
+    python -m data.seed.simulator live --url http://localhost:5055 --tasa 500 --token $TOKEN
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DAY = 86400.0
+
+
+class PlantProfile:
+    """Parámetros aleatorios pero estables de una planta (a partir de su semilla)"""
+
+    def __init__(self, seed: int):
+        rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.temp_base = rng.uniform(16, 26)
+        self.temp_amplitude = rng.uniform(3, 9)
+        self.humidity_base = rng.uniform(45, 75)
+        self.ph_base = rng.uniform(5.6, 7.2)
+        self.ec_base = rng.uniform(0.8, 2.4)
+        self.npk_base = rng.uniform([8, 4, 6], [20, 12, 16])
+        self.irrigations_per_day = rng.uniform(1, 4)
+        self.dropout_rate = rng.uniform(0.002, 0.02)
+
+
+def generate_series(profile: PlantProfile, start: datetime, days: float, interval: float) -> Dict[str, np.ndarray]:
+    """Serie vectorizada de una planta: ciclos diarios, riegos, deriva y cortes"""
+    rng = np.random.default_rng(profile.seed + 1)
+    n = int(days * DAY / interval)
+    t = np.arange(n) * interval + rng.uniform(0, interval * 0.2, n)
+    hours = (t / 3600.0 + start.hour) % 24
+
+    # Temperatura: máximo hacia las 15 h, con ruido
+    diurnal = np.sin(2 * np.pi * (hours - 9) / 24)
+    temperatura = profile.temp_base + profile.temp_amplitude * diurnal + rng.normal(0, 0.4, n)
+
+    # Riegos: picos de humedad con decaimiento exponencial (~3 h)
+    irrigation = np.zeros(n)
+    events = rng.random(n) < profile.irrigations_per_day * interval / DAY
+    irrigation[events] = rng.uniform(10, 25, events.sum())
+    decay = np.exp(-interval / (3 * 3600))
+    pulses = np.zeros(n)
+    for i in np.flatnonzero(events):  # pocos eventos: bucle acotado
+        length = min(n - i, int(12 * 3600 / interval) + 1)
+        pulses[i:i + length] += irrigation[i] * decay ** np.arange(length)
+    humedad = np.clip(
+        profile.humidity_base - 0.8 * profile.temp_amplitude * diurnal + pulses + rng.normal(0, 1.0, n),
+        5, 100
+    )
+
+    # pH y EC: paseo aleatorio lento con reversión a la media
+    def drift(base, step, revert):
+        noise = rng.normal(0, step, n)
+        values = np.empty(n)
+        current = base
+        for i in range(0, n, 1024):  # por bloques para mantenerlo vectorizado
+            block = noise[i:i + 1024].cumsum() + current
+            values[i:i + 1024] = block
+            current = base + (block[-1] - base) * (1 - revert)
+        return values
+
+    ph = drift(profile.ph_base, 0.003, 0.05)
+    ec = np.clip(drift(profile.ec_base, 0.004, 0.05) + 0.002 * pulses, 0.1, None)
+
+    # Nutrientes: se consumen poco a poco y se reponen cada semana
+    cycle = (t % (7 * DAY)) / (7 * DAY)
+    npk = profile.npk_base[:, None] * (1.0 - 0.5 * cycle) + rng.normal(0, 0.2, (3, n))
+
+    # Cortes: rachas de lecturas perdidas
+    lost = rng.random(n) < profile.dropout_rate
+    outage = np.convolve(lost.astype(float), np.ones(int(rng.integers(2, 30))), mode="same") > 0
+    keep = ~outage
+
+    times = np.datetime64(start, "ms") + (t[keep] * 1000).astype("timedelta64[ms]")
+    return {
+        "fecha": times,
+        "temperatura": np.round(temperatura[keep], 2),
+        "humedad": np.round(humedad[keep], 2),
+        "ph": np.round(ph[keep], 3),
+        "ec": np.round(ec[keep], 3),
+        "nitrogeno": np.round(npk[0][keep], 2),
+        "fosforo": np.round(npk[1][keep], 2),
+        "potasio": np.round(npk[2][keep], 2),
+    }
+
+
+def iter_documents(plant_id: str, series: Dict[str, np.ndarray]) -> Iterator[dict]:
+    fechas = series["fecha"].astype(datetime)
+    columns = [(name, values.tolist()) for name, values in series.items() if name != "fecha"]
+    for i, fecha in enumerate(fechas):
+        doc = {"planta_id": plant_id, "fecha": fecha}
+        for name, values in columns:
+            doc[name] = values[i]
+        yield doc
+
+
+def _load_plants(uri: str, db_name: str, plants: List[tuple], start: datetime, days: float, interval: float, batch: int) -> int:
+    """Trabajo de un proceso: genera e inserta las lecturas de sus plantas"""
+    from pymongo import MongoClient
+    from pymongo.errors import BulkWriteError
+
+    client = MongoClient(uri, w=1)
+    collection = client[db_name]["lecturas"]
+    inserted = 0
+    buffer = []
+    for plant_id, seed in plants:
+        series = generate_series(PlantProfile(seed), start, days, interval)
+        for doc in iter_documents(plant_id, series):
+            buffer.append(doc)
+            if len(buffer) >= batch:
+                inserted += _flush(collection, buffer, BulkWriteError)
+                buffer = []
+    if buffer:
+        inserted += _flush(collection, buffer, BulkWriteError)
+    client.close()
+    return inserted
+
+
+def _flush(collection, buffer: list, bulk_error) -> int:
+    try:
+        return len(collection.insert_many(buffer, ordered=False, bypass_document_validation=True).inserted_ids)
+    except bulk_error as e:
+        return e.details.get("nInserted", 0)
+
+
+def run_bulk(args):
+    from pymongo import MongoClient
+
+    uri = args.uri or os.getenv("MONGO_URI")
+    if not uri:
+        raise SystemExit("MONGO_URI no configurada (use --uri)")
+    db_name = args.db or os.getenv("MONGO_DB_NAME", "agricultura_db")
+    db = MongoClient(uri)[db_name]
+    if args.drop:
+        simulated = [str(p["_id"]) for p in db.plantas.find({"simulada": True}, {"_id": 1})]
+        db.lecturas.delete_many({"planta_id": {"$in": simulated}})
+        db.plantas.delete_many({"simulada": True})
+
+    start = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(days=args.dias)
+    plants = []
+    for i in range(args.plantas):
+        plant_id = ObjectId()
+        plants.append({
+            "_id": plant_id,
+            "nombre": f"Planta simulada {i + 1}",
+            "especie": "simulada",
+            "simulada": True,
+            "creado_en": start,
+            "actualizado_en": start
+        })
+    db.plantas.insert_many(plants, ordered=False)
+    work = [(str(p["_id"]), args.semilla + i) for i, p in enumerate(plants)]
+
+    began = time.perf_counter()
+    total = 0
+    # Grupos pequeños de plantas para repartir carga y reportar progreso
+    chunks = [work[i:i + 16] for i in range(0, len(work), 16)]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(_load_plants, uri, db_name, chunk, start, args.dias, args.intervalo, args.lote)
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            total += future.result()
+            elapsed = time.perf_counter() - began
+            print(f"{total} lecturas insertadas ({total / elapsed:,.0f}/s)")
+
+    elapsed = time.perf_counter() - began
+    print(f"Listo: {args.plantas} plantas, {total} lecturas en {elapsed:.1f}s ({total / elapsed:,.0f}/s)")
+
+
+def request_headers(token: Optional[str], device_id: str) -> Dict[str, str]:
+    """Sin token X-Device-Id solo separa cubos hasta RATE_LIMIT_DEVICES_PER_IP dispositivos"""
+    headers = {"X-Device-Id": device_id}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
+
+
+def rejected_share(statuses: Dict[int, int]) -> float:
+    """Fracción de peticiones rechazadas por el limitador (429)"""
+    total = sum(statuses.values())
+    return statuses.get(429, 0) / total if total else 0.0
+
+
+async def run_live(args):
+    import httpx
+
+    rng = np.random.default_rng(args.semilla)
+    plant_ids = args.planta or [str(ObjectId()) for _ in range(args.plantas)]
+    profiles = [PlantProfile(args.semilla + i) for i in range(len(plant_ids))]
+    sequences = [0] * len(plant_ids)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    semaphore = asyncio.Semaphore(args.concurrencia)
+
+    def next_reading(index: int) -> dict:
+        profile = profiles[index]
+        sequences[index] += 1
+        hour = datetime.utcnow().hour
+        diurnal = np.sin(2 * np.pi * (hour - 9) / 24)
+        return {
+            "planta_id": plant_ids[index],
+            "dispositivo_id": f"sim-{plant_ids[index]}",
+            "secuencia": sequences[index],
+            "temperatura": round(profile.temp_base + profile.temp_amplitude * diurnal + rng.normal(0, 0.4), 2),
+            "humedad": round(profile.humidity_base + rng.normal(0, 1.0), 2),
+            "ph": round(profile.ph_base + rng.normal(0, 0.05), 3),
+            "ec": round(profile.ec_base + rng.normal(0, 0.05), 3),
+        }
+
+    async def send(client, index: int):
+        async with semaphore:
+            if args.lote > 1:
+                path, body = "/readings/batch", [next_reading(index) for _ in range(args.lote)]
+            else:
+                path, body = "/readings/", next_reading(index)
+            began = time.perf_counter()
+            try:
+                headers = request_headers(args.token, f"sim-{plant_ids[index]}")
+                response = await client.post(path, json=body, headers=headers)
+                code = response.status_code
+            except httpx.HTTPError:
+                code = 0
+            latencies.append(time.perf_counter() - began)
+            statuses[code] = statuses.get(code, 0) + 1
+
+    if not args.token:
+        print("Aviso: sin --token los dispositivos por encima de RATE_LIMIT_DEVICES_PER_IP comparten el límite anónimo de esta IP")
+    requests_per_second = args.tasa / max(args.lote, 1)
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        began = time.perf_counter()
+        tasks = set()
+        i = 0
+        while time.perf_counter() - began < args.duracion:
+            # Ritmo fijo: la petición i sale en began + i / tasa
+            delay = began + i / requests_per_second - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(send(client, i % len(plant_ids)))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            i += 1
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - began
+
+    lat = np.array(latencies) * 1000
+    print(f"{i} peticiones en {elapsed:.1f}s ({i / elapsed:,.1f}/s, {i * max(args.lote, 1) / elapsed:,.0f} lecturas/s)")
+    if len(lat):
+        print(f"latencia ms p50={np.percentile(lat, 50):.1f} p95={np.percentile(lat, 95):.1f} p99={np.percentile(lat, 99):.1f}")
+    print(f"códigos: {dict(sorted(statuses.items()))}")
+    print(f"rechazadas por límite (429): {statuses.get(429, 0)} ({rejected_share(statuses):.1%})")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="modo", required=True)
+
+    bulk = commands.add_parser("bulk", help="Carga masiva directa en MongoDB")
+    bulk.add_argument("--uri", help="URI de MongoDB (por defecto MONGO_URI)")
+    bulk.add_argument("--db", help="Base de datos (por defecto MONGO_DB_NAME)")
+    bulk.add_argument("--plantas", type=int, default=1000)
+    bulk.add_argument("--dias", type=float, default=90)
+    bulk.add_argument("--intervalo", type=float, default=300, help="Segundos entre lecturas")
+    bulk.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    bulk.add_argument("--lote", type=int, default=10000, help="Documentos por insert_many")
+    bulk.add_argument("--semilla", type=int, default=42)
+    bulk.add_argument("--drop", action="store_true", help="Vacía lecturas y plantas simuladas antes")
+
+    live = commands.add_parser("live", help="Prueba de carga contra el API")
+    live.add_argument("--url", default="http://localhost:5055")
+    live.add_argument("--plantas", type=int, default=100)
+    live.add_argument("--planta", action="append", help="ID de planta existente (repetible)")
+    live.add_argument("--tasa", type=float, default=100, help="Lecturas por segundo")
+    live.add_argument("--duracion", type=float, default=60, help="Segundos de prueba")
+    live.add_argument("--lote", type=int, default=1, help=">1 usa /readings/batch")
+    live.add_argument("--concurrencia", type=int, default=256)
+    live.add_argument("--semilla", type=int, default=42)
+    live.add_argument("--token", default=os.getenv("API_TOKEN"), help="JWT (por defecto API_TOKEN)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    if args.modo == "bulk":
+        run_bulk(args)
+    else:
+        asyncio.run(run_live(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,32 @@ from fastapi.middleware.cors import CORSMiddleware
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
+import asyncio
 import os
 from dotenv import load_dotenv
-from data.db.mongo import init_db, ensure_collections, users_collection
+from data.db.mongo import STORAGE_BACKEND, db, init_db, ensure_collections, users_collection
+from data.db.query_monitor import query_monitor
+from actions.api.middleware import RequestContextMiddleware
+from actions.api.tracing import TracingMiddleware
+from actions.api.loop_monitor import LOOP_MONITOR, loop_monitor
+from actions.api.log_pipeline import log_pipeline
 from actions.api.endpoints.lectura_router import router as reading_router  # Cambiado a reading_router
 from actions.api.endpoints.auth_router import router as auth_router
 from actions.api.endpoints.user_router import router as user_router
+from actions.api.endpoints.planta_router import router as plant_router
+from actions.api.endpoints.sync_router import router as sync_router
+from actions.api.endpoints.analytics_router import router as analytics_router
+from actions.api.endpoints.admin_router import router as admin_router
+from actions.api.endpoints.exportacion_router import router as export_router
 from actions.api.services.socket_manager import socket_manager  # WebSockets incluidos
+from actions.api.services.resumen_service import SummaryService
+from actions.api.services.analytics_service import analytics_service
+from actions.api.services.borrado_service import deletion_service
+from actions.api.services.exportacion_service import export_service
+from actions.api.services.subida_service import edge_uploader
+from actions.api.services.ingest_spool import ingest_spool
+from actions.api.services.lectura_service import ReadingService
+from actions.api.services.liveness_service import liveness_tracker
 from actions.api.endpoints import websocket_routes  # WebSockets incluidos
 
 load_dotenv()
@@ -35,22 +54,74 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Ruta de origen para el registro de consultas lentas
+app.add_middleware(RequestContextMiddleware)
+# Server-Timing y trazas muestreadas (TRACE_SERVER_TIMING, TRACE_SAMPLE_RATE)
+app.add_middleware(TracingMiddleware)
 
 # Incluir routers (original, con nombres actualizados!)
 app.include_router(auth_router)
 app.include_router(reading_router)
 app.include_router(user_router)
+app.include_router(plant_router)
+app.include_router(sync_router)
+app.include_router(analytics_router)
+app.include_router(admin_router)
+app.include_router(export_router)
 app.include_router(websocket_routes.router)
 
 @app.get("/")
 def read_root():
     return {"message": "API Agrícola funcionando correctamente"}
 
+# Tareas periódicas en segundo plano (se cancelan al apagar)
+background_tasks: List[asyncio.Task] = []
+
 # Eventos de inicio (original)
 @app.on_event("startup")
 async def startup_event():
+    # Registro JSON escrito desde un hilo de fondo (LOG_LEVEL, LOG_POLICIES)
+    log_pipeline.install()
+    socket_manager.start_heartbeat()
+    if LOOP_MONITOR:
+        loop_monitor.start()
+    if STORAGE_BACKEND != "mongo":
+        # Sin MongoDB: solo usuarios, plantas y lecturas (memoria o SQLite local)
+        if edge_uploader is not None:
+            edge_uploader.start()
+        await liveness_tracker.start()
+        return
+    if ingest_spool is not None:
+        # Antes que MongoDB: recupera y reproduce lo aceptado durante un corte
+        ingest_spool.start(ReadingService().store_spooled)
     await init_db()
     await ensure_collections()
+    query_monitor.start(db)
+    if os.getenv("WS_OUTBOX_MONGO", "0") == "1":
+        await socket_manager.outbox.enable_persistence(db)
+    background_tasks.append(asyncio.create_task(SummaryService().compaction_loop()))
+    await deletion_service.resume_pending()
+    await export_service.start()
+    # Plazos de los sensores desde plantas.ultima_lectura
+    await liveness_tracker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await socket_manager.stop_heartbeat()
+    await loop_monitor.stop()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await deletion_service.shutdown()
+    await export_service.shutdown()
+    await liveness_tracker.shutdown()
+    if edge_uploader is not None:
+        await edge_uploader.shutdown()
+    if ingest_spool is not None:
+        await ingest_spool.shutdown()
+    analytics_service.shutdown()
+    log_pipeline.stop()
 
 # Funciones de autenticación (original)
 async def get_current_user(token: str = Depends(oauth2_scheme)):
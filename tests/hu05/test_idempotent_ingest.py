@@ -0,0 +1,115 @@
+import asyncio
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from main import app
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import BulkWriteError
+from actions.api.models.models import LecturaCreate
+from actions.api.services.lectura_service import LecturaDuplicadaError, ReadingService
+from actions.api.services.replay_window import ReplayWindow
+from data.db.repositories import MongoReadingRepository, build_repositories
+
+client = TestClient(app)
+
+payload = {
+    "planta_id": "planta123",
+    "humedad": 60.0,
+    "temperatura": 24.5,
+    "ec": 1.5,
+    "ph": 6.9,
+    "dispositivo_id": "gw-01",
+    "secuencia": 42
+}
+
+def test_replay_window_detects_seen_sequences():
+    window = ReplayWindow(size=8)
+    window.mark("gw-01", 10)
+    window.mark("gw-01", 12)
+
+    assert window.seen("gw-01", 10)
+    assert window.seen("gw-01", 12)
+    assert not window.seen("gw-01", 11)
+    assert not window.seen("gw-02", 10)
+
+    # Fuera de la ventana no se puede afirmar nada: decide el índice único
+    window.mark("gw-01", 30)
+    assert not window.seen("gw-01", 12)
+
+def test_replay_window_evicts_oldest_device():
+    window = ReplayWindow(max_devices=2)
+    window.mark("a", 1)
+    window.mark("b", 1)
+    window.mark("c", 1)
+    assert len(window) == 2
+    assert not window.seen("a", 1)
+
+@patch("actions.api.services.lectura_service.ReadingService.create_reading", new_callable=AsyncMock)
+def test_duplicate_reading_is_acknowledged(mock_create_reading):
+    mock_create_reading.side_effect = LecturaDuplicadaError("gw-01", 42)
+
+    response = client.post("/readings/", json=payload)
+
+    assert response.status_code == 200
+    assert response.json() == {"duplicada": True, "dispositivo_id": "gw-01", "secuencia": 42}
+
+@patch("actions.api.services.lectura_service.ReadingService.create_readings_batch", new_callable=AsyncMock)
+def test_batch_ingest(mock_create_batch):
+    mock_create_batch.return_value = {"insertadas": 1, "duplicadas": 1}
+
+    response = client.post("/readings/batch", json=[payload, payload])
+
+    assert response.status_code == 200
+    assert response.json() == {"insertadas": 1, "duplicadas": 1, "rechazadas": 0}
+    assert len(mock_create_batch.call_args.args[0]) == 2
+
+def make_service(readings):
+    service = ReadingService()
+    service.readings = readings
+    service.plants = MagicMock(set_last_reading=AsyncMock())
+    service.replay_window = ReplayWindow()
+    service.spool = None
+    service.summary_service = None
+    service.liveness = MagicMock()
+    return service
+
+def test_unique_index_rejects_retry_missed_by_replay_window():
+    readings, _, _ = build_repositories("memory")
+    service = make_service(readings)
+    reading = LecturaCreate(**payload)
+
+    async def scenario():
+        created = await service.create_reading(reading)
+        # Otro proceso (o un reinicio) no tiene la secuencia en su ventana: decide el índice
+        service.replay_window = ReplayWindow()
+        with pytest.raises(LecturaDuplicadaError):
+            await service.create_reading(reading)
+        return created
+
+    created = asyncio.run(scenario())
+    assert created.id
+    assert service.replay_window.seen("gw-01", 42)
+
+def test_batch_counts_bulk_write_duplicates():
+    async def insert_many(documents, ordered):
+        # Como pymongo: asigna `_id` a cada documento antes de informar del error
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+        raise BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"}]})
+
+    collection = MagicMock(insert_many=AsyncMock(side_effect=insert_many))
+    service = make_service(MongoReadingRepository(collection))
+    batch = [LecturaCreate(**{**payload, "secuencia": n}) for n in (1, 2, 3)]
+
+    result = asyncio.run(service.create_readings_batch(batch))
+
+    assert result == {"insertadas": 2, "duplicadas": 1, "rechazadas": 0}
+    assert collection.insert_many.await_args.kwargs == {"ordered": False}
+    assert all(service.replay_window.seen("gw-01", n) for n in (1, 2, 3))
+
+def test_batch_propagates_non_duplicate_write_errors():
+    error = BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]})
+    service = make_service(MongoReadingRepository(MagicMock(insert_many=AsyncMock(side_effect=error))))
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(service.create_readings_batch([LecturaCreate(**payload)]))
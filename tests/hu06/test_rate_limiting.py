@@ -0,0 +1,97 @@
+from datetime import timedelta
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from main import app
+from unittest.mock import patch
+from actions.api.models.models import Role
+from actions.api.services.auth_service import AuthService
+from actions.api.services import rate_limiter
+from actions.api.services.rate_limiter import (
+    ANONYMOUS, AdmissionController, DeviceRegistry, _parse_limit, _token_cache, identify_caller
+)
+
+client = TestClient(app)
+
+LIMITS = {
+    ANONYMOUS: (1.0, 2.0),
+    Role.ADMIN.value: (10.0, 5.0),
+}
+
+def test_token_bucket_per_caller():
+    controller = AdmissionController(max_in_flight=100, limits=LIMITS)
+
+    assert controller.try_acquire("ip:a", ANONYMOUS, now=0.0) == 0
+    controller.release()
+    assert controller.try_acquire("ip:a", ANONYMOUS, now=0.0) == 0
+    controller.release()
+    # Tercera petición en ráfaga: debe esperar a que se recargue un token
+    assert controller.try_acquire("ip:a", ANONYMOUS, now=0.0) == 1.0
+    # Otro llamante tiene su propio presupuesto
+    assert controller.try_acquire("ip:b", ANONYMOUS, now=0.0) == 0
+    controller.release()
+    assert controller.try_acquire("ip:a", ANONYMOUS, now=1.0) == 0
+
+def test_limits_by_role():
+    controller = AdmissionController(max_in_flight=100, limits=LIMITS)
+    for _ in range(5):
+        assert controller.try_acquire("user:admin", Role.ADMIN.value, now=0.0) == 0
+        controller.release()
+    assert controller.try_acquire("user:admin", Role.ADMIN.value, now=0.0) > 0
+
+def test_global_in_flight_cap():
+    controller = AdmissionController(max_in_flight=1, limits=LIMITS)
+    assert controller.try_acquire("ip:a", ANONYMOUS, now=0.0) == 0
+    assert controller.try_acquire("ip:b", ANONYMOUS, now=0.0) > 0
+    controller.release()
+    assert controller.try_acquire("ip:b", ANONYMOUS, now=0.0) == 0
+
+@patch("actions.api.services.rate_limiter.readings_admission.try_acquire", return_value=2.5)
+def test_rejected_request_returns_429(mock_try_acquire):
+    response = client.get("/readings/plant/planta123")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+def make_request(headers: dict, host: str = "10.0.0.1") -> Request:
+    return Request({
+        "type": "http", "client": (host, 1234),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    })
+
+def test_anonymous_gateways_get_a_capped_number_of_device_buckets(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_anonymous_devices", DeviceRegistry(per_ip=2))
+    token = AuthService().create_access_token({"sub": "gw", "role": Role.AGRIC.value})
+    # Varios gateways tras la misma IP no comparten cubo...
+    assert identify_caller(make_request({"X-Device-Id": "a"})) == ("ip:10.0.0.1/device:a", ANONYMOUS)
+    assert identify_caller(make_request({"X-Device-Id": "b"})) == ("ip:10.0.0.1/device:b", ANONYMOUS)
+    assert identify_caller(make_request({"X-Device-Id": "a"})) == ("ip:10.0.0.1/device:a", ANONYMOUS)
+    # ...pero rotar el dispositivo no da cubos nuevos más allá del tope
+    assert identify_caller(make_request({"X-Device-Id": "c"})) == ("ip:10.0.0.1", ANONYMOUS)
+    assert identify_caller(make_request({"X-Device-Id": "c"}, host="10.0.0.2")) == ("ip:10.0.0.2/device:c", ANONYMOUS)
+    assert identify_caller(make_request({"Authorization": f"Bearer {token}", "X-Device-Id": "z"})) == (
+        "user:gw/device:z", Role.AGRIC.value
+    )
+
+def test_forwarded_address_is_only_trusted_from_known_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "TRUSTED_PROXIES", {"10.0.0.9"})
+    forwarded = {"X-Forwarded-For": "1.2.3.4, 5.6.7.8"}
+    # El último salto antes del proxy propio es el cliente; lo anterior lo pudo escribir él
+    assert identify_caller(make_request(forwarded, host="10.0.0.9")) == ("ip:5.6.7.8", ANONYMOUS)
+    assert identify_caller(make_request(forwarded, host="10.0.0.1")) == ("ip:10.0.0.1", ANONYMOUS)
+
+def test_cached_identity_expires_with_token():
+    token = AuthService().create_access_token({"sub": "gw", "role": Role.AGRIC.value}, timedelta(minutes=5))
+    request = make_request({"Authorization": f"Bearer {token}"})
+    assert identify_caller(request) == ("user:gw", Role.AGRIC.value)
+    key, role, _ = _token_cache[token]
+    _token_cache[token] = (key, role, 0.0)
+    # Entrada caducada: se vuelve a decodificar (aquí el token aún es válido)
+    assert identify_caller(request) == ("user:gw", Role.AGRIC.value)
+    assert _token_cache[token][2] > 0
+
+def test_limits_must_have_positive_rate():
+    assert _parse_limit("2:10", (1.0, 1.0)) == (2.0, 10.0)
+    for value in ("0", "0:10", "5:0.5", "-1:3"):
+        with pytest.raises(ValueError):
+            _parse_limit(value, (1.0, 1.0))
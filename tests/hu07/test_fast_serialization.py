@@ -0,0 +1,73 @@
+import json
+from datetime import datetime, timezone
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from actions.api.models.models import LecturaOut, PlantaOut, UserOut
+from actions.api.services.serializers import (
+    fast_json_response, plant_serializer, reading_serializer, user_serializer
+)
+
+reading_docs = [
+    {
+        "_id": ObjectId(),
+        "planta_id": "64b7f0c2a1b2c3d4e5f60718",
+        "humedad": 55,  # entero en Mongo: el modelo lo expone como float
+        "temperatura": 22.3,
+        "ec": 1.2,
+        "ph": 6.8,
+        "nitrogeno": 10.0,
+        "fecha": datetime(2025, 7, 19, 21, 24, 54, 401000),
+        "dispositivo_id": "gw-01",
+        "secuencia": 7
+    },
+    {
+        "_id": ObjectId(),
+        "humedad": 40.5,
+        "temperatura": 18,
+        "ec": 0.9,
+        "ph": 7,
+        "fosforo": 3,
+        "potasio": None,
+        "fecha": datetime(2025, 7, 20, 8, 0, tzinfo=timezone.utc),
+        "notas": "Lectura con ñ y acentos: día"
+    }
+]
+
+plant_docs = [
+    {"_id": ObjectId(), "nombre": "Tomate 1", "especie": "Solanum", "creado_en": datetime(2025, 1, 1)},
+    {"_id": ObjectId(), "nombre": "Lechuga", "ultima_lectura": datetime(2025, 7, 1, 12, 30)}
+]
+
+user_docs = [
+    {
+        "_id": ObjectId(),
+        "username": "admin",
+        "nombre": "Admin",
+        "apellido": "Test",
+        "role": "administradores",
+        "creado_en": datetime(2025, 3, 4, 5, 6, 7, 890000),
+        "hashed_password": "no-debe-salir"
+    }
+]
+
+def pydantic_path(model, documents):
+    return jsonable_encoder([model(**doc, id=str(doc["_id"])) for doc in documents])
+
+def test_readings_match_pydantic_output():
+    fast = json.loads(reading_serializer.dumps_many(reading_docs))
+    assert fast == pydantic_path(LecturaOut, reading_docs)
+    assert [list(item) for item in fast] == [list(item) for item in pydantic_path(LecturaOut, reading_docs)]
+
+def test_plants_match_pydantic_output():
+    assert json.loads(plant_serializer.dumps_many(plant_docs)) == pydantic_path(PlantaOut, plant_docs)
+
+def test_users_match_pydantic_output_without_password():
+    fast = json.loads(user_serializer.dumps(user_docs[0]))
+    assert fast == pydantic_path(UserOut, user_docs)[0]
+    assert "hashed_password" not in fast
+    assert "hashed_password" not in user_serializer.projection
+
+def test_response_accepts_pydantic_models():
+    lectura = LecturaOut(**reading_docs[0], id=str(reading_docs[0]["_id"]))
+    response = fast_json_response([lectura], reading_serializer)
+    assert json.loads(response.body) == jsonable_encoder([lectura])
@@ -0,0 +1,138 @@
+from datetime import datetime
+from bson import ObjectId
+from fastapi.testclient import TestClient
+import asyncio
+import base64
+import orjson
+from unittest.mock import AsyncMock, MagicMock, patch
+from main import app
+from actions.api.dependencies import auth_service, get_current_active_user
+from actions.api.models.models import UserInDB
+from actions.api.services import sync_service as sync_service_module
+from actions.api.services.borrado_service import DeletionService
+from actions.api.services.sync_service import SyncService, decode_token, encode_token
+
+client = TestClient(app)
+
+user_mock = UserInDB(
+    id="user123",
+    username="gateway",
+    nombre="Gateway",
+    apellido="Campo",
+    creado_en=datetime.utcnow(),
+    role="agricultores",
+    hashed_password="fakehashed"
+)
+
+def test_token_roundtrip():
+    reading_id, plant_id = ObjectId(), ObjectId()
+    tombstone_id = ObjectId()
+    token = encode_token(reading_id, 1721420000000, plant_id, tombstone_id)
+    assert decode_token(token) == (reading_id, 1721420000000, plant_id, tombstone_id)
+    assert decode_token(None) == (None, None, None, None)
+
+def test_v1_token_is_still_accepted_without_tombstone_cursor():
+    reading_id = ObjectId()
+    raw = orjson.dumps([1, str(reading_id), 0, None])
+    token = base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+    assert decode_token(token) == (reading_id, 0, None, None)
+
+def test_deleted_plant_reaches_sync_as_tombstone(monkeypatch):
+    plant_id = str(ObjectId())
+    tombstones = []
+
+    async def record(doc):
+        doc["_id"] = ObjectId()
+        tombstones.append(doc)
+
+    deletion = DeletionService()
+    deletion.jobs_collection = MagicMock()
+    deletion.jobs_collection.find_one = AsyncMock(return_value=None)
+    deletion.jobs_collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+    deletion.plants_collection = MagicMock()
+    deletion.plants_collection.update_one = AsyncMock(return_value=MagicMock(matched_count=1))
+    deletion.tombstones_collection = MagicMock()
+    deletion.tombstones_collection.insert_one = AsyncMock(side_effect=record)
+    deletion.schedule = MagicMock()
+
+    async def aggregate(pipeline):
+        # Solo interesa la rama de bajas del pipeline
+        for stage in pipeline:
+            union = stage.get("$unionWith")
+            if union and union["coll"] == "bajas":
+                bounds = union["pipeline"][0]["$match"]["_id"]
+                for doc in tombstones:
+                    if bounds["$gt"] < doc["_id"] < bounds["$lt"]:
+                        yield {**doc, "_coleccion": "bajas"}
+
+    sync = SyncService()
+    sync.readings_collection = MagicMock()
+    sync.readings_collection.aggregate = aggregate
+
+    async def scenario():
+        monkeypatch.setattr(sync_service_module, "SYNC_SETTLE_SECONDS", 0)
+        previous = await sync.changes_since(None, 100)
+        assert previous["bajas"] == []
+        await deletion.request_plant_deletion(plant_id)
+        # La baja ya ha superado la ventana de asentamiento
+        monkeypatch.setattr(sync_service_module, "SYNC_SETTLE_SECONDS", -2)
+        after = await sync.changes_since(previous["token"], 100)
+        later = await sync.changes_since(after["token"], 100)
+        return after, later
+
+    after, later = asyncio.run(scenario())
+    assert after["bajas"] == [
+        {"tipo": "planta_borrada", "planta_id": plant_id, "version": str(tombstones[0]["_id"])}
+    ]
+    assert later["bajas"] == []
+
+def test_pipeline_resumes_after_token():
+    reading_id = ObjectId()
+    token = encode_token(reading_id, 0, None)
+    pipeline = SyncService()._pipeline(token, 10, ["64b7f0c2a1b2c3d4e5f60718"])
+
+    match = pipeline[0]["$match"]
+    assert match["_id"]["$gt"] == reading_id
+    assert match["planta_id"] == {"$in": ["64b7f0c2a1b2c3d4e5f60718"]}
+    assert pipeline[2] == {"$limit": 11}
+
+@patch("actions.api.services.sync_service.SyncService.changes_since", new_callable=AsyncMock)
+def test_sync_endpoint_returns_gzip_batch(mock_changes):
+    mock_changes.return_value = {"lecturas": [], "plantas": [], "token": "abc", "mas": False}
+    app.dependency_overrides[get_current_active_user] = lambda: user_mock
+
+    response = client.get(
+        "/sync/",
+        params={"cursor": "abc", "limite": 50},
+        headers={"Accept-Encoding": "gzip"}
+    )
+
+    app.dependency_overrides = {}
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    # httpx descomprime gzip de forma transparente
+    assert response.json()["token"] == "abc"
+    assert response.json()["mas"] is False
+    mock_changes.assert_awaited_once_with("abc", 50, None)
+
+def test_sync_rejects_invalid_token():
+    app.dependency_overrides[get_current_active_user] = lambda: user_mock
+
+    response = client.get("/sync/", params={"cursor": "no-es-un-token"})
+
+    app.dependency_overrides = {}
+    assert response.status_code == 400
+
+@patch("actions.api.services.sync_service.SyncService.changes_since", new_callable=AsyncMock)
+def test_sync_with_real_token_runs_full_dependency_chain(mock_changes):
+    mock_changes.return_value = {"lecturas": [], "plantas": [], "token": None, "mas": False}
+    stored = {"_id": ObjectId(), **user_mock.dict(exclude={"id"})}
+    token = auth_service.create_access_token({"sub": "gateway", "role": "agricultores"})
+
+    with patch.object(auth_service.users, "find_by_username", AsyncMock(return_value=stored)):
+        response = client.get("/sync/", headers={"Authorization": f"Bearer {token}"})
+        stored["disabled"] = True
+        disabled = client.get("/sync/", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert disabled.status_code == 403
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect, WebSocketState
+from main import app
+from actions.api.endpoints import websocket_routes
+from actions.api.services.socket_manager import SocketManager, socket_manager
+
+client = TestClient(app)
+USER_ID = ObjectId()
+USER = {
+    "_id": USER_ID, "username": "u42", "nombre": "Ana", "apellido": "Lopez",
+    "creado_en": datetime.utcnow(), "role": "agricultores", "hashed_password": "fakehashed"
+}
+TOKEN = websocket_routes.auth_service.create_access_token({"sub": "u42", "role": "agricultores"})
+
+def known_user():
+    return patch.object(websocket_routes.auth_service.users, "find_by_username", AsyncMock(return_value=USER))
+
+def fake_websocket():
+    websocket = MagicMock()
+    websocket.client_state = WebSocketState.CONNECTED
+    websocket.send_text = AsyncMock()
+    websocket.close = AsyncMock()
+    return websocket
+
+def test_multiple_connections_per_user():
+    async def scenario():
+        manager = SocketManager()
+        first, second = fake_websocket(), fake_websocket()
+        c1 = await manager.connect(first, "u1", ["admin"])
+        c2 = await manager.connect(second, "u1", ["admin", "boss"])
+
+        await manager.send_personal_message({"type": "x"}, "u1")
+        assert first.send_text.await_count == 2  # confirmación + mensaje
+        assert second.send_text.await_count == 2
+
+        manager.disconnect(c1)
+        manager.disconnect(c1)  # idempotente
+        assert list(manager.user_connections["u1"]) == [c2.id]
+        assert list(manager.group_connections["admin"]) == [c2.id]
+
+        manager.disconnect(c2)
+        assert manager.connections == {}
+        assert manager.user_connections == {}
+        assert manager.group_connections == {}
+
+    asyncio.run(scenario())
+
+def test_failed_send_removes_connection():
+    async def scenario():
+        manager = SocketManager()
+        websocket = fake_websocket()
+        await manager.connect(websocket, "u1", ["admin"])
+        websocket.send_text.side_effect = RuntimeError("socket cerrado")
+
+        await manager.broadcast_to_group({"type": "x"}, "admin")
+        assert manager.connections == {}
+
+    asyncio.run(scenario())
+
+def test_heartbeat_reaps_dead_peers():
+    async def scenario():
+        manager = SocketManager()
+        alive_ws, dead_ws = fake_websocket(), fake_websocket()
+        alive = await manager.connect(alive_ws, "u1", ["admin"])
+        dead = await manager.connect(dead_ws, "u2", ["admin"])
+        dead.last_seen = time.monotonic() - 100
+
+        task = asyncio.create_task(manager.heartbeat(interval=0.01, timeout=50))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        assert list(manager.connections) == [alive.id]
+        dead_ws.close.assert_awaited()
+        assert json.loads(alive_ws.send_text.await_args.args[0]) == {"type": "ping"}
+
+    asyncio.run(scenario())
+
+@known_user()
+def test_websocket_route_registers_and_cleans_up():
+    with client.websocket_connect("/ws/solicitudes/u42") as websocket:
+        websocket.send_text(json.dumps({"type": "auth", "token": TOKEN, "groups": ["admin"]}))
+        assert websocket.receive_json()["type"] == "connection_established"
+        assert websocket.receive_json()["type"] == "auth_ok"
+        assert "u42" in socket_manager.user_connections
+        websocket.send_text(json.dumps({"type": "pong"}))
+
+    assert "u42" not in socket_manager.user_connections
+
+@known_user()
+@pytest.mark.parametrize("path_user, token", [("otro", TOKEN), ("u42", "no-es-un-jwt")])
+def test_websocket_rejects_token_of_another_user(path_user, token):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect(f"/ws/solicitudes/{path_user}") as websocket:
+            websocket.send_text(json.dumps({"type": "auth", "token": token, "ultimos": {"usuario:otro": 0}}))
+            websocket.receive_json()
+    assert closed.value.code == 1008
+    assert path_user not in socket_manager.user_connections
+
+@known_user()
+def test_websocket_accepts_user_id_of_token_subject():
+    with client.websocket_connect(f"/ws/solicitudes/{USER_ID}") as websocket:
+        websocket.send_text(json.dumps({"type": "auth", "token": TOKEN}))
+        assert websocket.receive_json()["type"] == "connection_established"
+        assert websocket.receive_json()["type"] == "auth_ok"
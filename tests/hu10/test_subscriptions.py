@@ -0,0 +1,68 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+from starlette.websockets import WebSocketState
+from actions.api.services.socket_manager import SocketManager
+
+def fake_websocket():
+    websocket = MagicMock()
+    websocket.client_state = WebSocketState.CONNECTED
+    websocket.send_text = AsyncMock()
+    return websocket
+
+def sent_messages(websocket):
+    messages = [json.loads(call.args[0]) for call in websocket.send_text.await_args_list]
+    return [m for m in messages if m["type"] == "lecturas"]
+
+def reading(ph, temperatura=20.0):
+    return {"id": "r", "ph": ph, "temperatura": temperatura, "humedad": 50.0}
+
+def test_events_only_reach_matching_subscriptions():
+    async def scenario():
+        manager = SocketManager()
+        ws_a, ws_b = fake_websocket(), fake_websocket()
+        conn_a = await manager.connect(ws_a, "a", [])
+        conn_b = await manager.connect(ws_b, "b", [])
+        manager.subscribe(conn_a, "s1", ["p1"], ["ph"])
+        manager.subscribe(conn_b, "s1", ["p2"])
+
+        manager.publish_reading("p1", reading(6.5))
+        manager.publish_reading("p3", reading(7.0))
+        await asyncio.sleep(0.01)
+
+        assert sent_messages(ws_a) == [{
+            "type": "lecturas", "sub": "s1",
+            "datos": [{"planta_id": "p1", "ph": 6.5, "fecha": None, "id": "r"}]
+        }]
+        assert sent_messages(ws_b) == []
+        assert set(manager.subscription_index.by_plant) == {"p1", "p2"}
+
+        manager.disconnect(conn_a)
+        manager.unsubscribe(conn_b, "s1")
+        assert manager.subscription_index.by_plant == {}
+
+    asyncio.run(scenario())
+
+def test_bursts_are_conflated_to_latest_value_per_plant():
+    async def scenario():
+        manager = SocketManager()
+        websocket = fake_websocket()
+        connection = await manager.connect(websocket, "a", [])
+        subscription = manager.subscribe(connection, "s1", ["p1", "p2"], max_per_second=20)
+
+        for ph in (6.0, 6.1, 6.2, 6.3):
+            manager.publish_reading("p1", reading(ph))
+        manager.publish_reading("p2", reading(7.0))
+        await asyncio.sleep(0)
+
+        # El primero sale de inmediato; el resto queda combinado por planta
+        assert len(sent_messages(websocket)) == 1
+        assert set(subscription.pending) == {"p1", "p2"}
+        assert subscription.pending["p1"]["ph"] == 6.3
+
+        await asyncio.sleep(0.1)
+        messages = sent_messages(websocket)
+        assert len(messages) == 2
+        assert [d["ph"] for d in messages[1]["datos"] if d["planta_id"] == "p1"] == [6.3]
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from main import app
+from actions.api.endpoints.planta_router import auth_service
+from actions.api.models.models import UserOut
+from actions.api.services.resumen_service import SummaryService, _hour
+
+client = TestClient(app)
+
+PLANT_ID = "64b7f0c2a1b2c3d4e5f60718"
+
+def test_reading_update_uses_atomic_operators():
+    fecha = datetime(2025, 7, 20, 10, 30)
+    filter_, update = SummaryService()._update_for({
+        "planta_id": PLANT_ID, "fecha": fecha, "ph": 6.5, "ec": 1.2, "humedad": None
+    })
+    bucket = f"horas.{_hour(fecha)}"
+
+    assert str(filter_["_id"]) == PLANT_ID
+    assert update["$min"] == {f"{bucket}.ph.min": 6.5, f"{bucket}.ec.min": 1.2}
+    assert update["$max"][f"{bucket}.ph.max"] == 6.5
+    assert update["$inc"][f"{bucket}.n"] == 1
+    assert update["$inc"][f"{bucket}.ph.suma"] == 6.5
+    assert update["$set"]["ultima_lectura"]["fecha"] == fecha
+    assert SummaryService()._update_for({"planta_id": "invalida", "fecha": fecha}) is None
+
+def test_window_stats_combines_recent_buckets_only():
+    now = datetime(2025, 7, 20, 12, 0)
+    current, previous, expired = _hour(now), _hour(now - timedelta(hours=3)), _hour(now - timedelta(hours=30))
+    hours = {
+        str(current): {"n": 2, "ph": {"min": 6.0, "max": 7.0, "suma": 13.0, "n": 2}},
+        str(previous): {"n": 1, "ph": {"min": 5.5, "max": 5.5, "suma": 5.5, "n": 1}},
+        str(expired): {"n": 5, "ph": {"min": 1.0, "max": 9.0, "suma": 25.0, "n": 5}},
+    }
+
+    stats = SummaryService.window_stats(hours, now)
+
+    assert stats["lecturas"] == 3
+    assert stats["metricas"]["ph"] == {"min": 5.5, "max": 7.0, "promedio": 18.5 / 3}
+
+@patch("actions.api.services.resumen_service.SummaryService.fleet_overview", new_callable=AsyncMock)
+def test_fleet_overview_endpoint(mock_overview):
+    mock_overview.return_value = [{
+        "id": PLANT_ID,
+        "nombre": "Tomate 1",
+        "ultima_lectura": {"ph": 6.5, "fecha": datetime(2025, 7, 20, 10, 30)},
+        "ventana_24h": {"lecturas": 1, "metricas": {"ph": {"min": 6.5, "max": 6.5, "promedio": 6.5}}}
+    }]
+    app.dependency_overrides[auth_service.get_current_user] = lambda: UserOut(
+        id="u1", username="admin", nombre="Admin", apellido="Test",
+        role="administradores", creado_en=datetime.utcnow()
+    )
+
+    response = client.get("/plants/resumen")
+
+    app.dependency_overrides = {}
+    assert response.status_code == 200
+    data = response.json()
+    assert data[0]["ultima_lectura"]["fecha"] == "2025-07-20T10:30:00"
+    assert data[0]["ventana_24h"]["metricas"]["ph"]["promedio"] == 6.5
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime
+import numpy as np
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from main import app
+from actions.api.services.resample_service import GridAccumulator, ResampleService
+
+client = TestClient(app)
+
+NAN = np.nan
+
+def test_grid_mean_last_and_coverage_across_batches():
+    grid = GridAccumulator(start_ms=0, step_ms=10, bins=4, columns=2)
+    # La celda 1 queda partida entre dos lotes
+    grid.add(np.array([0, 5, 12]), np.array([[1.0, 10.0], [3.0, NAN], [5.0, 20.0]]))
+    grid.add(np.array([18, 35, 99]), np.array([[7.0, NAN], [9.0, 30.0], [0.0, 0.0]]))
+
+    np.testing.assert_allclose(grid.mean(), [[2.0, 10.0], [6.0, 20.0], [NAN, NAN], [9.0, 30.0]])
+    np.testing.assert_allclose(grid.last, [[3.0, 10.0], [7.0, 20.0], [NAN, NAN], [9.0, 30.0]])
+    assert grid.coverage.tolist() == [[True, True], [True, True], [False, False], [True, True]]
+
+def test_linear_interpolation_respects_max_gap():
+    grid = GridAccumulator(start_ms=0, step_ms=1, bins=7, columns=1)
+    grid.add(np.array([0, 2, 6]), np.array([[0.0], [2.0], [10.0]]))
+
+    np.testing.assert_allclose(grid.result("linear", None)[:, 0], [0, 1, 2, 4, 6, 8, 10])
+    np.testing.assert_allclose(grid.result("linear", 2)[:, 0], [0, 1, 2, NAN, NAN, NAN, 10])
+    np.testing.assert_allclose(grid.result("last", 1)[:, 0], [0, 0, 2, 2, NAN, NAN, 10])
+
+def test_resample_service_streams_batches():
+    async def fake_columns(plant_id, start, end, metrics):
+        yield np.array([0, 30000], dtype=np.int64), np.full((2, len(metrics)), 1.0)
+        yield np.array([150000], dtype=np.int64), np.full((1, len(metrics)), 3.0)
+
+    service = ResampleService()
+    service.reading_service.iter_reading_columns = fake_columns
+    result = asyncio.run(service.resample(
+        "p1", datetime(1970, 1, 1), datetime(1970, 1, 1, 0, 3), 60, "linear"
+    ))
+
+    assert result["tiempos"].tolist() == [0, 60000, 120000]
+    np.testing.assert_allclose(result["metricas"]["ph"], [1.0, 2.0, 3.0])
+    assert result["cobertura"]["ph"].tolist() == [True, False, True]
+
+@patch("actions.api.services.resample_service.ResampleService.resample", new_callable=AsyncMock)
+def test_resample_endpoint_serializes_nan_as_null(mock_resample):
+    mock_resample.return_value = {"metricas": {"ph": np.array([6.5, NAN])}, "cobertura": {"ph": np.array([True, False])}}
+
+    response = client.get("/readings/plant/p1/resample", params={
+        "desde": "2025-07-20T00:00:00Z", "hasta": "2025-07-20T00:02:00Z", "paso": 60
+    })
+
+    assert response.status_code == 200
+    assert response.json() == {"metricas": {"ph": [6.5, None]}, "cobertura": {"ph": [True, False]}}
+
+def test_resample_endpoint_rejects_bad_method():
+    response = client.get("/readings/plant/p1/resample", params={
+        "desde": "2025-07-20T00:00:00Z", "hasta": "2025-07-20T00:02:00Z", "metodo": "cubic"
+    })
+    assert response.status_code == 422
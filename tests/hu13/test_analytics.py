@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime
+import numpy as np
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from main import app
+from actions.api.dependencies import get_current_active_user
+from tests.test_factories import create_user_in_db
+from actions.api.services.analytics_service import AnalyticsService, compute_statistics
+from actions.api.services.ingest_watermark import ingest_watermarks
+
+client = TestClient(app)
+
+def test_statistics_correlation_and_regression():
+    x = np.arange(10, dtype=float)
+    matrix = np.column_stack([x, 2 * x + 1, -x])
+    matrix[3, 1] = np.nan  # fila incompleta: se descarta
+
+    result = compute_statistics(matrix, ["ph", "ec", "humedad"], "ec")
+
+    assert result["n"] == 9
+    np.testing.assert_allclose(result["correlacion"][0], [1.0, 1.0, -1.0])
+    assert abs(result["regresion"]["r2"] - 1.0) < 1e-9
+    assert abs(result["regresion"]["intercepto"] - 1.0) < 1e-6
+
+def test_results_are_cached_until_ingest_watermark_moves():
+    loads = []
+
+    async def fake_columns(plant_id, start, end, metrics):
+        loads.append(plant_id)
+        yield np.arange(3, dtype=np.int64), np.array([[1.0, 2.0], [2.0, 4.1], [3.0, 5.9]])
+
+    async def scenario():
+        service = AnalyticsService()
+        service.reading_service.iter_reading_columns = fake_columns
+        args = (["planta-cache"], datetime(2025, 1, 1), datetime(2025, 2, 1), ["ph", "ec"])
+        try:
+            first = await service.analyze(*args)
+            second = await service.analyze(*args)
+            ingest_watermarks.advance("planta-cache")
+            await service.analyze(*args)
+        finally:
+            service.shutdown()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second
+    assert first["n"] == 3
+    assert loads == ["planta-cache", "planta-cache"]
+
+def test_cached_results_expire_after_ttl():
+    loads = []
+    now = [0.0]
+
+    async def fake_columns(plant_id, start, end, metrics):
+        loads.append(plant_id)
+        yield np.arange(3, dtype=np.int64), np.array([[1.0, 2.0], [2.0, 4.1], [3.0, 5.9]])
+
+    async def scenario():
+        # Otro proceso puede escribir sin mover la marca local: el TTL acota lo obsoleto
+        service = AnalyticsService(cache_ttl=60, clock=lambda: now[0])
+        service.reading_service.iter_reading_columns = fake_columns
+        args = (["planta-ttl"], datetime(2025, 1, 1), datetime(2025, 2, 1), ["ph", "ec"])
+        try:
+            await service.analyze(*args)
+            now[0] = 59
+            await service.analyze(*args)
+            now[0] = 61
+            await service.analyze(*args)
+        finally:
+            service.shutdown()
+
+    asyncio.run(scenario())
+    assert loads == ["planta-ttl", "planta-ttl"]
+
+def test_farmers_cannot_run_analytics():
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db("agricultores")
+    response = client.post("/analytics/", json={
+        "plantas": ["p1"], "desde": "2025-01-01T00:00:00", "hasta": "2025-02-01T00:00:00"
+    })
+    app.dependency_overrides = {}
+    assert response.status_code == 403
+
+@patch("actions.api.services.analytics_service.AnalyticsService.analyze", new_callable=AsyncMock)
+def test_analytics_endpoint_validates_metrics(mock_analyze):
+    mock_analyze.return_value = {"n": 0}
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db("investigadores")
+
+    bad = client.post("/analytics/", json={
+        "plantas": ["p1"], "desde": "2025-01-01T00:00:00", "hasta": "2025-02-01T00:00:00",
+        "metricas": ["ph", "brillo"]
+    })
+    ok = client.post("/analytics/", json={
+        "plantas": ["p1"], "desde": "2025-01-01T00:00:00", "hasta": "2025-02-01T00:00:00",
+        "metricas": ["ph", "ec"], "objetivo": "ec"
+    })
+
+    app.dependency_overrides = {}
+    assert bad.status_code == 422
+    assert ok.status_code == 200
+    assert mock_analyze.await_args.args[3] == ["ph", "ec"]
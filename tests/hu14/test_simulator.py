@@ -0,0 +1,53 @@
+from datetime import datetime
+import numpy as np
+from starlette.requests import Request
+from actions.api.services.auth_service import AuthService
+from actions.api.services.rate_limiter import identify_caller
+from data.seed.simulator import (
+    PlantProfile, build_parser, generate_series, iter_documents, rejected_share, request_headers
+)
+
+def test_series_is_deterministic_and_realistic():
+    start = datetime(2025, 1, 1)
+    series = generate_series(PlantProfile(7), start, days=10, interval=300)
+    again = generate_series(PlantProfile(7), start, days=10, interval=300)
+
+    np.testing.assert_array_equal(series["ph"], again["ph"])
+    # Hay cortes, pero se conservan la mayoría de las lecturas
+    assert 0.5 * 10 * 288 < len(series["fecha"]) < 10 * 288
+    assert np.all(np.diff(series["fecha"].astype(np.int64)) > 0)
+    assert series["humedad"].min() >= 5 and series["humedad"].max() <= 100
+    assert 4 < series["ph"].mean() < 9
+
+def test_temperature_follows_daily_cycle():
+    series = generate_series(PlantProfile(3), datetime(2025, 1, 1), days=20, interval=600)
+    hours = series["fecha"].astype("datetime64[h]").astype(np.int64) % 24
+    afternoon = series["temperatura"][(hours >= 13) & (hours <= 16)].mean()
+    night = series["temperatura"][(hours >= 1) & (hours <= 4)].mean()
+    assert afternoon > night + 2
+
+def test_documents_match_reading_schema():
+    series = generate_series(PlantProfile(1), datetime(2025, 1, 1), days=1, interval=3600)
+    doc = next(iter_documents("p1", series))
+    assert doc["planta_id"] == "p1"
+    assert isinstance(doc["fecha"], datetime)
+    assert {"humedad", "temperatura", "ec", "ph", "nitrogeno", "fosforo", "potasio"} <= set(doc)
+
+def test_cli_arguments():
+    args = build_parser().parse_args(["live", "--tasa", "50", "--lote", "10"])
+    assert args.modo == "live" and args.tasa == 50 and args.lote == 10
+
+def test_live_token_gives_each_device_its_own_bucket():
+    token = AuthService().create_access_token({"sub": "simulador", "role": "agricultores"})
+    args = build_parser().parse_args(["live", "--token", token])
+    headers = request_headers(args.token, "sim-1")
+    request = Request({
+        "type": "http", "client": ("10.0.0.1", 1234),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    })
+    assert identify_caller(request) == ("user:simulador/device:sim-1", "agricultores")
+    assert "Authorization" not in request_headers(None, "sim-1")
+
+def test_rejected_share_counts_only_429():
+    assert rejected_share({200: 30, 429: 60, 0: 10}) == 0.6
+    assert rejected_share({}) == 0.0
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from main import app
+from actions.api.dependencies import get_current_active_user
+from tests.test_factories import create_user_in_db
+from data.db.query_monitor import (
+    SlowQueryMonitor, analyze_plan, current_operation, current_request_scope,
+    monitored_service, query_monitor, suggest_index
+)
+
+client = TestClient(app)
+
+def find_command(plant_id):
+    return {
+        "find": "lecturas", "filter": {"planta_id": plant_id, "fecha": {"$gte": datetime(2025, 1, 1)}},
+        "sort": {"fecha": -1}, "$db": "agricultura_db"
+    }
+
+def run_command(monitor, request_id, command, duration_ms):
+    started = SimpleNamespace(
+        command_name=next(iter(command)), command=command, database_name="agricultura_db",
+        request_id=request_id, connection_id=("localhost", 27017)
+    )
+    monitor.started(started)
+    monitor.succeeded(SimpleNamespace(
+        command_name=started.command_name, request_id=request_id,
+        connection_id=started.connection_id, duration_micros=int(duration_ms * 1000)
+    ))
+
+def test_slow_commands_are_grouped_by_shape_with_origin():
+    monitor = SlowQueryMonitor(threshold_ms=50)
+    route = SimpleNamespace(path="/readings/plant/{plant_id}")
+    scope_token = current_request_scope.set({"type": "http", "method": "GET", "path": "/readings/plant/p1", "route": route})
+    operation_token = current_operation.set("ReadingService.get_readings_by_plant")
+    try:
+        run_command(monitor, 1, find_command("p1"), 120)
+        run_command(monitor, 2, find_command("p2"), 80)
+        run_command(monitor, 3, find_command("p3"), 10)  # bajo el umbral
+    finally:
+        current_operation.reset(operation_token)
+        current_request_scope.reset(scope_token)
+
+    report = monitor.report()
+    assert len(report["formas"]) == 1
+    shape = report["formas"][0]
+    assert shape["ejecuciones"] == 2
+    assert shape["max_ms"] == 120
+    assert shape["rutas"] == {"GET /readings/plant/{plant_id}": 2}
+    assert shape["metodos"] == {"ReadingService.get_readings_by_plant": 2}
+    assert shape["forma"]["filtro"] == {"planta_id": 1, "fecha": {"$gte": 1}}
+
+def test_plan_flags_and_index_suggestion():
+    explain = {"queryPlanner": {
+        "winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+        "rejectedPlans": [{"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "x"}}]
+    }}
+    plan = analyze_plan(explain)
+    assert plan["collscan"] and plan["sort_en_memoria"]
+    assert plan["indices"] == []
+
+    filter_ = {"planta_id": "p1", "fecha": {"$gte": 1}}
+    assert suggest_index(filter_, {"fecha": -1}) == [["planta_id", 1], ["fecha", -1]]
+    assert suggest_index({"fecha": {"$lt": 1}, "dispositivo_id": "d"}, {}) == [["dispositivo_id", 1], ["fecha", 1]]
+
+def test_monitored_service_labels_coroutines_and_generators():
+    seen = []
+
+    @monitored_service
+    class FakeService:
+        async def load(self):
+            seen.append(current_operation.get())
+
+        async def stream(self):
+            seen.append(current_operation.get())
+            yield 1
+            seen.append(current_operation.get())
+
+    async def scenario():
+        service = FakeService()
+        await service.load()
+        async for _ in service.stream():
+            seen.append(current_operation.get())
+
+    asyncio.run(scenario())
+    assert seen == ["FakeService.load", "FakeService.stream", None, "FakeService.stream"]
+
+def test_slow_query_report_is_admin_only():
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db("investigadores")
+    forbidden = client.get("/admin/consultas-lentas")
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db("administradores")
+    allowed = client.get("/admin/consultas-lentas?limite=5")
+    app.dependency_overrides = {}
+
+    assert forbidden.status_code == 403
+    assert allowed.status_code == 200
+    assert allowed.json()["umbral_ms"] == query_monitor.threshold_ms
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import orjson
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from main import app
+from actions.api.endpoints.planta_router import auth_service
+from actions.api.tracing import (
+    Trace, TracingMiddleware, current_trace, mongo_span_listener, span
+)
+
+client = TestClient(app)
+
+def make_app(**options):
+    inner = FastAPI()
+
+    @inner.get("/items")
+    async def items():
+        with span("consulta"):
+            await asyncio.sleep(0)
+        return {"ok": True}
+
+    inner.add_middleware(TracingMiddleware, **options)
+    return inner
+
+def test_span_is_noop_without_trace():
+    assert current_trace.get() is None
+    with span("nada") as first, span("otra") as second:
+        pass
+    assert first is second
+
+def test_server_timing_header_lists_spans():
+    response = TestClient(make_app(server_timing=True, sample_rate=0)).get("/items")
+    header = response.headers["server-timing"]
+    assert "consulta;dur=" in header
+    assert "total;dur=" in header
+
+def test_sampled_traces_are_logged_as_otlp_json(caplog):
+    traceparent = "00-" + "a" * 32 + "-" + "b" * 16 + "-01"
+    with caplog.at_level(logging.INFO, logger="trazas"):
+        response = TestClient(make_app(server_timing=False, sample_rate=1e-9)).get(
+            "/items", headers={"traceparent": traceparent}
+        )
+    assert "server-timing" not in response.headers
+
+    payload = orjson.loads(caplog.records[-1].getMessage())
+    spans = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root, child = spans[0], spans[1]
+    assert root["traceId"] == "a" * 32 and root["parentSpanId"] == "b" * 16
+    assert child["name"] == "consulta" and child["parentSpanId"] == root["spanId"]
+    assert {"key": "http.status_code", "value": {"intValue": "200"}} in root["attributes"]
+
+def test_mongo_commands_become_spans_of_current_trace():
+    trace = Trace("GET /x", sampled=False)
+    token = current_trace.set(trace)
+    try:
+        event = SimpleNamespace(request_id=7, connection_id=("localhost", 27017), command_name="find")
+        mongo_span_listener.started(event)
+    finally:
+        current_trace.reset(token)
+    mongo_span_listener.succeeded(SimpleNamespace(duration_micros=2500, **vars(event)))
+    assert trace.totals["mongo.find"] == [2500000, 1]
+
+@patch("actions.api.services.planta_service.PlantService.list_plants", new_callable=AsyncMock)
+def test_api_responses_carry_server_timing_only_when_enabled(mock_list):
+    mock_list.return_value = []
+    app.dependency_overrides[auth_service.get_current_user] = lambda: None
+    try:
+        default = client.get("/plants/")
+        # Equivale a arrancar con TRACE_SERVER_TIMING=1
+        enabled = TestClient(TracingMiddleware(app, server_timing=True, sample_rate=0)).get("/plants/")
+    finally:
+        app.dependency_overrides = {}
+    assert default.status_code == 200 and "server-timing" not in default.headers
+    assert "serializacion;dur=" in enabled.headers["server-timing"]
@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+from main import app
+from actions.api.dependencies import get_current_active_user
+from tests.test_factories import create_user_in_db
+from actions.api.services.carga_service import BulkUploadService, iter_lines, iter_row_batches
+
+client = TestClient(app)
+PLANT = "65f0c0ffee0000000000abcd"
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+async def collect(formato, *chunks, batch_size=2):
+    return [batch async for batch in iter_row_batches(iter_lines(stream(*chunks)), formato, batch_size)]
+
+def test_csv_is_parsed_across_chunk_boundaries():
+    batches = asyncio.run(collect(
+        "csv",
+        "﻿fecha,humedad,temperatura,ec,ph\r\n2019-01-01T00:00:00Z,40,2".encode(),
+        "1.5,1.2,6.5\n\n2019-01-01T00:05:00Z,41,21,1.2".encode(),
+        b",6.4\n2019-01-01T00:10:00Z,1\n"
+    ))
+    rows = [row for batch in batches for row in batch]
+    assert [number for number, _ in rows] == [1, 2, 3]
+    assert rows[0][1] == {"fecha": "2019-01-01T00:00:00Z", "humedad": "40", "temperatura": "21.5", "ec": "1.2", "ph": "6.5"}
+    assert "columnas" in rows[2][1]
+
+def test_rows_are_validated_in_batches_keeping_timestamps():
+    service = BulkUploadService()
+    rows = [
+        (1, {"fecha": "2019-01-01T03:00:00+03:00", "humedad": "40", "temperatura": "21", "ec": "1", "ph": "6"}),
+        (2, {"fecha": "2019-01-01T00:05:00", "humedad": "x", "temperatura": "21", "ec": "1", "ph": "6"}),
+        (3, "JSON inválido"),
+        (4, {"humedad": 1, "temperatura": 2, "ec": 3, "ph": 4, "planta_id": "otra", "dispositivo_id": "d1", "secuencia": 9,
+             "fecha": "2019-01-02T00:00:00"})
+    ]
+    documents, errors = service._validate(rows, "c1", PLANT)
+
+    assert documents[0]["fecha"] == datetime(2019, 1, 1, 0, 0)
+    assert (documents[0]["planta_id"], documents[0]["dispositivo_id"], documents[0]["secuencia"]) == (PLANT, "carga:c1", 1)
+    assert (documents[1]["planta_id"], documents[1]["dispositivo_id"], documents[1]["secuencia"]) == ("otra", "d1", 9)
+    assert [error["fila"] for error in errors] == [3, 2]
+    assert errors[1]["error"].startswith("humedad")
+
+def test_upload_resumes_after_confirmed_rows():
+    service = BulkUploadService()
+    service.uploads_collection = MagicMock()
+    service.uploads_collection.find_one_and_update = AsyncMock(side_effect=[
+        {"_id": "c1", "filas_confirmadas": 2},
+        {"_id": "c1", "estado": "completada"}
+    ])
+    service.uploads_collection.update_one = AsyncMock()
+    service.readings_collection = MagicMock()
+    service.readings_collection.insert_many = AsyncMock()
+    service.plants_collection = MagicMock()
+    service.plants_collection.update_one = AsyncMock()
+    service.summary_service = MagicMock()
+    service.summary_service.record_history = AsyncMock()
+
+    lines = b"".join(
+        f'{{"fecha": "2019-01-0{i}T00:00:00", "humedad": 1, "temperatura": 2, "ec": 3, "ph": 4}}\n'.encode()
+        for i in range(1, 6)
+    )
+    result = asyncio.run(service.upload(stream(lines), "ndjson", PLANT, "c1", chunk_size=2, parallel=2))
+
+    assert result["estado"] == "completada"
+    inserted = [doc["secuencia"] for call in service.readings_collection.insert_many.await_args_list for doc in call.args[0]]
+    assert inserted == [3, 4, 5]
+    # La última lectura de la planta solo avanza con la fila más reciente
+    plant_filter = service.plants_collection.update_one.await_args_list[-1].args[0]
+    assert plant_filter["$or"][0] == {"ultima_lectura": {"$lt": datetime(2019, 1, 5)}}
+    final = service.uploads_collection.find_one_and_update.await_args.args[1]["$set"]
+    assert final["filas_confirmadas"] == 5
+
+@patch("actions.api.services.carga_service.BulkUploadService.upload", new_callable=AsyncMock)
+def test_upload_endpoint_streams_body(mock_upload):
+    now = datetime.utcnow()
+    mock_upload.return_value = {
+        "_id": "c1", "formato": "csv", "estado": "completada", "insertadas": 2,
+        "creado_en": now, "actualizado_en": now
+    }
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db()
+    response = client.post("/readings/carga?formato=csv&carga_id=c1", content=b"fecha,ph\n")
+    bad_id = client.post("/readings/carga?carga_id=../x", content=b"")
+    app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    assert response.json()["id"] == "c1"
+    assert mock_upload.await_args.args[1:] == ("csv", None, "c1")
+    assert bad_id.status_code == 422
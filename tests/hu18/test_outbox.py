@@ -0,0 +1,95 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+from starlette.websockets import WebSocketState
+from actions.api.services.outbox import Outbox
+from actions.api.services.socket_manager import SocketManager
+
+def fake_websocket():
+    websocket = MagicMock()
+    websocket.client_state = WebSocketState.CONNECTED
+    websocket.send_text = AsyncMock()
+    return websocket
+
+def sent(websocket):
+    return [json.loads(call.args[0]) for call in websocket.send_text.await_args_list]
+
+def test_events_are_numbered_and_gaps_detected():
+    outbox = Outbox(capacity=3)
+    for i in range(5):
+        outbox.append("grupo:admin", {"type": "x", "n": i})
+
+    assert outbox.last_seq("grupo:admin") == 5
+    assert [json.loads(text)["n"] for text in outbox.since("grupo:admin", 3)] == [3, 4]
+    assert outbox.since("grupo:admin", 5) == []
+    assert outbox.since("grupo:admin", 1) is None  # la secuencia 2 ya salió del registro
+    assert outbox.since("grupo:admin", 9) is None  # secuencia de otra vida del servidor
+
+def test_reconnecting_client_receives_only_missed_events():
+    async def scenario():
+        manager = SocketManager()
+        await manager.broadcast_to_group({"type": "new_solicitud", "data": {"id": 1}}, "admin")
+        await manager.broadcast_to_group({"type": "new_solicitud", "data": {"id": 2}}, "admin")
+        await manager.send_personal_message({"type": "solicitud_update", "data": {"id": 2}}, "u1")
+
+        websocket = fake_websocket()
+        connection = await manager.connect(websocket, "u1", ["admin", "boss"])
+        await manager.resume(
+            connection,
+            {"grupo:admin": 1, "usuario:u1": 0, "grupo:boss": 7},
+            manager.outbox.epoch
+        )
+        return sent(websocket)[1:]
+
+    replay_user, replay_admin, resync_boss = asyncio.run(scenario())
+    assert replay_user["type"] == "replay" and replay_user["canal"] == "usuario:u1"
+    assert [event["seq"] for event in replay_user["eventos"]] == [1]
+    assert replay_admin["canal"] == "grupo:admin"
+    assert [event["data"]["id"] for event in replay_admin["eventos"]] == [2]
+    assert resync_boss == {"type": "resync", "canal": "grupo:boss", "seq": 0}
+
+def test_other_epoch_forces_resync():
+    async def scenario():
+        manager = SocketManager()
+        await manager.broadcast_to_group({"type": "x"}, "admin")
+        websocket = fake_websocket()
+        connection = await manager.connect(websocket, "u1", ["admin"])
+        await manager.resume(connection, {"grupo:admin": 0}, "otra")
+        return sent(websocket)[-1]
+
+    assert asyncio.run(scenario()) == {"type": "resync", "canal": "grupo:admin", "seq": 1}
+
+def test_persisted_events_cover_older_gaps():
+    async def scenario():
+        stored = [{"seq": seq, "texto": json.dumps({"seq": seq})} for seq in (2, 3, 4)]
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.to_list = AsyncMock(return_value=stored)
+        outbox = Outbox(capacity=1)
+        outbox.collection = MagicMock()
+        outbox.collection.find.return_value = cursor
+        outbox.collection.insert_one = AsyncMock()
+        for _ in range(4):
+            outbox.append("grupo:admin", {"type": "x"})
+        await asyncio.sleep(0)
+        return outbox, await outbox.replay("grupo:admin", 1)
+
+    outbox, events = asyncio.run(scenario())
+    assert [json.loads(text)["seq"] for text in events] == [2, 3, 4]
+    assert outbox.collection.insert_one.await_count == 4
+    query = outbox.collection.find.call_args.args[0]
+    assert query == {"canal": "grupo:admin", "seq": {"$gt": 1, "$lte": 4}}
+
+def test_streams_are_bounded_and_evicted_streams_force_resync():
+    outbox = Outbox(capacity=10, max_streams=2)
+    for _ in range(3):
+        outbox.append("usuario:a", {"type": "x"})
+    outbox.append("usuario:b", {"type": "x"})
+    outbox.append("usuario:c", {"type": "x"})
+
+    assert outbox.last_seq("usuario:a") == 0 and len(outbox._streams) == 2
+    # Vuelve tras la expulsión: numera por encima de lo expulsado
+    outbox.append("usuario:a", {"type": "x"})
+    assert outbox.last_seq("usuario:a") == 4
+    assert outbox.since("usuario:a", 1) is None
+    assert outbox.since("usuario:a", 3) == [outbox._streams["usuario:a"][0][1]]
@@ -0,0 +1,130 @@
+import asyncio
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+from main import app
+from actions.api.endpoints.planta_router import auth_service
+from tests.test_factories import create_user_in_db
+from actions.api.services.borrado_service import DeletionPacer, DeletionService
+from actions.api.services.lectura_service import PlantaEnBorradoError, ReadingService
+from actions.api.models.models import LecturaCreate
+from data.db.repositories import build_repositories
+
+client = TestClient(app)
+PLANT = "65f0c0ffee0000000000abcd"
+
+def test_pacer_respects_deletes_per_second_budget():
+    now = [0.0]
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        now[0] += delay
+
+    async def scenario():
+        pacer = DeletionPacer(1000, clock=lambda: now[0], sleep=fake_sleep)
+        for _ in range(3):
+            await pacer.spend(500)
+
+    asyncio.run(scenario())
+    assert sleeps == [0.5, 0.5, 0.5]
+
+def test_job_deletes_readings_in_index_order_and_resumes_from_last_id():
+    ids = [ObjectId() for _ in range(5)]
+    batches = [[{"_id": i} for i in ids[2:4]], [{"_id": ids[4]}], [], []]
+
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(side_effect=batches)
+
+    service = DeletionService(rate=0, batch_size=2)
+    job_id = ObjectId()
+    service.jobs_collection = MagicMock()
+    service.jobs_collection.find_one_and_update = AsyncMock(return_value={
+        "_id": job_id, "tipo": "planta", "objetivo_id": PLANT, "estado": "en_curso", "ultimo_id": ids[1]
+    })
+    service.jobs_collection.update_one = AsyncMock()
+    service.readings_collection = MagicMock()
+    service.readings_collection.find.return_value = cursor
+    service.readings_collection.delete_many = AsyncMock(side_effect=[
+        MagicMock(deleted_count=2), MagicMock(deleted_count=1)
+    ])
+    service.summary_collection = MagicMock()
+    service.summary_collection.delete_one = AsyncMock()
+    service.plant_service = MagicMock()
+    service.plant_service.delete_plant = AsyncMock(return_value=True)
+
+    asyncio.run(service.run(job_id))
+
+    first_query = service.readings_collection.find.call_args_list[0].args[0]
+    assert first_query == {"planta_id": PLANT, "_id": {"$gt": ids[1]}}
+    cursor.sort.assert_called_with([("planta_id", 1), ("_id", 1)])
+    deleted = [call.args[0]["_id"]["$in"] for call in service.readings_collection.delete_many.await_args_list]
+    assert deleted == [ids[2:4], [ids[4]]]
+    service.plant_service.delete_plant.assert_awaited_once_with(PLANT)
+    final = service.jobs_collection.update_one.await_args.args[1]
+    assert final["$set"]["estado"] == "completado" and final["$unset"] == {"activo": ""}
+
+@patch("actions.api.services.borrado_service.DeletionService.request_plant_deletion", new_callable=AsyncMock)
+def test_delete_returns_202_with_job(mock_request):
+    job_id = ObjectId()
+    mock_request.return_value = {"_id": job_id, "estado": "pendiente"}
+    app.dependency_overrides[auth_service.get_current_user] = lambda: create_user_in_db("administradores")
+    response = client.delete(f"/plants/{PLANT}")
+    mock_request.return_value = None
+    missing = client.delete(f"/plants/{PLANT}")
+    app.dependency_overrides = {}
+
+    assert response.status_code == 202
+    assert response.json()["trabajo_id"] == str(job_id)
+    assert response.headers["location"] == f"/plants/borrados/{job_id}"
+    assert missing.status_code == 404
+
+def test_summary_is_dropped_after_final_sweep_and_plant_stays_blocked():
+    order = []
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(side_effect=lambda length: order.append("barrido") or [])
+
+    service = DeletionService(rate=0)
+    job_id = ObjectId()
+    service.jobs_collection = MagicMock()
+    service.jobs_collection.find_one_and_update = AsyncMock(return_value={
+        "_id": job_id, "tipo": "planta", "objetivo_id": PLANT, "estado": "en_curso"
+    })
+    service.jobs_collection.update_one = AsyncMock()
+    service.readings_collection = MagicMock()
+    service.readings_collection.find.return_value = cursor
+    service.summary_collection = MagicMock()
+    service.summary_collection.delete_one = AsyncMock(side_effect=lambda *_: order.append("resumen"))
+    service.plant_service = MagicMock()
+    service.plant_service.delete_plant = AsyncMock(side_effect=lambda *_: order.append("planta"))
+
+    asyncio.run(service.run(job_id))
+    assert order == ["barrido", "planta", "barrido", "resumen"]
+    assert PLANT in service.blocked
+
+def test_ingest_rejects_readings_for_plants_being_deleted():
+    readings, plants, _ = build_repositories("memory")
+    service = ReadingService()
+    service.readings, service.plants, service.summary_service, service.spool = readings, plants, None, None
+    service.deletions = DeletionService()
+    service.deletions.blocked.add(PLANT)
+    other = str(ObjectId())
+    values = {"humedad": 40.0, "temperatura": 20.0, "ec": 1.1, "ph": 6.0}
+
+    async def scenario():
+        try:
+            await service.create_reading(LecturaCreate(planta_id=PLANT, **values))
+        except PlantaEnBorradoError:
+            rejected = True
+        batch = await service.create_readings_batch([
+            LecturaCreate(planta_id=PLANT, **values), LecturaCreate(planta_id=other, **values)
+        ])
+        return rejected, batch, await readings.find_by_plant(PLANT)
+
+    rejected, batch, stored = asyncio.run(scenario())
+    assert rejected and stored == []
+    assert batch == {"insertadas": 1, "duplicadas": 0, "rechazadas": 1}
@@ -0,0 +1,118 @@
+import asyncio
+import io
+from datetime import datetime
+import numpy as np
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+from main import app
+from actions.api.dependencies import get_current_active_user
+from tests.test_factories import create_user_in_db
+from actions.api.services.exportacion_service import (
+    ColumnarWriter, CsvWriter, ExportService, RangoNoSatisfacibleError, parse_range
+)
+
+client = TestClient(app)
+TIMES = np.array([0, 60000], dtype=np.int64)
+VALUES = np.array([[1.5, np.nan], [2.0, 7.25]])
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-5", 100) == (95, 99)
+    assert parse_range("bytes=0-500", 100) == (0, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+    with pytest.raises(RangoNoSatisfacibleError):
+        parse_range("bytes=100-", 100)
+
+def test_csv_and_columnar_writers():
+    csv = CsvWriter(["ph", "ec"])
+    body = (csv.header() + csv.batch("p1", TIMES, VALUES)).decode()
+    assert body.splitlines() == [
+        "planta_id,fecha,ph,ec",
+        "p1,1970-01-01T00:00:00.000,1.5,",
+        "p1,1970-01-01T00:01:00.000,2,7.25"
+    ]
+
+    columnar = ColumnarWriter(["ph", "ec"])
+    parts = [columnar.header(), columnar.batch("p1", TIMES[:1], VALUES[:1]), columnar.batch("p1", TIMES[1:], VALUES[1:])]
+    # Cada lote sale del escritor en cuanto llega: nada se retiene hasta el final de la planta
+    assert all(parts[1:3])
+    parts += [columnar.end_plant("p1"), columnar.end_plant("p2"), columnar.footer()]
+    archive = np.load(io.BytesIO(b"".join(parts)))
+    np.testing.assert_array_equal(np.concatenate([archive["p1/0/fecha"], archive["p1/1/fecha"]]), TIMES)
+    np.testing.assert_array_equal(np.concatenate([archive["p1/0/ec"], archive["p1/1/ec"]]), VALUES[:, 1])
+    assert archive["p2/0/ph"].shape == (0,)
+
+def test_build_writes_gridfs_file_and_reports_progress():
+    async def columns(plant_id, start, end, metrics):
+        yield TIMES, np.column_stack([VALUES, np.zeros((2, len(metrics) - 2))])
+
+    async def scenario():
+        service = ExportService()
+        job_id = ObjectId()
+        service.exports_collection = MagicMock()
+        service.exports_collection.find_one = AsyncMock(return_value={
+            "_id": job_id, "plantas": ["p1", "p2"], "desde": datetime(2025, 1, 1),
+            "hasta": datetime(2025, 2, 1), "formato": "ndjson", "archivo_id": None
+        })
+        service.exports_collection.update_one = AsyncMock()
+        stream = MagicMock(length=123, filename="exportacion.ndjson")
+        stream.write = AsyncMock()
+        stream.close = AsyncMock()
+        service.fs_bucket = MagicMock()
+        service.fs_bucket.open_upload_stream_with_id.return_value = stream
+        service.reading_service = MagicMock()
+        service.reading_service.iter_reading_columns = columns
+        await service.build(job_id)
+        return service, stream
+
+    service, stream = asyncio.run(scenario())
+    written = b"".join(call.args[0] for call in stream.write.await_args_list)
+    assert written.count(b"\n") == 4
+    assert b'"planta_id":"p2"' in written
+    updates = [call.args[1]["$set"] for call in service.exports_collection.update_one.await_args_list]
+    assert [u["progreso"] for u in updates[1:3]] == [0.5, 1.0]
+    assert updates[-1]["estado"] == "completada" and updates[-1]["tamano"] == 123
+
+class FakeGridOut:
+    def __init__(self, data):
+        self.data, self.position = data, 0
+
+    def seek(self, position):
+        self.position = position
+
+    async def read(self, size):
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+@patch("actions.api.services.exportacion_service.ExportService.open_file", new_callable=AsyncMock)
+@patch("actions.api.services.exportacion_service.ExportService.get_job", new_callable=AsyncMock)
+def test_download_supports_range_requests(mock_job, mock_open):
+    data = bytes(range(100))
+    file_id = ObjectId()
+    mock_job.return_value = {
+        "_id": ObjectId(), "usuario_id": "u1", "estado": "completada", "tamano": len(data),
+        "archivo_id": file_id, "nombre": "exportacion.csv", "content_type": "text/csv"
+    }
+    mock_open.side_effect = lambda _: FakeGridOut(data)
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db("investigadores")
+
+    full = client.get("/exports/x/archivo")
+    partial = client.get("/exports/x/archivo", headers={"Range": "bytes=90-"})
+    stale = client.get("/exports/x/archivo", headers={"Range": "bytes=90-", "If-Range": '"otro"'})
+    invalid = client.get("/exports/x/archivo", headers={"Range": "bytes=200-"})
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db("investigadores", "otro")
+    foreign = client.get("/exports/x/archivo")
+    app.dependency_overrides = {}
+
+    assert full.status_code == 200 and full.content == data
+    assert partial.status_code == 206 and partial.content == data[90:]
+    assert partial.headers["content-range"] == "bytes 90-99/100"
+    assert stale.status_code == 200
+    assert invalid.status_code == 416 and invalid.headers["content-range"] == "bytes */100"
+    assert foreign.status_code == 404
@@ -0,0 +1,122 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+import numpy as np
+from bson import ObjectId
+from unittest.mock import patch
+from actions.api.models.models import LECTURA_METRICS
+from actions.api.services import column_cache as column_cache_module
+from actions.api.services.column_cache import ColumnCache
+
+PLANT = str(ObjectId())
+BASE = datetime(2024, 1, 1)
+SEQUENCE = iter(range(1, 1 << 30))
+
+def make_reading(minute, ph, inserted=BASE, plant=PLANT):
+    stamp = int(inserted.timestamp())
+    return {
+        "_id": ObjectId(f"{stamp:08x}{next(SEQUENCE):016x}"), "planta_id": plant,
+        "fecha": BASE + timedelta(minutes=minute), "ph": ph
+    }
+
+def matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, bound in condition.items():
+            if not {"$gt": value > bound, "$gte": value >= bound, "$lt": value < bound}[op]:
+                return False
+    return True
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length):
+        batch, self.docs = self.docs[:length], self.docs[length:]
+        return batch
+
+class FakeReadings:
+    def __init__(self):
+        self.docs = []
+        self.finds = 0
+
+    def find(self, query, projection):
+        self.finds += 1
+        return FakeCursor([dict(doc) for doc in self.docs if matches(doc, query)])
+
+async def collect(cache, plant=PLANT, start=BASE, end=BASE + timedelta(days=1), batch_size=2):
+    batches = [batch async for batch in cache.iter_columns(plant, start, end, ["ph"], batch_size)]
+    if not batches:
+        return [], []
+    times = np.concatenate([times for times, _ in batches])
+    values = np.concatenate([values for _, values in batches])[:, 0]
+    return ((times - int(np.datetime64(BASE, "ms").astype(np.int64))) // 60000).tolist(), values.tolist()
+
+def test_incremental_fill_persists_watermark(tmp_path):
+    readings = FakeReadings()
+    readings.docs = [make_reading(minute, float(minute)) for minute in (0, 1, 2)]
+    cache = ColumnCache(str(tmp_path), readings)
+
+    assert asyncio.run(collect(cache)) == ([0, 1, 2], [0.0, 1.0, 2.0])
+    assert asyncio.run(collect(cache, start=BASE + timedelta(minutes=1))) == ([1, 2], [1.0, 2.0])
+
+    readings.docs.append(make_reading(3, 3.0))
+    # Otro proceso reabre la caché: solo trae lo posterior a la marca guardada
+    reopened = ColumnCache(str(tmp_path), readings)
+    plant = asyncio.run(reopened.refresh(PLANT))
+    assert plant.rows == 4
+    assert plant.last_id == readings.docs[-1]["_id"]
+    assert isinstance(plant.column("ph"), np.memmap)
+    np.testing.assert_array_equal(plant.column("ph"), [0.0, 1.0, 2.0, 3.0])
+    missing = next(name for name in LECTURA_METRICS if name != "ph")
+    assert np.isnan(plant.column(missing)).all()
+
+def test_out_of_order_readings_merge_tail_or_rebuild(tmp_path):
+    readings = FakeReadings()
+    readings.docs = [make_reading(minute, float(minute)) for minute in (0, 2, 4)]
+    cache = ColumnCache(str(tmp_path), readings)
+    asyncio.run(cache.refresh(PLANT))
+
+    readings.docs.append(make_reading(3, 3.0))
+    assert asyncio.run(collect(cache)) == ([0, 2, 3, 4], [0.0, 2.0, 3.0, 4.0])
+
+    readings.docs.append(make_reading(1, 1.0))
+    with patch.object(column_cache_module, "TAIL_MERGE_LIMIT", 0):
+        assert asyncio.run(collect(cache)) == ([0, 1, 2, 3, 4], [0.0, 1.0, 2.0, 3.0, 4.0])
+    assert sorted(os.listdir(tmp_path)) == [PLANT]
+
+def test_unsettled_readings_come_from_mongo(tmp_path):
+    readings = FakeReadings()
+    readings.docs = [make_reading(minute, float(minute)) for minute in (0, 1, 5)]
+    readings.docs.append(make_reading(2, 2.0, inserted=datetime.utcnow()))
+    cache = ColumnCache(str(tmp_path), readings, settle_seconds=60)
+
+    assert asyncio.run(collect(cache)) == ([0, 1, 2, 5], [0.0, 1.0, 2.0, 5.0])
+    assert cache._open(PLANT).rows == 3
+
+def test_lru_evicts_whole_plants(tmp_path):
+    readings = FakeReadings()
+    other = str(ObjectId())
+    readings.docs = [make_reading(0, 1.0), make_reading(0, 2.0, plant=other)]
+    row_bytes = 8 * (len(LECTURA_METRICS) + 1)
+    cache = ColumnCache(str(tmp_path), readings, max_bytes=row_bytes)
+
+    asyncio.run(cache.refresh(PLANT))
+    asyncio.run(cache.refresh(other))
+    assert list(cache._sizes) == [other]
+    assert not os.path.exists(os.path.join(tmp_path, PLANT))
+
+    cache.evict(other)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from unittest.mock import AsyncMock, MagicMock, patch
+from main import app
+from data.db.repositories import MongoPlantRepository, MongoReadingRepository, MongoUserRepository
+from actions.api.models.models import LecturaCreate, PlantaUpdate, UserCreate, UserUpdate
+from actions.api.services.lectura_service import ReadingService
+from actions.api.services.planta_service import PlantService
+from actions.api.services.user_service import UserService
+
+client = TestClient(app)
+
+def inserting_collection():
+    collection = MagicMock()
+    inserted_id = ObjectId()
+
+    async def insert_one(document):
+        document["_id"] = inserted_id
+        return MagicMock(inserted_id=inserted_id)
+
+    collection.insert_one = AsyncMock(side_effect=insert_one)
+    collection.find_one = AsyncMock()
+    return collection, inserted_id
+
+def test_create_user_builds_response_from_inserted_document():
+    service = UserService()
+    collection, inserted_id = inserting_collection()
+    service.users = MongoUserRepository(collection)
+
+    user = asyncio.run(service.create_user(UserCreate(
+        username="nuevo", password="password123", nombre="Nuevo", apellido="Usuario"
+    )))
+    assert user.id == str(inserted_id)
+    assert user.role == "agricultores"
+    collection.find_one.assert_not_awaited()
+
+    collection.insert_one = AsyncMock(side_effect=DuplicateKeyError("E11000"))
+    assert asyncio.run(service.create_user(UserCreate(username="nuevo", password="password123"))) is None
+
+def test_register_maps_duplicate_username_to_400():
+    with patch("actions.api.services.user_service.UserService.create_user", new_callable=AsyncMock) as create:
+        create.return_value = None
+        response = client.post("/auth/register", json={
+            "username": "nuevo", "password": "password123", "nombre": "Nuevo", "apellido": "Usuario"
+        })
+    assert response.status_code == 400
+    assert response.json()["detail"] == "El nombre de usuario ya está registrado"
+
+def test_updates_use_find_one_and_update():
+    plant_id = ObjectId()
+    plants = PlantService()
+    plants_collection = MagicMock()
+    plants.plants = MongoPlantRepository(plants_collection)
+    plants_collection.find_one_and_update = AsyncMock(return_value={
+        "_id": plant_id, "nombre": "Norte", "especie": "Tomate", "creado_en": datetime(2024, 1, 1)
+    })
+    plant = asyncio.run(plants.update_plant(str(plant_id), PlantaUpdate(nombre="Norte")))
+    assert plant.id == str(plant_id) and plant.nombre == "Norte"
+    kwargs = plants_collection.find_one_and_update.await_args.kwargs
+    assert kwargs["return_document"] is ReturnDocument.AFTER
+
+    users = UserService()
+    users_collection = MagicMock()
+    users.users = MongoUserRepository(users_collection)
+    users_collection.find_one_and_update = AsyncMock(return_value=None)
+    assert asyncio.run(users.update_user(str(ObjectId()), UserUpdate(nombre="Ana"))) is None
+    assert users_collection.find_one_and_update.await_args.kwargs["projection"] == {"hashed_password": 0}
+
+def test_create_reading_skips_reread():
+    service = ReadingService()
+    collection, inserted_id = inserting_collection()
+    service.readings = MongoReadingRepository(collection)
+    service.plants = MongoPlantRepository(MagicMock(update_many=AsyncMock()))
+    service.summary_service = MagicMock(record_reading=AsyncMock())
+
+    reading = asyncio.run(service.create_reading(LecturaCreate(
+        humedad=40.0, temperatura=21.5, ec=1.2, ph=6.5, planta_id=str(ObjectId())
+    )))
+    assert reading.id == str(inserted_id)
+    assert reading.ph == 6.5
+    collection.find_one.assert_not_awaited()
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from pymongo.errors import DuplicateKeyError
+from main import app
+from data.db.memory_store import project
+from data.db.repositories import build_repositories
+from actions.api import dependencies
+from actions.api.endpoints import auth_router, lectura_router, planta_router
+
+client = TestClient(app)
+BASE = datetime(2024, 3, 1)
+
+@pytest.fixture
+def memory_api(monkeypatch):
+    readings, plants, users = build_repositories("memory")
+    for service in (auth_router.auth_service, auth_router.user_service, planta_router.auth_service):
+        monkeypatch.setattr(service, "users", users)
+    monkeypatch.setattr(planta_router.plant_service, "plants", plants)
+    monkeypatch.setattr(planta_router.plant_service, "readings", readings)
+    monkeypatch.setattr(planta_router, "STORAGE_BACKEND", "memory")
+    monkeypatch.setattr(dependencies, "STORAGE_BACKEND", "memory")
+    for service in (lectura_router.reading_service, lectura_router.resample_service.reading_service):
+        monkeypatch.setattr(service, "readings", readings)
+        monkeypatch.setattr(service, "plants", plants)
+        monkeypatch.setattr(service, "summary_service", None)
+        monkeypatch.setattr(service, "column_cache", None)
+    return readings, plants, users
+
+def test_projection_matches_mongo_semantics():
+    doc = {"_id": 1, "a": 1, "b": 2, "c": 3}
+    assert project(doc, {"a": 1}) == {"_id": 1, "a": 1}
+    assert project(doc, {"_id": 0, "a": 1, "z": 1}) == {"a": 1}
+    assert project(doc, {"b": 0}) == {"_id": 1, "a": 1, "c": 3}
+    assert project(doc) == doc and project(doc) is not doc
+
+def test_memory_readings_range_scan_and_unique_index():
+    readings, _, users = build_repositories("memory")
+    plant = str(ObjectId())
+
+    async def scenario():
+        for minute in (5, 1, 3, 9):
+            await readings.insert({"planta_id": plant, "fecha": BASE + timedelta(minutes=minute), "ph": float(minute)})
+        await readings.insert({"planta_id": "otra", "fecha": BASE, "ph": 0.0})
+        batches = [batch async for batch in readings.iter_range(
+            plant, BASE + timedelta(minutes=1), BASE + timedelta(minutes=9), ["ph"], 2
+        )]
+        stored, duplicates = await readings.insert_many_unordered([
+            {"planta_id": plant, "fecha": BASE, "ph": 1.0, "dispositivo_id": "gw", "secuencia": 1},
+            {"planta_id": plant, "fecha": BASE, "ph": 1.0, "dispositivo_id": "gw", "secuencia": 1}
+        ])
+        await users.insert({"username": "ana"})
+        with pytest.raises(DuplicateKeyError):
+            await users.insert({"username": "ana"})
+        return batches, len(stored), duplicates
+
+    batches, stored, duplicates = asyncio.run(scenario())
+    assert [[doc["ph"] for doc in batch] for batch in batches] == [[1.0, 3.0], [5.0]]
+    assert "_id" not in batches[0][0]
+    assert (stored, duplicates) == (1, 1)
+
+def test_api_runs_on_memory_engine(memory_api):
+    readings, plants, _ = memory_api
+    user = {"username": "inv", "password": "password123", "nombre": "Inv", "apellido": "Test",
+            "role": "investigadores"}
+    assert client.post("/auth/register", json=user).status_code == 200
+    assert client.post("/auth/register", json=user).status_code == 400
+    token = client.post("/auth/token", data={"username": "inv", "password": "password123"}).json()["access_token"]
+
+    plant = client.post("/plants/", params={"token": token}, json={"nombre": "Norte"}).json()
+    reading = {"planta_id": plant["id"], "humedad": 40.0, "temperatura": 20.0, "ec": 1.1, "ph": 6.0,
+               "dispositivo_id": "gw-1", "secuencia": 1}
+    batch = client.post("/readings/batch", json=[reading, {**reading, "secuencia": 2, "ph": 7.0}]).json()
+    assert batch["insertadas"] == 2
+    assert client.post("/readings/", json={**reading, "secuencia": 3, "ph": 6.5}).status_code == 200
+
+    history = client.get(f"/readings/plant/{plant['id']}").json()
+    assert [item["ph"] for item in history] == [6.0, 7.0, 6.5]
+
+    now = datetime.utcnow()
+    resampled = client.get(f"/readings/plant/{plant['id']}/resample", params={
+        "desde": (now - timedelta(hours=1)).isoformat(), "hasta": (now + timedelta(hours=1)).isoformat(), "paso": 7200
+    })
+    assert resampled.status_code == 200
+    stored_plant = asyncio.run(plants.find_by_id(ObjectId(plant["id"])))
+    assert stored_plant["ultima_lectura"] is not None
+
+def test_delete_cascades_and_mongo_only_routes_answer_501(memory_api):
+    readings, plants, _ = memory_api
+    admin = {"username": "adm", "password": "password123", "nombre": "Adm", "apellido": "Test",
+             "role": "administradores"}
+    client.post("/auth/register", json=admin)
+    token = client.post("/auth/token", data={"username": "adm", "password": "password123"}).json()["access_token"]
+    plant = client.post("/plants/", params={"token": token}, json={"nombre": "Sur"}).json()
+    reading = {"planta_id": plant["id"], "humedad": 40.0, "temperatura": 20.0, "ec": 1.1, "ph": 6.0}
+    client.post("/readings/batch", json=[reading, reading])
+
+    assert client.get("/plants/resumen", params={"token": token}).status_code == 501
+    assert client.get("/sync/", headers={"Authorization": f"Bearer {token}"}).status_code == 501
+    assert client.delete(f"/plants/{plant['id']}", params={"token": token}).status_code == 200
+    assert client.delete(f"/plants/{plant['id']}", params={"token": token}).status_code == 404
+    assert asyncio.run(readings.find_by_plant(plant["id"])) == []
+    assert asyncio.run(plants.find_by_id(ObjectId(plant["id"]))) is None
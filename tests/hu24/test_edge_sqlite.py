@@ -0,0 +1,135 @@
+import asyncio
+import gzip
+from datetime import datetime, timedelta
+import orjson
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock, MagicMock
+from pymongo.errors import DuplicateKeyError
+from data.db import sqlite_store
+from data.db.sqlite_store import (
+    SqliteDatabase, SqlitePlantRepository, SqliteReadingRepository, SqliteUserRepository
+)
+from actions.api.services.carga_service import CargaDemasiadoGrandeError, iter_gunzip
+from actions.api.services.subida_service import EdgeUploader
+
+BASE = datetime(2024, 5, 1)
+PLANT = str(ObjectId())
+
+def reading(minute, **extra):
+    return {"planta_id": PLANT, "fecha": BASE + timedelta(minutes=minute), "ph": float(minute),
+            "humedad": 50.0, "notas": None, **extra}
+
+@pytest.fixture
+def database(tmp_path):
+    database = SqliteDatabase(str(tmp_path / "edge.sqlite3"))
+    yield database
+    database.close()
+
+def test_readings_are_group_committed_and_range_scanned(database, monkeypatch):
+    readings = SqliteReadingRepository(database)
+    transactions = []
+    original = sqlite_store._insert_readings
+
+    def counting(connection, rows):
+        transactions.append(len(rows))
+        return original(connection, rows)
+    monkeypatch.setattr(sqlite_store, "_insert_readings", counting)
+
+    async def scenario():
+        await asyncio.gather(*(readings.insert(reading(minute)) for minute in (4, 0, 2, 1, 3)))
+        with pytest.raises(DuplicateKeyError):
+            await asyncio.gather(
+                readings.insert(reading(9, dispositivo_id="gw", secuencia=1)),
+                readings.insert(reading(9, dispositivo_id="gw", secuencia=1))
+            )
+        batches = [batch async for batch in readings.iter_range(
+            PLANT, BASE + timedelta(minutes=1), BASE + timedelta(minutes=9), ["ph"], 2
+        )]
+        history = await readings.find_by_plant(PLANT, {"ph": 1, "dispositivo_id": 1})
+        mode = await database.run(lambda connection: connection.execute("PRAGMA journal_mode").fetchone()[0])
+        return batches, history, mode
+
+    batches, history, mode = asyncio.run(scenario())
+    assert transactions == [5, 2]
+    assert [[doc["ph"] for doc in batch] for batch in batches] == [[1.0, 2.0], [3.0, 4.0]]
+    assert set(batches[0][0]) == {"fecha", "ph"}
+    assert [doc["ph"] for doc in history] == [0.0, 1.0, 2.0, 3.0, 4.0, 9.0]
+    assert "dispositivo_id" not in history[0] and history[-1]["dispositivo_id"] == "gw"
+    assert mode == "wal"
+
+def test_plants_and_users_round_trip(database):
+    plants, users = SqlitePlantRepository(database), SqliteUserRepository(database)
+
+    async def scenario():
+        plant_id = await plants.insert({"nombre": "Norte", "creado_en": BASE})
+        await plants.set_last_reading([plant_id], BASE + timedelta(hours=1))
+        updated = await plants.update(plant_id, {"descripcion": "invernadero"})
+        await users.insert({"username": "ana", "hashed_password": "x"})
+        with pytest.raises(DuplicateKeyError):
+            await users.insert({"username": "ana", "hashed_password": "y"})
+        user = await users.find_by_username("ana")
+        listed = await users.list({"hashed_password": 0})
+        return updated, user, listed, await plants.delete(plant_id), await plants.list()
+
+    updated, user, listed, deleted, remaining = asyncio.run(scenario())
+    assert updated["ultima_lectura"] == BASE + timedelta(hours=1)
+    assert updated["descripcion"] == "invernadero"
+    assert user["hashed_password"] == "x"
+    assert "hashed_password" not in listed[0]
+    assert deleted and remaining == []
+
+def test_uploader_sends_gzip_ndjson_and_checkpoints(database):
+    readings = SqliteReadingRepository(database)
+    client = MagicMock()
+    client.post = AsyncMock(side_effect=[
+        MagicMock(json=MagicMock(return_value={"estado": "completada", "rechazadas": 0})),
+        RuntimeError("sin enlace")
+    ])
+    uploader = EdgeUploader(readings, url="http://central", site_id="sur", batch_size=2, client=client)
+
+    async def scenario():
+        await readings.insert(reading(0))
+        await readings.insert(reading(1, dispositivo_id="gw", secuencia=7))
+        await readings.insert(reading(2))
+        sent = await uploader.upload_once()
+        with pytest.raises(RuntimeError):
+            await uploader.upload_once()
+        return sent, await readings.get_checkpoint(uploader.checkpoint_key)
+
+    sent, checkpoint = asyncio.run(scenario())
+    assert (sent, checkpoint) == (2, 2)
+    first_call = client.post.await_args_list[0]
+    assert first_call.kwargs["params"]["carga_id"] == "sur-1-2"
+    assert first_call.kwargs["headers"]["Content-Encoding"] == "gzip"
+    rows = [orjson.loads(line) for line in gzip.decompress(first_call.kwargs["content"]).splitlines()]
+    assert [(row["dispositivo_id"], row["secuencia"]) for row in rows] == [("edge:sur", 1), ("gw", 7)]
+    assert rows[0]["fecha"] == "2024-05-01T00:00:00" and "notas" not in rows[0]
+    assert client.post.await_args_list[1].kwargs["params"]["carga_id"] == "sur-3-3"
+
+def test_gunzip_stream():
+    body = gzip.compress(b'{"ph": 6.5}\n' * 1000)
+
+    async def chunks():
+        for offset in range(0, len(body), 7):
+            yield body[offset:offset + 7]
+
+    async def collect():
+        return b"".join([chunk async for chunk in iter_gunzip(chunks())])
+
+    assert asyncio.run(collect()) == b'{"ph": 6.5}\n' * 1000
+
+def test_gunzip_bounds_chunk_size_and_total():
+    # ~64 MB de ceros caben en unos 64 KB comprimidos
+    bomb = gzip.compress(bytes(64 << 20))
+
+    async def chunks():
+        yield bomb
+
+    async def sizes(max_bytes):
+        return [len(chunk) async for chunk in iter_gunzip(chunks(), max_bytes=max_bytes, chunk_bytes=1 << 20)]
+
+    produced = asyncio.run(sizes(64 << 20))
+    assert max(produced) == 1 << 20 and sum(produced) == 64 << 20
+    with pytest.raises(CargaDemasiadoGrandeError):
+        asyncio.run(sizes(8 << 20))
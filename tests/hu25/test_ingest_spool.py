@@ -0,0 +1,188 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import AutoReconnect
+from main import app
+from actions.api.dependencies import get_current_active_user
+from actions.api.endpoints import sync_router
+from actions.api.services import sync_service as sync_service_module
+from actions.api.services.sync_service import encode_token
+from tests.test_factories import create_user_in_db
+from actions.api.models.models import LecturaCreate
+from actions.api.services.ingest_spool import IngestSpool, SpoolLlenoError
+from actions.api.services.lectura_service import ReadingService
+
+client = TestClient(app)
+PLANT = str(ObjectId())
+
+def documents(start, count):
+    return [{"_id": ObjectId(), "planta_id": PLANT, "fecha": datetime(2024, 6, 1), "ph": float(n)}
+            for n in range(start, start + count)]
+
+def test_appends_share_fsync_and_replay_in_order(tmp_path):
+    spool = IngestSpool(str(tmp_path), segment_bytes=200, replay_batch=3)
+    spool.open()
+    replayed = []
+
+    async def store(batch):
+        replayed.append([doc["ph"] for doc in batch])
+
+    async def scenario():
+        await asyncio.gather(*(spool.append(documents(n, 1)) for n in range(5)))
+        fsyncs = spool.stats["fsyncs"]
+        while await spool.replay_once(store):
+            pass
+        return fsyncs
+
+    assert asyncio.run(scenario()) == 1
+    assert replayed == [[0.0, 1.0, 2.0], [3.0, 4.0]]
+    assert not spool.backlog and spool.pending_bytes == 0
+    # Los segmentos consumidos se borran; el activo queda
+    assert sorted(os.listdir(tmp_path)) == [f"{spool._active:08d}.seg", "cursor"]
+
+def test_recovery_truncates_torn_record_and_resumes_from_cursor(tmp_path):
+    spool = IngestSpool(str(tmp_path), replay_batch=2)
+    spool.open()
+
+    async def write_and_replay_one_batch():
+        await spool.append(documents(0, 4))
+        await spool.replay_once(AsyncMock())
+    asyncio.run(write_and_replay_one_batch())
+    path = spool._path(spool._active)
+    asyncio.run(spool.shutdown())
+    with open(path, "ab") as file:
+        # Registro a medio escribir cuando se cortó la luz
+        file.write(IngestSpool.encode(documents(9, 1)[0])[:-3])
+
+    recovered = IngestSpool(str(tmp_path))
+    recovered.open()
+    assert recovered.pending_records == 2
+    assert recovered.stats["bytes_truncados"] > 0
+    store = AsyncMock()
+
+    async def resume():
+        await recovered.append(documents(4, 1))
+        await recovered.replay_once(store)
+    asyncio.run(resume())
+    assert [doc["ph"] for doc in store.await_args.args[0]] == [2.0, 3.0, 4.0]
+    assert not recovered.backlog
+
+def test_size_limit_rejects_writes(tmp_path):
+    spool = IngestSpool(str(tmp_path), max_bytes=150)
+    spool.open()
+    with pytest.raises(SpoolLlenoError):
+        asyncio.run(spool.append(documents(0, 5)))
+    assert spool.stats["rechazadas"] == 5 and not spool.backlog
+
+def test_service_diverts_while_mongo_is_down_and_replays(tmp_path):
+    service = ReadingService()
+    service.spool = IngestSpool(str(tmp_path))
+    service.spool.open()
+    service.readings = MagicMock()
+    service.readings.insert = AsyncMock(side_effect=AutoReconnect("elección en curso"))
+    service.readings.insert_many_unordered = AsyncMock(side_effect=lambda docs: (docs, 0))
+    # La inserción fallida no llegó a aplicarse
+    service.readings.find_by_id = AsyncMock(return_value=None)
+    service.plants = MagicMock(set_last_reading=AsyncMock())
+    service.summary_service = MagicMock(record_history=AsyncMock())
+    reading = LecturaCreate(planta_id=PLANT, humedad=40.0, temperatura=20.0, ec=1.0, ph=6.0)
+
+    async def scenario():
+        first = await service.create_reading(reading)
+        # Con atraso la siguiente ni siquiera intenta MongoDB
+        batch = await service.create_readings_batch([reading, reading])
+        await service.spool.replay_once(service.store_spooled)
+        return first, batch
+
+    first, batch = asyncio.run(scenario())
+    assert first.id and batch == {"insertadas": 2, "duplicadas": 0, "rechazadas": 0}
+    assert service.readings.insert.await_count == 1
+    replayed = service.readings.insert_many_unordered.await_args.args[0]
+    # Se insertan con `_id` nuevo y conservan el de la aceptación
+    assert str(replayed[0]["id_aceptacion"]) == first.id and len(replayed) == 3
+    assert str(replayed[0]["_id"]) != first.id
+    service.plants.set_last_reading.assert_awaited_once()
+    assert service.spool.stats["desviadas"] == 1 and not service.spool.backlog
+
+def test_replay_completes_updates_for_timed_out_writes_that_landed(tmp_path):
+    service = ReadingService()
+    service.spool = IngestSpool(str(tmp_path))
+    service.spool.open()
+    service.readings = MagicMock()
+    service.readings.insert = AsyncMock(side_effect=asyncio.TimeoutError())
+    # Todo ya está en MongoDB: la inserción incierta llegó a aplicarse
+    service.readings.insert_many_unordered = AsyncMock(side_effect=lambda docs: ([], len(docs)))
+    service.readings.find_by_id = AsyncMock(side_effect=lambda _id, projection: {"_id": _id})
+    service.plants = MagicMock(set_last_reading=AsyncMock())
+    service.summary_service = MagicMock(record_history=AsyncMock())
+    service.column_cache = MagicMock()
+    reading = LecturaCreate(planta_id=PLANT, humedad=40.0, temperatura=20.0, ec=1.0, ph=6.0)
+
+    async def scenario():
+        first = await service.create_reading(reading)
+        # Desviada sin intentarse: si su `_id` existe es una reproducción repetida
+        await service.create_readings_batch([reading])
+        await service.spool.replay_once(service.store_spooled)
+        return first
+
+    first = asyncio.run(scenario())
+    service.readings.find_by_id.assert_awaited_once()
+    applied = service.summary_service.record_history.await_args.args[0]
+    assert [str(doc["_id"]) for doc in applied] == [first.id]
+    assert all("_escritura_incierta" not in doc for doc in service.readings.insert_many_unordered.await_args.args[0])
+    service.plants.set_last_reading.assert_awaited_once()
+    service.column_cache.invalidate_older.assert_called_once_with(PLANT, applied[0]["_id"])
+
+def test_reading_replayed_after_settle_window_reaches_sync(tmp_path, monkeypatch):
+    accepted = datetime.utcnow() - timedelta(minutes=5)
+    inserted = []
+
+    async def insert_many_unordered(docs):
+        inserted.extend(docs)
+        return docs, 0
+
+    async def aggregate(pipeline):
+        bounds = pipeline[0]["$match"]["_id"]
+        for doc in sorted(inserted, key=lambda doc: doc["_id"]):
+            if bounds.get("$gt", ObjectId("0" * 24)) < doc["_id"] < bounds["$lt"]:
+                yield doc
+
+    service = ReadingService()
+    service.spool = IngestSpool(str(tmp_path))
+    service.spool.open()
+    service.readings = MagicMock(insert_many_unordered=AsyncMock(side_effect=insert_many_unordered))
+    service.plants = MagicMock(set_last_reading=AsyncMock())
+    service.summary_service = None
+    service.column_cache = None
+    monkeypatch.setattr(sync_router.sync_service, "readings_collection", MagicMock(aggregate=aggregate))
+    monkeypatch.setattr(sync_service_module, "SYNC_SETTLE_SECONDS", -1)
+    # Aceptada (y confirmada) durante el corte, antes de que el cliente sincronizara
+    document = {"_id": ObjectId.from_datetime(accepted), "planta_id": PLANT, "fecha": accepted, "ph": 6.0,
+                "humedad": 40.0, "temperatura": 20.0, "ec": 1.0}
+    cursor = encode_token(ObjectId.from_datetime(accepted + timedelta(minutes=1)), 0, None)
+
+    async def scenario():
+        await service.spool.append([document])
+        await service.spool.replay_once(service.store_spooled)
+
+    asyncio.run(scenario())
+    app.dependency_overrides[get_current_active_user] = lambda: create_user_in_db()
+    try:
+        response = client.get("/sync/", params={"cursor": cursor})
+    finally:
+        app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    assert [reading["ph"] for reading in response.json()["lecturas"]] == [6.0]
+
+def test_full_spool_maps_to_503():
+    with patch("actions.api.services.lectura_service.ReadingService.create_reading",
+               new_callable=AsyncMock, side_effect=SpoolLlenoError("lleno")):
+        response = client.post("/readings/", json={"planta_id": PLANT, "humedad": 40.0, "temperatura": 20.0,
+                                                   "ec": 1.0, "ph": 6.0})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
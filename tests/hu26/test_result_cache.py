@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from main import app
+from data.db.repositories import build_repositories
+from actions.api.endpoints import lectura_router
+from actions.api.services.ingest_watermark import IngestWatermarks
+from actions.api.services.result_cache import ResultCache
+
+client = TestClient(app)
+PLANT = str(ObjectId())
+
+def counting_compute(body=b"[1]"):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return body
+    return compute, calls
+
+def test_concurrent_identical_requests_share_one_query():
+    marks = IngestWatermarks()
+    cache = ResultCache(watermarks=marks)
+    compute, calls = counting_compute()
+
+    async def scenario():
+        bodies = await asyncio.gather(*(cache.get_or_compute("k", PLANT, None, compute) for _ in range(5)))
+        await cache.get_or_compute("k", PLANT, None, compute)
+        marks.advance(PLANT, datetime.utcnow())
+        await cache.get_or_compute("k", PLANT, None, compute)
+        return bodies
+
+    assert asyncio.run(scenario()) == [b"[1]"] * 5
+    assert len(calls) == 2
+    assert cache.stats["compartidas"] == 4 and cache.stats["invalidadas"] == 1
+
+def test_settled_ranges_survive_live_ingest_but_not_backfill():
+    marks = IngestWatermarks(settle_seconds=300)
+    cache = ResultCache(watermarks=marks)
+    compute, calls = counting_compute()
+    last_week = datetime.utcnow() - timedelta(days=7)
+
+    async def scenario():
+        await cache.get_or_compute("k", PLANT, last_week, compute)
+        marks.advance(PLANT, datetime.utcnow())
+        await cache.get_or_compute("k", PLANT, last_week, compute)
+        marks.advance(PLANT, last_week - timedelta(days=1))
+        await cache.get_or_compute("k", PLANT, last_week, compute)
+        # Borrado: sin fecha, afecta a cualquier rango
+        marks.advance(PLANT)
+        await cache.get_or_compute("k", PLANT, last_week, compute)
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+
+def test_entries_expire_after_ttl_without_local_writes():
+    now = [0.0]
+    cache = ResultCache(watermarks=IngestWatermarks(), ttl=60, clock=lambda: now[0])
+    compute, calls = counting_compute()
+
+    async def scenario():
+        await cache.get_or_compute("k", PLANT, None, compute)
+        now[0] = 59
+        await cache.get_or_compute("k", PLANT, None, compute)
+        # Otro worker pudo escribir sin mover la marca de este proceso
+        now[0] = 60
+        await cache.get_or_compute("k", PLANT, None, compute)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert cache.stats["caducadas"] == 1 and cache.stats["aciertos"] == 1
+
+def test_memory_bound_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=80, watermarks=IngestWatermarks())
+
+    async def scenario():
+        for key in ("a", "b", "c"):
+            await cache.get_or_compute(key, PLANT, None, counting_compute(b"x" * 10)[0])
+        await cache.get_or_compute("a", PLANT, None, counting_compute()[0])
+        await cache.get_or_compute("grande", PLANT, None, counting_compute(b"x" * 11)[0])
+        for key in "defghij":
+            await cache.get_or_compute(key, PLANT, None, counting_compute(b"x" * 10)[0])
+
+    asyncio.run(scenario())
+    assert "grande" not in cache._entries
+    assert list(cache._entries) == ["a", *"defghij"]
+    assert cache.size == 80 and cache.stats["expulsadas"] == 2
+
+@patch("actions.api.services.lectura_service.ReadingService.get_readings_by_plant", new_callable=AsyncMock)
+def test_history_endpoint_caches_serialized_bytes(mock_get_readings, monkeypatch):
+    monkeypatch.setattr(lectura_router, "result_cache", ResultCache(watermarks=IngestWatermarks()))
+    mock_get_readings.return_value = [{"_id": ObjectId(), "planta_id": PLANT, "fecha": datetime(2024, 1, 1, 12), "ph": 6}]
+    params = {"desde": "2024-01-01T00:00:00Z", "hasta": "2024-01-02T00:00:00Z"}
+
+    first = client.get(f"/readings/plant/{PLANT}", params=params)
+    second = client.get(f"/readings/plant/{PLANT}", params=params)
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content and first.json()[0]["ph"] == 6.0
+    mock_get_readings.assert_awaited_once_with(PLANT, datetime(2024, 1, 1), datetime(2024, 1, 2))
+
+    mock_get_readings.return_value = []
+    assert client.get(f"/readings/plant/{PLANT}").status_code == 404
+
+def test_repositories_filter_history_by_range():
+    readings, _, _ = build_repositories("memory")
+    base = datetime(2024, 1, 1)
+
+    async def scenario():
+        for hour in range(5):
+            await readings.insert({"planta_id": PLANT, "fecha": base + timedelta(hours=hour), "ph": float(hour)})
+        return await readings.find_by_plant(PLANT, {"ph": 1}, base + timedelta(hours=1), base + timedelta(hours=3))
+
+    assert [doc["ph"] for doc in asyncio.run(scenario())] == [1.0, 2.0]
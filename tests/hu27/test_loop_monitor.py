@@ -0,0 +1,81 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+from main import app
+from actions.api.dependencies import get_current_admin
+from actions.api.loop_monitor import LoopLagMonitor, PerfilEnCursoError, SamplingProfiler
+
+client = TestClient(app)
+
+def congelar_bucle():
+    time.sleep(0.3)
+
+def test_watchdog_captures_stack_of_blocking_call():
+    monitor = LoopLagMonitor(interval_ms=20, threshold_ms=80)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.1)
+        congelar_bucle()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+    report = monitor.report()
+    assert report["bloqueos_capturados"] == 1 and report["lentas"] >= 1
+    stall = report["bloqueos"][0]
+    assert stall["pila"][-1].endswith("congelar_bucle") and stall["lag_ms"] >= 200
+
+def test_repeated_stall_stack_is_logged_once(caplog):
+    monitor = LoopLagMonitor(log_interval=300)
+    stall = {"tarea": "login", "pila": ["auth_service.py:24 verify_password", "bcrypt.py:1 hashpw"]}
+
+    with caplog.at_level("WARNING", logger="actions.api.loop_monitor"):
+        for _ in range(3):
+            monitor._log_stall(dict(stall), 150.0)
+        monitor._log_stall({**stall, "pila": ["otro.py:1 bloquear"]}, 150.0)
+
+    assert len(caplog.records) == 2
+    assert monitor.stats["bloqueos_repetidos"] == 2
+
+def girar():
+    total = 0
+    for n in range(500000):
+        total += n * n
+    return total
+
+def test_profiler_returns_collapsed_stacks_of_the_loop():
+    profiler = SamplingProfiler()
+
+    async def busy():
+        while True:
+            girar()
+            await asyncio.sleep(0)
+
+    async def scenario():
+        worker = asyncio.create_task(busy())
+        collapsed = await profiler.profile(0.3, 0.002)
+        profiler._busy.acquire()
+        try:
+            await profiler.profile(0.1)
+        except PerfilEnCursoError:
+            rejected = True
+        worker.cancel()
+        return collapsed, rejected
+
+    collapsed, rejected = asyncio.run(scenario())
+    lines = collapsed.splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0 and rejected
+    assert any("girar (" in line.split(";")[-1] for line in lines)
+
+def test_profile_endpoint_is_admin_only():
+    assert client.get("/admin/perfil", params={"segundos": 0.1}).status_code == 401
+    app.dependency_overrides[get_current_admin] = lambda: None
+    try:
+        response = client.get("/admin/perfil", params={"segundos": 0.1, "hilos": "todos"})
+    finally:
+        app.dependency_overrides = {}
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.text.startswith("hilo ")
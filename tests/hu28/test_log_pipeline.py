@@ -0,0 +1,62 @@
+import io
+import logging
+import queue
+import orjson
+from fastapi.testclient import TestClient
+from main import app
+from actions.api.log_pipeline import BoundedQueueHandler, LogPipeline, bind_log_context, log_context, parse_policies
+
+client = TestClient(app)
+
+def record(name="prueba", level=logging.INFO, msg="hola %s", args=("mundo",)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+def test_records_are_written_as_json_by_background_thread():
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    stream = io.StringIO()
+    pipeline = LogPipeline()
+    pipeline.install(stream=stream)
+    token = bind_log_context(peticion="abc123", conexion=7)
+    try:
+        logging.getLogger("prueba.registro").info("Lectura %s", "ok", extra={"planta": "p1"})
+    finally:
+        log_context.reset(token)
+        pipeline.stop()
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+
+    entry = orjson.loads(stream.getvalue().splitlines()[-1])
+    assert entry["mensaje"] == "Lectura ok" and entry["nivel"] == "INFO"
+    assert (entry["peticion"], entry["conexion"], entry["planta"]) == ("abc123", 7, "p1")
+    assert entry["logger"] == "prueba.registro"
+
+def test_full_queue_drops_and_counts_without_blocking():
+    handler = BoundedQueueHandler(queue.Queue(maxsize=2), {})
+    original = record()
+    for _ in range(5):
+        handler.handle(original)
+    assert handler.stats == {"encolados": 2, "descartados": 3, "muestreados": 0, "limitados": 0}
+    # El registro original no se modifica (otros handlers lo comparten)
+    assert original.args == ("mundo",) and handler.queue.get_nowait().getMessage() == "hola mundo"
+
+def test_sampling_and_rate_limit_per_logger():
+    policies = parse_policies("ruidoso=0/,limitado=1/2")
+    assert policies == {"ruidoso": (0.0, None), "limitado": (1.0, 2.0)}
+    handler = BoundedQueueHandler(queue.Queue(), policies)
+    handler.handle(record("ruidoso.hijo"))
+    handler.handle(record("ruidoso.hijo", logging.WARNING))
+    for _ in range(5):
+        handler.handle(record("limitado", logging.ERROR))
+    assert handler.stats["muestreados"] == 1 and handler.stats["limitados"] == 3
+    assert handler.queue.qsize() == 3
+
+def test_rate_below_one_per_second_still_admits_records():
+    handler = BoundedQueueHandler(queue.Queue(), parse_policies("lento=1/0.5"))
+    for _ in range(3):
+        handler.handle(record("lento"))
+    assert handler.queue.qsize() == 1 and handler.stats["limitados"] == 2
+
+def test_request_id_is_propagated_and_returned():
+    assert client.get("/", headers={"X-Request-ID": "gw-42"}).headers["x-request-id"] == "gw-42"
+    assert len(client.get("/").headers["x-request-id"]) == 16
@@ -0,0 +1,125 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from main import app
+from actions.api.endpoints import planta_router
+from actions.api.endpoints.planta_router import auth_service
+from tests.test_factories import create_user_in_db
+from data.db.repositories import build_repositories
+from actions.api.services.liveness_service import LivenessTracker
+from actions.api.services.timing_wheel import TimingWheel
+
+client = TestClient(app)
+PLANT = str(ObjectId())
+START = datetime(2024, 1, 1)
+
+
+class FakeClock:
+    def __init__(self, start: datetime = START):
+        self.now = start.replace(tzinfo=timezone.utc).timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+def events(mock_broadcast):
+    return [(call.args[0]["type"], call.args[0]["data"]["planta_id"]) for call in mock_broadcast.await_args_list]
+
+def test_wheel_expires_each_key_exactly_at_its_tick():
+    rng = random.Random(7)
+    wheel = TimingWheel(now=rng.randrange(1 << 20))
+    expected = {}
+    for key in range(2000):
+        expected[key] = wheel.now + rng.choice([1, 63, 64, 65, 4095, 4096, rng.randrange(1, 300000)])
+        wheel.schedule(key, expected[key])
+    # Reprogramar y cancelar no dejan copias en la ranura anterior
+    for key in range(0, 2000, 3):
+        expected[key] += rng.randrange(1, 5000)
+        wheel.schedule(key, expected[key])
+    for key in range(1, 2000, 7):
+        wheel.cancel(key)
+        del expected[key]
+
+    fired = {}
+    while len(wheel):
+        for key in wheel.tick():
+            fired[key] = wheel.now
+    assert fired == expected
+
+def test_wheel_clamps_past_and_beyond_horizon():
+    wheel = TimingWheel(now=100, levels=2)
+    wheel.schedule("pasado", 50)
+    wheel.schedule("lejano", 100 + 10 ** 6)
+    assert wheel.tick() == ["pasado"]
+    assert wheel.deadline("lejano") == 100 + wheel.horizon
+
+@patch("actions.api.services.socket_manager.SocketManager.broadcast_to_group", new_callable=AsyncMock)
+def test_silent_and_recovered_events(mock_broadcast):
+    clock = FakeClock()
+    tracker = LivenessTracker(default_interval=60, missed_readings=3, group="sensores", clock=clock)
+    other = str(ObjectId())
+
+    async def scenario():
+        tracker.record(PLANT, START)
+        tracker.record(other, START)
+        tracker.set_interval(other, 600)
+        clock.now += 179
+        assert tracker.expire() == 0
+        clock.now += 1
+        assert tracker.expire() == 1
+        # Una lectura atrasada no recupera el sensor
+        tracker.record(PLANT, START)
+        tracker.record(PLANT, START + timedelta(seconds=200))
+        clock.now += 1800
+        tracker.expire()
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert events(mock_broadcast) == [
+        ("sensor_silent", PLANT), ("sensor_recovered", PLANT), ("sensor_silent", PLANT), ("sensor_silent", other)
+    ]
+    assert {call.args[1] for call in mock_broadcast.await_args_list} == {"sensores"}
+    assert [entry["planta_id"] for entry in tracker.silent()] == [PLANT, other]
+
+@patch("actions.api.services.socket_manager.SocketManager.broadcast_to_group", new_callable=AsyncMock)
+def test_rebuild_from_plants_and_notify_only_recent_silences(mock_broadcast):
+    _, plants, _ = build_repositories("memory")
+    clock = FakeClock(START + timedelta(days=2))
+    tracker = LivenessTracker(default_interval=60, missed_readings=3, clock=clock)
+    tracker.plants = plants
+    now = START + timedelta(days=2)
+
+    async def scenario():
+        alive = await plants.insert({"nombre": "a", "ultima_lectura": now - timedelta(seconds=10), "intervalo_lecturas": 10})
+        recent = await plants.insert({"nombre": "b", "ultima_lectura": now - timedelta(minutes=10)})
+        old = await plants.insert({"nombre": "c", "ultima_lectura": now - timedelta(days=1)})
+        await plants.insert({"nombre": "d"})
+        await tracker.rebuild()
+        await asyncio.sleep(0)
+        return str(alive), str(recent), str(old)
+
+    alive, recent, old = asyncio.run(scenario())
+    assert events(mock_broadcast) == [("sensor_silent", recent)]
+    assert {entry["planta_id"] for entry in tracker.silent()} == {recent, old}
+    assert alive in tracker.wheel and tracker.interval(alive) == 10
+    clock.now += 20
+    assert tracker.expire() == 1 and alive in {entry["planta_id"] for entry in tracker.silent()}
+
+def test_silent_plants_endpoint(monkeypatch):
+    tracker = LivenessTracker(default_interval=60, clock=FakeClock(START + timedelta(hours=1)))
+    tracker.record(PLANT, START)
+    tracker.clock.now += 1
+    tracker.expire()
+    monkeypatch.setattr(planta_router, "liveness_tracker", tracker)
+    app.dependency_overrides[auth_service.get_current_user] = lambda: create_user_in_db("agricultores")
+    response = client.get("/plants/sin-senal")
+    app.dependency_overrides = {}
+
+    assert response.status_code == 200
+    assert response.json() == [{
+        "planta_id": PLANT, "ultima_lectura": "2024-01-01T00:00:00",
+        "sin_senal_desde": "2024-01-01T00:03:00", "intervalo_lecturas": 60
+    }]
@@ -1,5 +1,5 @@
 from datetime import datetime
-from actions.api.models.models import LecturaOut
+from actions.api.models.models import LecturaOut, UserInDB
 
 def create_lectura_out(payload, lectura_id="syncid123"):
     return LecturaOut(
@@ -14,4 +14,10 @@ def create_lectura_out(payload, lectura_id="syncid123"):
         potasio=payload["potasio"],
         fecha=datetime.fromisoformat(payload["fecha"].replace("Z", "+00:00")),
         notas=payload["notas"]
+    )
+
+def create_user_in_db(role="agricultores", user_id="u1"):
+    return UserInDB(
+        id=user_id, username="ana", nombre="Ana", apellido="Lopez",
+        creado_en=datetime.utcnow(), role=role, hashed_password="fakehashed"
     )
\ No newline at end of file